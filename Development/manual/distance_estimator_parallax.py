@@ -1,10 +1,11 @@
 import xarray as xr
 import glob
 import matplotlib.pyplot as plt
-from functools import partial
-import pyproj
-from shapely.ops import transform
-from shapely.geometry import Point
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'StandAloneTools'))
+from distance_rings import geodesic_ring
 from GOES import GOES
 
 # Set Paramers to read in satelite data regridded into lat lon
@@ -116,14 +117,8 @@ cld1.plot(col="t",col_wrap=3)
 
 # Fuction to plot 1km rings from
 def geodesic_point_buffer(lat, lon, km):
-    # Azimuthal equidistant projection
-    aeqd_proj = '+proj=aeqd +lat_0={lat} +lon_0={lon} +x_0=0 +y_0=0'
-    project = partial(
-        pyproj.transform,
-        pyproj.Proj(aeqd_proj.format(lat=lat, lon=lon)),
-        proj_wgs84)
-    buf = Point(0, 0).buffer(km * 1000)  # distance in metres
-    return transform(project, buf).exterior.coords.xy
+    # Azimuthal equidistant projection, one transformer per camera site
+    return geodesic_ring(lat, lon, km)
 
 # Plot data, camera and distance rings
 
@@ -143,7 +138,6 @@ def plotring(data, ax, camlat, camlon, title):
 
 fig, axs = plt.subplots(3, 2, figsize=(10, 40))
 axes_list = [(0, 0), (0, 1), (1, 0), (1, 1), (2, 0)]
-proj_wgs84 = pyproj.Proj('+proj=longlat +datum=WGS84')
 for i in range(5):
     plotring(data[i][index[i]], axs[axes_list[i]],
              camlat[i], camlon[i], dates[i])
@@ -2,18 +2,91 @@ import xarray as xr
 import os
 import math
 import glob
-from matplotlib.path import Path
-import pandas as pd
 from datetime import datetime
-import matplotlib.pyplot as plt
 import numpy as np
 import sys
-from scipy.interpolate import griddata
-import pyproj
-import haversine as hs
-from functools import partial
-from shapely.ops import transform
-from shapely.geometry import Point
+from collections import OrderedDict
+from fov_masks import FOVMaskIndex, max_in_indices
+from fov_cube import OPTICAL_DEPTH_THRESHOLD, fov_max_cube
+from fov_sectors import fov_sector, fov_sectors
+from flag16_interp import Flag16Interpolator
+from orography import load_orography
+from distance_rings import geodesic_ring, geodesic_rings
+from camera_details import camera_details
+
+class GOESDataCache:
+    """
+    A bounded least recently used cache of the GOES cloud optical depth
+    (ABI-L2-CODC) data for each hour of a day, subset to a lat/lon box and
+    held in memory.
+
+    Every photo taken in the same hour selects its nearest scan from the
+    same cached dataset, so each satellite file is opened once per day rather
+    than once per photo.
+
+    Attributes:
+    ----------
+    maxsize: int
+        Number of hours to keep in memory (default: 6).
+    files_opened: int
+        Number of satellite files opened so far.
+    hits: int
+        Number of requests served from the cache.
+    """
+    file_root = "/gws/nopw/j04/dcmex/data/GOES16pcrgd/Magda/"
+    channel1 = "ABI-L2-CODC/"
+    fname_root = "/OR_ABI-L2-CODC-M6_G16*_select_pcrgd.nc"
+
+    def __init__(self, maxsize=6):
+        """
+        Initialize an empty cache holding up to maxsize hours.
+        """
+        self.maxsize = maxsize
+        self.files_opened = 0
+        self.hits = 0
+        self._datasets = OrderedDict()
+
+    def get(self, date_to_use, hour, lon1, lon2, lat1, lat2):
+        """
+        Return the satellite data for an hour of a day inside the lat/lon box.
+
+        Parameters:
+        - date_to_use (str): Date string 'yyyy-mm-dd'.
+        - hour (str): Two digit hour 'HH'.
+        - lon1, lon2, lat1, lat2 (float): Lat/lon box to subset to.
+
+        Returns:
+        - xr.Dataset: The hour's scans concatenated along t.
+        """
+        key = (date_to_use, hour, lon1, lon2, lat1, lat2)
+        if key in self._datasets:
+            self.hits += 1
+            self._datasets.move_to_end(key)
+            return self._datasets[key]
+        date_path = date_to_use.replace('-', '/', 3)
+        fnames = sorted(glob.glob(self.file_root + self.channel1 + date_path +
+                                  '/' + hour + self.fname_root))
+        full = xr.open_mfdataset(fnames, combine="nested", concat_dim="t")
+        rad = full.sel(lon=slice(lon1, lon2), lat=slice(lat1, lat2)).load()
+        full.close()
+        self.files_opened += len(fnames)
+        self._datasets[key] = rad
+        if len(self._datasets) > self.maxsize:
+            self._datasets.popitem(last=False)
+        return rad
+
+    def clear(self):
+        """
+        Empty the cache.
+        """
+        self._datasets.clear()
+
+
+# Shared by every processor in this process
+GOES_CACHE = GOESDataCache()
+FOV_MASKS = FOVMaskIndex()
+FLAG16_INTERP = Flag16Interpolator()
+
 
 class CloudOpticalDepthProcessor:
     """
@@ -34,8 +107,12 @@ class CloudOpticalDepthProcessor:
         Error margin for the YAW parameter (default: 10).
     optical_depth_threshold: float
         Threshold for optical depth (default: 3.6).
-    cam_df: pd.DataFrame
-        DataFrame with camera details.
+    cam_details_path: str
+        Camera details file (read once per process, see camera_details.py).
+    goes_cache: GOESDataCache
+        Cache of the satellite data (default: the module level GOES_CACHE).
+    fov_masks: FOVMaskIndex
+        Cache of the grid cells inside the FOV (default: the module level FOV_MASKS).
 
     Methods:
     -------
@@ -49,26 +126,31 @@ class CloudOpticalDepthProcessor:
         Calculate the Field of View (FOV) area for the camera.
     plot_fov():
         Plot a ring around the camera’s FOV and highlight cloud information.
+    find_cloud():
+        Find the max optical depth in the FOV without plotting.
     process_file():
         Process the satellite file and generate the FOV plot.
+    find_distance():
+        Process the satellite file without plotting.
     """
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, goes_cache=None, fov_masks=None):
         """
         Initialize CloudOpticalDepthProcessor with input arguments.
         """
         self.file_name = file_name
+        self.goes_cache = GOES_CACHE if goes_cache is None else goes_cache
+        self.fov_masks = FOV_MASKS if fov_masks is None else fov_masks
         self.storage = '/gws/nopw/j04/dcmex/users/hburns/'
         self.dataroot = '/gws/nopw/j04/dcmex/data'
         self.yaw_error = 10
-        self.optical_depth_threshold = 3.6
+        self.optical_depth_threshold = OPTICAL_DEPTH_THRESHOLD
         self.cam_details_path = f'{self.storage}/camera_details.csv'
-        self.cam_df = pd.read_csv(self.cam_details_path)
         self.lat1 = 33.75
         self.lat2 = 34.25
         self.lon1 = -107.5
         self.lon2 = -106.8
-        self.date_fnames,self.date_to_use, self.time_to_use,self.camera = self.extract_file_metadata()
+        _, self.date_to_use, self.time_to_use, self.camera = self.extract_file_metadata()
         self.imgroot = str(self.storage + "images2/FOV_on_optical_depth/" +
                            self.date_to_use+'/camera/')
         sensor_height_mm = 24.0
@@ -102,24 +184,18 @@ class CloudOpticalDepthProcessor:
         """
         Load camera details for the specific date and camera number.
         """
-        filtered_df = self.cam_df[(self.cam_df['Date'] == self.date_fnames) & (self.cam_df['camera'] == int(self.camera))]
-        yaw_degrees = filtered_df.yaw.values[0]
-        camlat = filtered_df.camlat.values[0]
-        camlon = filtered_df.camlon.values[0]
-        return yaw_degrees, camlat, camlon
+        details = camera_details(self.camera, self.date_to_use,
+                                 csv_file=self.cam_details_path)
+        return details.yaw, details.camlat, details.camlon
 
     def calculate_fov(self, camlat, camlon, yaw_degrees, fov_horz = None):
         """
-        Calculate the coordinates of the Field of View (FOV) area on the map.
+        Calculate the coordinates of the Field of View (FOV) area on the map
+        (see fov_sectors.py).
         """
-        fov_radius = 0.35  
-        fov_start = yaw_degrees - fov_horz / 2
-        fov_end = yaw_degrees + fov_horz / 2
-        fov_x = [camlon] + [camlon + fov_radius * np.sin(a) for a in np.linspace(np.radians(fov_start), np.radians(fov_end), 100)]
-        fov_y = [camlat] + [camlat + fov_radius * np.cos(a) for a in np.linspace(np.radians(fov_start), np.radians(fov_end), 100)]
-        return fov_x, fov_y
-
-    def find_max_in_fov(self, data, fov_x, fov_y):
+        return fov_sector(camlat, camlon, yaw_degrees, fov_horz)
+
+    def find_max_in_fov(self, data, fov_x, fov_y, fov_key=None):
         """
         Find the maximum value and corresponding location within a specified field of view (FOV) on a gridded dataset.
 
@@ -127,6 +203,8 @@ class CloudOpticalDepthProcessor:
         - data (numpy.ndarray): The 2D array of values representing the dataset, e.g., temperature, humidity.
         - fov_x (list): List of x-coordinates defining the FOV polygon.
         - fov_y (list): List of y-coordinates defining the FOV polygon.
+        - fov_key (tuple): (camlat, camlon, yaw, fov width) the polygon was made from, used to look up
+          the grid cells inside the FOV (default: the polygon coordinates).
 
         Returns:
         - maxlat (int): Index of the latitude with the maximum value within the FOV.
@@ -134,8 +212,8 @@ class CloudOpticalDepthProcessor:
 
         Note:
         - The function uses a given FOV defined by its x and y coordinates to identify the grid points within the FOV.
+        - The grid points within the FOV are cached in self.fov_masks and reused for the same FOV and grid.
         - The maximum value and its corresponding location within the FOV are then determined.
-        - The input data array is masked, setting values outside the FOV to NaN.
 
         Usage Example:
         ```python
@@ -146,63 +224,71 @@ class CloudOpticalDepthProcessor:
 
         Replace 'temperature_data' with the actual 2D array representing your dataset.
         """
-        # Define a grid of latitude and longitude within the FOV area
         lons = data.coords['lon'].values
         lats = data.coords['lat'].values
-        # Define a grid of latitude and longitude within the FOV area
-        polygon_points = list(zip(fov_x, fov_y))
-        polygon_path = Path(polygon_points)
-        x_grid, y_grid = np.meshgrid(lons, lats)
-
-        # Flatten the grid arrays to 1D arrays
-        x_flat = x_grid.flatten()
-        y_flat = y_grid.flatten()
-
-        # Create an array of (x, y) points
-        points = np.column_stack((x_flat, y_flat))
-
-        # Check if each point is within the polygon
-        mask = polygon_path.contains_points(points)
-
-        # Reshape the mask back to 2D
-        mask = mask.reshape(x_grid.shape)
-
-        # Apply the mask to your original array
-        # Replace original_array with your actual array that you want to mask
-        masked_array = data.values.copy()
-        masked_array[~mask] = np.nan  # Set values outside the polygon to NaN
-        maxlat, maxlon = np.unravel_index(
-            np.nanargmax(masked_array), masked_array.shape)
+        if fov_key is None:
+            fov_key = tuple(fov_x) + tuple(fov_y)
+        # Grid cells inside the FOV are only worked out once per FOV and grid
+        indices = self.fov_masks.flat_indices(lons, lats, fov_x, fov_y, fov_key)
+        maxlat, maxlon = max_in_indices(data.values, indices)
 
         return maxlat, maxlon
 
     def interp_flag16(self, ds):
         """
         Perform interpolation for flagged data.
+
+        The interpolation weights for each flag pattern are cached in
+        FLAG16_INTERP (see flag16_interp.py) as the grid never changes.
         """
         var1 = ds['var1'].copy()
-        flag = ds['flag']
-        mask = flag == 16
-        lon, lat = np.meshgrid(ds['lon'].values, ds['lat'].values)
-        points = np.array([lon[~mask], lat[~mask]]).T
-        values = var1.values[~mask]
-        points_interp = np.array([lon[mask], lat[mask]]).T
-        var1_filled = griddata(points, values, points_interp, method='linear')
+        mask = (ds['flag'] == 16).values
         ds['var1_filled'] = var1.copy()
-        ds['var1_filled'].values[mask] = var1_filled
+        ds['var1_filled'].values[...] = FLAG16_INTERP.fill(
+            var1.values, ds['lon'].values, ds['lat'].values, mask)
         return ds
 
+    def find_cloud(self, data):
+        """
+        Find the maximum optical depth in the camera's field of view (FOV) without plotting.
+
+        Optical depths below self.optical_depth_threshold (cirrus not cumulus) are not counted,
+        the same search as find_clouds in optical_depth_plotter.py (see fov_cube.py).
+
+        Parameters:
+        - data (xr.DataArray): 2D array of values representing the dataset.
+
+        Returns:
+        - D (float or str): Haversine distance between the camera and the maximum optical depth point,
+          'no cloud' if there is no cloud in the FOV or 'none' if there is no cloud in the area.
+        - maxlat_2 (int or str): Index of the latitude with the maximum optical depth within the FOV, or 'none'.
+        - maxlon_2 (int or str): Index of the longitude with the maximum optical depth within the FOV, or 'none'.
+        - status (str): 'cloud', 'no cloud in area' or 'no cloud in FOV'.
+        """
+        yaw_degrees, camlat, camlon = self.load_camera_details()
+        if np.all(np.isnan(data.values)):
+            print('no cloud in area')
+            return 'none', 'none', 'none', 'no cloud in area'
+        print('cloud found')
+        # Yaw is plus minus the YAW error
+        fov_xp5, fov_yp5 = self.calculate_fov(camlat, camlon, yaw_degrees,self.fov_horizontal_deg + 2*self.yaw_error)
+        fov_key = (camlat, camlon, yaw_degrees,
+                   self.fov_horizontal_deg + 2*self.yaw_error)
+        indices = self.fov_masks.flat_indices(
+            data.coords['lon'].values, data.coords['lat'].values,
+            fov_xp5, fov_yp5, fov_key)
+        found = fov_max_cube(data.expand_dims('t'), indices, camlat, camlon,
+                             self.optical_depth_threshold)
+        if found.status[0] != 'cloud':
+            print('no cloud in FOV')
+            return 'no cloud', 'none', 'none', 'no cloud in FOV'
+        return (float(found.distance[0]), found.maxlat[0], found.maxlon[0],
+                'cloud')
+
     # Fuction to plot 1km rings from
     def geodesic_point_buffer(self, lat, lon, km):
-        # Azimuthal equidistant projection
-        proj_wgs84 = pyproj.Proj('+proj=longlat +datum=WGS84')
-        aeqd_proj = '+proj=aeqd +lat_0={lat} +lon_0={lon} +x_0=0 +y_0=0'
-        project = partial(
-            pyproj.transform,
-            pyproj.Proj(aeqd_proj.format(lat=lat, lon=lon)),
-            proj_wgs84)
-        buf = Point(0, 0).buffer(km * 1000)  # distance in metres
-        return transform(project, buf).exterior.coords.xy
+        # Azimuthal equidistant projection (see distance_rings.py)
+        return geodesic_ring(lat, lon, km)
 
     def plotring(self, data,title, show='show'):
         """
@@ -215,6 +301,8 @@ class CloudOpticalDepthProcessor:
         - camlon (float): Longitude of the camera's position.
         - yaw (float): Yaw angle of the camera in degrees.
         - title (str): Title for the plot.
+        - show (str): 'show' to show the plot, 'save' to save it to self.imgroot or 'array' to return it as
+          an RGB array without saving it.
 
         Returns:
         - D (float or str): Haversine distance between the camera and the maximum optical depth point, or 'no cloud' if no cloud is found.
@@ -223,9 +311,13 @@ class CloudOpticalDepthProcessor:
 
         Note:
         - The function visualizes the FOV, FOV error, and cloud-related information on a plot.
-        - It uses a threshold value of 3.6 for cloud detection.
+        - The cloud is found with find_cloud, which can be used on its own when no plot is wanted.
+        - It uses a threshold value of 3.6 for the plotted optical depth.
         - The FOV is discretized into 100 points for smoother visualization.
         - The function returns information about the maximum optical depth point within the FOV.
+        - Nothing is plotted and None is returned if there is no cloud in the area.
+        - With show='array' the (rows, columns, 3) uint8 image of the plot is returned instead of D, maxlat_2
+          and maxlon_2.
 
         Usage Example:
         ```python
@@ -238,6 +330,11 @@ class CloudOpticalDepthProcessor:
         """
         # Load camera details
         yaw_degrees, camlat, camlon = self.load_camera_details()
+        D, maxlat_2, maxlon_2, status = self.find_cloud(data)
+        if status == 'no cloud in area':
+            return
+        # Only imported when plots are drawn
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots(figsize=(20, 20))
         
         mask = data >= 3.6
@@ -245,10 +342,8 @@ class CloudOpticalDepthProcessor:
         masked_data.plot.pcolormesh(x="lon", y="lat", ax=ax, levels=[
                                     3.6, 9.4, 23, 60, 100],
                                     cbar_kwargs={'label': 'optical depth'})
-        # Orography file
-        orog_file = '/gws/nopw/j04/dcmex/users/dfinney/data/globe_orog_data_NM.nc'
-        orog = xr.open_dataset(orog_file)['topo'].sel(
-            X=slice(self.lon1, self.lon2), Y=slice(self.lat1, self.lat2))
+        # Orography and its contours (only read once per process)
+        orog = load_orography(self.lon1, self.lon2, self.lat1, self.lat2)
         southbaldy = [33.99, -107.19]
         MRO = [33.98481699, -107.18926709]
         CB = [34.0248532, -106.9267249]
@@ -260,44 +355,25 @@ class CloudOpticalDepthProcessor:
         else:   
             distance = [8, 9, 10, 11, 12,   13,  14,
                         15,  16,  17,  18, 19, 20, 21, 23, 24]
-        day1 = data.values
         lons = data.coords['lon'].values
         lats = data.coords['lat'].values
-        fov_x, fov_y = self.calculate_fov(camlat, camlon, yaw_degrees,self.fov_horizontal_deg)
-        # Yaw is plus minus the YAW error
-        fov_xp5, fov_yp5 = self.calculate_fov(camlat, camlon, yaw_degrees,self.fov_horizontal_deg + 2*self.yaw_error)
-
-        try:
-            test = np.unravel_index(np.nanargmax(day1), day1.shape)
-            if test:
-                print('cloud found')
-        except:
-            print('no cloud in area')
-            D = 'no cloud'
-            maxlat_2 = 'none'
-            maxlon_2 = 'none'
-            return 
+        # The FOV and the FOV with yaw plus minus the YAW error
+        (fov_x, fov_xp5), (fov_y, fov_yp5) = fov_sectors(
+            camlat, camlon, yaw_degrees,
+            [self.fov_horizontal_deg, self.fov_horizontal_deg + 2*self.yaw_error])
 
-        orog.plot.contour(x="X", y="Y", colors='k', ax=ax,
-                        levels=[2400, 2500, 2800, 3300])
+        orog.plot_contours(ax, colors='k')
         ax.fill(fov_x, fov_y, color='silver', alpha=0.3, label='Field of View')
         ax.fill(fov_xp5, fov_yp5, color='silver',
                 alpha=0.2, label='_nolegend_')
 
-        try:
-            maxlat_2, maxlon_2 = self.find_max_in_fov(data, fov_xp5, fov_yp5)
+        if status == 'cloud':
             ax.scatter(lons[maxlon_2], lats[maxlat_2], marker='x',
                     color='r', s=400, label='Max optical depth')
-            D = hs.haversine((lats[maxlat_2], lons[maxlon_2]), (camlat, camlon))
-
-        except:
-            print('no cloud in FOV')
-            D = 'no cloud'
-            maxlat_2 = 'none'
-            maxlon_2 = 'none'
         if show == 'show':
-            for d, c in zip(distance, clourlist):
-                x, y = self.geodesic_point_buffer(camlat, camlon, d)
+            # All the rings in one go (memoised for the camera position)
+            rings = geodesic_rings(camlat, camlon, distance)
+            for (x, y), c in zip(rings, clourlist):
                 ax.plot(x, y, color=c)
         
 
@@ -335,27 +411,43 @@ class CloudOpticalDepthProcessor:
         plt.subplots_adjust(top=0.85)
         if show == 'show':
            plt.show()
+        elif show == 'array':
+            fig.canvas.draw()
+            image = np.asarray(fig.canvas.buffer_rgba())[:, :, :3].copy()
+            plt.close(fig)
+            return image
         else:
             plt.savefig(f'{self.imgroot}/{self.camera}/{self.date_to_use}_{self.time_to_use}.png')
             plt.close('all')
         return D, maxlat_2, maxlon_2
 
+    def load_data(self):
+        """
+        Load the optical depth scan nearest the photo time.
+        """
+        # Load satellite data (cached for the hour)
+        rad = self.goes_cache.get(self.date_to_use, self.time_to_use[0:2],
+                                  self.lon1, self.lon2, self.lat1, self.lat2)
+        datetimephoto = datetime.strptime(self.date_to_use+self.time_to_use, "%Y-%m-%d%H%M")
+        rad = rad.sel(t=datetimephoto, method='nearest')
+        return self.interp_flag16(rad)
+
+    def find_distance(self):
+        """
+        Process the optical depth satellite data file without plotting (matplotlib.pyplot is not imported).
+
+        Returns:
+        - D, maxlat_2, maxlon_2, status as returned by find_cloud.
+        """
+        rad = self.load_data()
+        return self.find_cloud(rad['var1'])
+
     def process_file(self,show='show'):
         """
         Process the optical depth satellite data file and generate FOV plots.
         """
         showvar = show
-        file_root = "/gws/nopw/j04/dcmex/data/GOES16pcrgd/Magda/"
-        channel1 = "ABI-L2-CODC/"
-        fname_root = "/OR_ABI-L2-CODC-M6_G16*_select_pcrgd.nc" 
-        # Load satellite data
-        date_path = self.date_to_use.replace('-', '/', 3)
-        rad = xr.open_mfdataset(glob.glob(file_root + channel1 + date_path + '/'+self.time_to_use[0:2]+fname_root),combine="nested", 
-                                 concat_dim="t").sel(lon=slice(self.lon1, self.lon2),
-                                                                       lat=slice(self.lat1, self.lat2))
-        datetimephoto = datetime.strptime(self.date_to_use+self.time_to_use, "%Y-%m-%d%H%M")
-        rad = rad.sel(t=datetimephoto, method='nearest')
-        rad = self.interp_flag16(rad)
+        rad = self.load_data()
         # Plot FOV and optical depth data
         try:
             D, maxlat_2, maxlon_2 = self.plotring(rad['var1'], f"Optical Depth Plot for {self.date_to_use}", show=showvar)
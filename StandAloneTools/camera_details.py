@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Registry of the camera details (yaw, pitch, position and height) in
+camera_details.csv.
+
+The csv file is read and parsed once per process (camera_registry is
+memoised by file) and the rows are kept in a dict keyed by (date, camera),
+so looking up the details of a camera for a day is a dict lookup rather than
+reading the file and filtering it on the 'dd-mm-yyyy' Date strings again.
+
+Days without a row can optionally be filled in:
+
+- 'previous': the last row on or before the day, i.e. each row stays valid
+  until the next one for the camera,
+- 'nearest': the closest row in time (the earlier one on ties),
+- 'interpolate': linear interpolation between the rows either side (yaw
+  round the shortest way), the nearest row outside the dates in the file.
+
+max_days limits how far from the day a row can be used.
+
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Camera details file
+CAMERA_DETAILS_FILE = '/home/users/hburns/GWS/DCMEX/users/hburns/camera_details.csv'
+FALLBACKS = ('exact', 'previous', 'nearest', 'interpolate')
+
+CameraDetails = namedtuple('CameraDetails', ['yaw', 'pitch', 'camlat',
+                                             'camlon', 'height'])
+CameraDetails.__doc__ = """
+Details of a camera on a day.
+
+Attributes:
+    yaw (float): Yaw of the camera in degrees.
+    pitch (float): Pitch of the camera in degrees.
+    camlat (float): Latitude of the camera.
+    camlon (float): Longitude of the camera.
+    height (float): Height of the camera in metres.
+"""
+
+
+class CameraRegistry:
+    """
+    The rows of camera_details.csv keyed by (date, camera).
+
+    Attributes:
+        csv_file (str): The camera details file.
+    """
+
+    def __init__(self, csv_file=CAMERA_DETAILS_FILE):
+        """
+        Read and parse the camera details file.
+        """
+        self.csv_file = csv_file
+        cam_df = pd.read_csv(csv_file)
+        cam_df['Date'] = pd.to_datetime(cam_df['Date'], format='%d-%m-%Y')
+        # The first row for a day and camera is used
+        cam_df = cam_df.drop_duplicates(['Date', 'camera'], keep='first')
+        cam_df = cam_df.sort_values(['camera', 'Date'], kind='stable')
+        self._details = {}
+        self._dates = {}
+        for camera, rows in cam_df.groupby('camera'):
+            self._dates[int(camera)] = rows['Date'].to_numpy()
+            for row in rows.itertuples(index=False):
+                self._details[(row.Date, int(camera))] = CameraDetails(
+                    row.yaw, row.pitch, row.camlat, row.camlon, row.height)
+
+    def __len__(self):
+        return len(self._details)
+
+    def get(self, camera, date_to_use, fallback='exact', max_days=None):
+        """
+        Details of a camera on a day.
+
+        Parameters:
+        - camera (int): Camera number 1 or 2.
+        - date_to_use (str): Date string 'yyyy-mm-dd'.
+        - fallback (str): For days without a row, 'exact' (no fallback),
+          'previous', 'nearest' or 'interpolate'.
+        - max_days (float): Furthest a row can be from the day, in days
+          (None for no limit).
+
+        Returns:
+        - CameraDetails: The yaw, pitch, position and height.
+
+        Raises:
+        - KeyError: If there are no details for the camera and day.
+        """
+        if fallback not in FALLBACKS:
+            raise ValueError('fallback must be one of ' + ', '.join(FALLBACKS))
+        camera = int(camera)
+        day = pd.Timestamp(date_to_use)
+        details = self._details.get((day, camera))
+        if details is not None or fallback == 'exact':
+            if details is None:
+                raise KeyError(f'no camera details for camera {camera} on '
+                               f'{date_to_use}')
+            return details
+        dates = self._dates.get(camera, np.array([], dtype='datetime64[ns]'))
+        after = int(np.searchsorted(dates, day.to_datetime64()))
+        before = after - 1
+        candidates = [i for i in (before, after) if 0 <= i < len(dates)]
+        if fallback == 'previous':
+            candidates = [i for i in candidates if i == before]
+        if max_days is not None:
+            limit = pd.Timedelta(days=max_days)
+            candidates = [i for i in candidates
+                          if abs(pd.Timestamp(dates[i]) - day) <= limit]
+        if not candidates:
+            raise KeyError(f'no camera details for camera {camera} near '
+                           f'{date_to_use}')
+        rows = [self._details[(pd.Timestamp(dates[i]), camera)]
+                for i in candidates]
+        if fallback == 'interpolate' and len(rows) == 2:
+            weight = ((day - pd.Timestamp(dates[before])) /
+                      (pd.Timestamp(dates[after]) - pd.Timestamp(dates[before])))
+            values = [first + weight * (second - first)
+                      for first, second in zip(rows[0], rows[1])]
+            # Yaw the shortest way round
+            turn = (rows[1].yaw - rows[0].yaw + 180) % 360 - 180
+            values[0] = (rows[0].yaw + weight * turn) % 360
+            return CameraDetails(*values)
+        # Nearest (the earlier on ties) of the rows left
+        return min(zip(candidates, rows), key=lambda candidate: abs(
+            pd.Timestamp(dates[candidate[0]]) - day))[1]
+
+
+@lru_cache(maxsize=None)
+def camera_registry(csv_file=CAMERA_DETAILS_FILE):
+    """
+    The CameraRegistry of a camera details file, read once per process.
+    """
+    return CameraRegistry(csv_file)
+
+
+def camera_details(camera, date_to_use, fallback='exact', max_days=None,
+                   csv_file=CAMERA_DETAILS_FILE):
+    """
+    Details of a camera on a day from the registry of csv_file (see
+    CameraRegistry.get).
+    """
+    return camera_registry(csv_file).get(camera, date_to_use, fallback,
+                                         max_days)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Geodesic distance rings round a camera for the optical depth plots.
+
+A ring is a circle of the given radius in an azimuthal equidistant projection
+centred on the camera, projected back to lon/lat. One pyproj.Transformer is
+built per camera site and all the rings asked for are projected in one
+vectorised call. Camera positions stay the same for whole days in
+camera_details.csv, so the rings are also memoised by (lat, lon, km).
+
+The points match shapely's Point(0, 0).buffer(km * 1000) (64 segments,
+clockwise from due east) which the rings were first drawn with.
+
+"""
+
+from functools import lru_cache
+import numpy as np
+import pyproj
+
+# Points round each ring, as in a shapely buffer with 16 segments a quarter
+_ANGLES = -np.arange(65) * 2 * np.pi / 64
+_UNIT_X = np.cos(_ANGLES)
+_UNIT_Y = np.sin(_ANGLES)
+# Close the ring exactly
+_UNIT_X[-1], _UNIT_Y[-1] = _UNIT_X[0], _UNIT_Y[0]
+
+# Rings already worked out, keyed by (lat, lon, km)
+_rings = {}
+
+
+@lru_cache(maxsize=64)
+def site_transformer(lat, lon):
+    """
+    Transformer from the azimuthal equidistant projection centred on a site
+    to lon/lat.
+
+    Args:
+        lat (float): Latitude of the site.
+        lon (float): Longitude of the site.
+
+    Returns:
+        pyproj.Transformer: Transformer taking metres east/north of the site.
+    """
+    aeqd_proj = '+proj=aeqd +lat_0={lat} +lon_0={lon} +x_0=0 +y_0=0'
+    return pyproj.Transformer.from_proj(
+        pyproj.Proj(aeqd_proj.format(lat=lat, lon=lon)),
+        pyproj.Proj('+proj=longlat +datum=WGS84'), always_xy=True)
+
+
+def geodesic_rings(lat, lon, kms):
+    """
+    Lon/lat coordinates of rings round a site.
+
+    Args:
+        lat (float): Latitude of the site.
+        lon (float): Longitude of the site.
+        kms (list): Radius of each ring in km.
+
+    Returns:
+        list: (lons, lats) numpy arrays for each ring, in the order of kms.
+    """
+    lat = float(lat)
+    lon = float(lon)
+    missing = [km for km in dict.fromkeys(kms) if (lat, lon, km) not in _rings]
+    if missing:
+        radius = np.asarray(missing, dtype=float)[:, None] * 1000
+        ring_lons, ring_lats = site_transformer(lat, lon).transform(
+            radius * _UNIT_X, radius * _UNIT_Y)
+        for km, ring_lon, ring_lat in zip(missing, ring_lons, ring_lats):
+            _rings[(lat, lon, km)] = (ring_lon, ring_lat)
+    return [_rings[(lat, lon, km)] for km in kms]
+
+
+def geodesic_ring(lat, lon, km):
+    """
+    Lon/lat coordinates of one ring of radius km round a site.
+    """
+    return geodesic_rings(lat, lon, [km])[0]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Linear interpolation over the flag == 16 pixels of the regridded GOES data.
+
+scipy.interpolate.griddata triangulates the unflagged points from scratch on
+every call. The regridded lon/lat grid never changes and the same flag
+patterns turn up again and again, so Flag16Interpolator works out the
+Delaunay barycentric weights once per flag pattern and stores them as a
+sparse matrix. Filling the flagged pixels is then a sparse matrix-vector
+product which gives the same values as griddata(method='linear').
+
+Usage: python flag16_interp.py
+runs a benchmark against griddata on a synthetic grid and checks the outputs
+match.
+
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from scipy.interpolate import griddata
+from scipy.spatial import Delaunay
+from fov_masks import grid_signature
+
+
+class Flag16Interpolator:
+    """
+    A cache of the linear interpolation weights for each flag pattern.
+
+    Attributes:
+        maxsize (int): Number of flag patterns to keep weights for.
+        hits (int): Number of fills that reused cached weights.
+        misses (int): Number of triangulations done.
+    """
+
+    def __init__(self, maxsize=64):
+        """
+        Initialize an empty cache holding up to maxsize flag patterns.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._weights = OrderedDict()
+
+    def weights(self, lons, lats, mask):
+        """
+        Sparse weights interpolating the flagged pixels from the others.
+
+        Args:
+            lons (numpy.ndarray): Longitudes of the grid.
+            lats (numpy.ndarray): Latitudes of the grid.
+            mask (numpy.ndarray): 2D boolean (lat, lon) array, True where
+                flagged.
+
+        Returns:
+            scipy.sparse.csr_matrix: (flagged, unflagged) weight matrix.
+            numpy.ndarray: True for flagged pixels outside the triangulation.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        key = (grid_signature(lons, lats), mask.shape,
+               hashlib.sha1(np.packbits(mask).tobytes()).hexdigest())
+        if key in self._weights:
+            self.hits += 1
+            self._weights.move_to_end(key)
+            return self._weights[key]
+        self.misses += 1
+        lon, lat = np.meshgrid(lons, lats)
+        points = np.column_stack((lon[~mask], lat[~mask]))
+        points_interp = np.column_stack((lon[mask], lat[mask]))
+        tri = Delaunay(points)
+        simplex = tri.find_simplex(points_interp)
+        outside = simplex < 0
+        # Barycentric coordinates of each flagged pixel in its triangle
+        transform = tri.transform[simplex]
+        bary = np.einsum('nij,nj->ni', transform[:, :2],
+                         points_interp - transform[:, 2])
+        bary = np.column_stack((bary, 1 - bary.sum(axis=1)))
+        vertices = tri.simplices[simplex]
+        bary[outside] = 0
+        vertices[outside] = 0
+        n_interp = len(points_interp)
+        # Zero weights are kept so NaN values propagate as in griddata
+        weight_matrix = sparse.csr_matrix(
+            (bary.ravel(), vertices.ravel(), np.arange(0, 3*n_interp+1, 3)),
+            shape=(n_interp, len(points)))
+        self._weights[key] = weight_matrix, outside
+        if len(self._weights) > self.maxsize:
+            self._weights.popitem(last=False)
+        return weight_matrix, outside
+
+    def fill(self, values, lons, lats, mask):
+        """
+        Replace the flagged pixels with linear interpolation of the others.
+
+        Args:
+            values (numpy.ndarray): 2D (lat, lon) array of values.
+            lons (numpy.ndarray): Longitudes of the grid.
+            lats (numpy.ndarray): Latitudes of the grid.
+            mask (numpy.ndarray): 2D boolean (lat, lon) array, True where
+                flagged.
+
+        Returns:
+            numpy.ndarray: Copy of values with the flagged pixels filled (NaN
+            outside the convex hull of the unflagged pixels).
+        """
+        mask = np.asarray(mask, dtype=bool)
+        filled = np.array(values, dtype=float)
+        if not mask.any():
+            return filled
+        weight_matrix, outside = self.weights(lons, lats, mask)
+        interp = weight_matrix @ filled[~mask]
+        interp[outside] = np.nan
+        filled[mask] = interp
+        return filled
+
+
+def benchmark(n_lat=45, n_lon=75, n_patterns=5, n_fills=200, seed=0):
+    """
+    Time Flag16Interpolator against griddata and check the outputs match.
+
+    Args:
+        n_lat, n_lon (int): Size of the synthetic grid.
+        n_patterns (int): Number of distinct flag patterns.
+        n_fills (int): Number of fills, cycling through the patterns.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Time taken by each method in seconds and the largest absolute
+        difference between them.
+    """
+    rng = np.random.default_rng(seed)
+    lons = np.linspace(-107.5, -106.8, n_lon)
+    lats = np.linspace(33.75, 34.25, n_lat)
+    lon, lat = np.meshgrid(lons, lats)
+    masks = [rng.random((n_lat, n_lon)) < 0.05 for _ in range(n_patterns)]
+    fields = [rng.gamma(1.5, 2.0, (n_lat, n_lon)) for _ in range(n_fills)]
+
+    start = time.perf_counter()
+    expected = []
+    for i, values in enumerate(fields):
+        mask = masks[i % n_patterns]
+        filled = values.copy()
+        filled[mask] = griddata(
+            np.array([lon[~mask], lat[~mask]]).T, values[~mask],
+            np.array([lon[mask], lat[mask]]).T, method='linear')
+        expected.append(filled)
+    griddata_time = time.perf_counter() - start
+
+    interpolator = Flag16Interpolator()
+    start = time.perf_counter()
+    result = [interpolator.fill(values, lons, lats, masks[i % n_patterns])
+              for i, values in enumerate(fields)]
+    cached_time = time.perf_counter() - start
+
+    expected = np.array(expected)
+    result = np.array(result)
+    if not np.array_equal(np.isnan(expected), np.isnan(result)):
+        raise AssertionError('NaN pixels differ from griddata')
+    max_diff = np.nanmax(np.abs(expected - result))
+    return {'griddata': griddata_time, 'cached': cached_time,
+            'max_abs_diff': max_diff}
+
+
+if __name__ == "__main__":
+    timings = benchmark()
+    print(f"griddata: {timings['griddata']:.3f} s")
+    print(f"cached weights: {timings['cached']:.3f} s")
+    print(f"max abs difference: {timings['max_abs_diff']:.2e}")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Max optical depth in the camera field of view (FOV) for every time step of a
+(t, lat, lon) cube at once.
+
+The grid cells inside the FOV (from FOVMaskIndex) are taken out of every time
+step together, optical depths below the threshold (3.6, cirrus not cumulus)
+are dropped and the first max along each row gives the location of the max
+for each time step, as np.nanargmax does for one step. For a dask backed
+cube (e.g. from xr.open_mfdataset) the reduction is done lazily chunk by
+chunk along t, so a month of scans is only read once and never held in
+memory all together.
+
+"""
+
+from collections import namedtuple
+import numpy as np
+import haversine as hs
+
+# Optical depth threshold (cumulus cloud not cirrus)
+OPTICAL_DEPTH_THRESHOLD = 3.6
+# Time steps reduced together in each dask chunk
+T_CHUNK = 48
+
+CubeMax = namedtuple('CubeMax', ['maxlat', 'maxlon', 'value', 'distance',
+                                 'status'])
+CubeMax.__doc__ = """
+Max optical depth in the FOV for each time step.
+
+Attributes:
+    maxlat (numpy.ndarray): Latitude index of the max (-1 if no cloud).
+    maxlon (numpy.ndarray): Longitude index of the max (-1 if no cloud).
+    value (numpy.ndarray): Max optical depth (NaN if no cloud).
+    distance (numpy.ndarray): Haversine distance in km from the camera to
+        the max (NaN if no cloud).
+    status (numpy.ndarray): 'cloud', 'no cloud in area' or 'no cloud in FOV'.
+"""
+
+
+def _block_max(block, indices, threshold):
+    """
+    (area has cloud, flat index of the max, max) for each time step of a
+    (t, lat, lon) block.
+    """
+    flat = np.asarray(block).reshape(block.shape[0], -1)
+    result = np.full((flat.shape[0], 3), np.nan)
+    result[:, 0] = ~np.isnan(flat).all(axis=1)
+    if len(indices) == 0:
+        return result
+    in_fov = flat[:, indices]
+    if threshold is not None:
+        in_fov = np.where(in_fov >= threshold, in_fov, np.nan)
+    fov_cloud = ~np.isnan(in_fov).all(axis=1)
+    # First occurrence of the max as np.nanargmax (NaNs never win)
+    first_max = np.where(np.isnan(in_fov), -np.inf, in_fov).argmax(axis=1)
+    steps = np.flatnonzero(fov_cloud)
+    result[steps, 1] = indices[first_max[steps]]
+    result[steps, 2] = in_fov[steps, first_max[steps]]
+    return result
+
+
+def fov_max_cube(data, indices, camlat, camlon,
+                 threshold=OPTICAL_DEPTH_THRESHOLD, t_chunk=T_CHUNK):
+    """
+    Find the max optical depth in the FOV for every time step.
+
+    Args:
+        data (xr.DataArray): (t, lat, lon) optical depth, numpy or dask
+            backed.
+        indices (numpy.ndarray): Sorted indices of the FOV cells in the
+            flattened (lat, lon) grid (FOVMaskIndex.flat_indices).
+        camlat (float): Latitude of the camera.
+        camlon (float): Longitude of the camera.
+        threshold (float): Lowest optical depth counted as cloud (None to
+            count any value).
+        t_chunk (int): Time steps in each dask chunk.
+
+    Returns:
+        CubeMax: The location, value, distance and status for each time step.
+    """
+    values = data.data
+    indices = np.asarray(indices, dtype=np.intp)
+    if hasattr(values, 'map_blocks'):
+        # Whole (lat, lon) fields in each chunk, t_chunk time steps at a time
+        values = values.rechunk({0: t_chunk, 1: -1, 2: -1})
+        result = values.map_blocks(
+            _block_max, indices, threshold, drop_axis=[1, 2], new_axis=1,
+            chunks=(values.chunks[0], (3,)), dtype=float).compute()
+    else:
+        result = _block_max(values, indices, threshold)
+    area_cloud = result[:, 0] == 1
+    fov_cloud = ~np.isnan(result[:, 1])
+    flat_index = np.where(fov_cloud, result[:, 1], 0).astype(np.intp)
+    maxlat, maxlon = np.unravel_index(flat_index, values.shape[1:])
+    maxlat = np.where(fov_cloud, maxlat, -1)
+    maxlon = np.where(fov_cloud, maxlon, -1)
+    lats = data.coords['lat'].values
+    lons = data.coords['lon'].values
+    distance = np.full(len(result), np.nan)
+    if fov_cloud.any():
+        points = np.column_stack((lats[maxlat[fov_cloud]],
+                                  lons[maxlon[fov_cloud]]))
+        camera = np.broadcast_to([camlat, camlon], points.shape)
+        distance[fov_cloud] = hs.haversine_vector(points, camera)
+    status = np.where(fov_cloud, 'cloud',
+                      np.where(area_cloud, 'no cloud in FOV',
+                               'no cloud in area'))
+    return CubeMax(maxlat, maxlon, result[:, 2], distance, status)
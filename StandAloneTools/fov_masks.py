@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Index of the satellite grid cells inside a camera's field of view (FOV).
+
+The camera position, yaw and the regridded satellite lat/lon grid are fixed
+for a whole day, so which grid cells fall inside the FOV polygon only needs
+working out once. FOVMaskIndex stores the flattened indices of those cells
+keyed by (grid signature, camlat, camlon, yaw, fov width) and can also keep
+them on disk between runs. find_max_in_fov then only has to reduce over the
+precomputed cells for each time step.
+
+"""
+
+import hashlib
+import os
+import numpy as np
+from matplotlib.path import Path
+
+
+def grid_signature(lons, lats):
+    """
+    Hash identifying a lat/lon grid.
+
+    Args:
+        lons (numpy.ndarray): Longitudes of the grid.
+        lats (numpy.ndarray): Latitudes of the grid.
+
+    Returns:
+        str: Hex digest of the grid coordinates.
+    """
+    sha = hashlib.sha1()
+    for coord in (lons, lats):
+        coord = np.ascontiguousarray(coord, dtype=np.float64)
+        sha.update(str(coord.shape).encode())
+        sha.update(coord.tobytes())
+    return sha.hexdigest()
+
+
+class FOVMaskIndex:
+    """
+    A cache of the flattened grid indices inside FOV polygons.
+
+    Attributes:
+        cache_dir (str): Folder to keep the indices in between runs (None
+            keeps them in memory only).
+        hits (int): Number of lookups served from memory or disk.
+        misses (int): Number of masks computed.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Initialize an empty index.
+
+        Args:
+            cache_dir (str): Optional folder for the on-disk cache.
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._indices = {}
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def flat_indices(self, lons, lats, fov_x, fov_y, fov_key):
+        """
+        Flattened indices of the (lat, lon) grid cells inside the FOV polygon.
+
+        Args:
+            lons (numpy.ndarray): Longitudes of the grid.
+            lats (numpy.ndarray): Latitudes of the grid.
+            fov_x (list): x-coordinates of the FOV polygon.
+            fov_y (list): y-coordinates of the FOV polygon.
+            fov_key (tuple): (camlat, camlon, yaw, fov width) the polygon was
+                made from.
+
+        Returns:
+            numpy.ndarray: Sorted indices into the flattened (lat, lon) grid.
+        """
+        key = (grid_signature(lons, lats),) + tuple(
+            float(value) for value in fov_key)
+        if key in self._indices:
+            self.hits += 1
+            return self._indices[key]
+        cache_file = None
+        if self.cache_dir is not None:
+            name = hashlib.sha1(repr(key).encode()).hexdigest()
+            cache_file = os.path.join(self.cache_dir, name + '.npy')
+            if os.path.exists(cache_file):
+                self.hits += 1
+                self._indices[key] = np.load(cache_file)
+                return self._indices[key]
+        self.misses += 1
+        # Check which grid points are within the polygon
+        x_grid, y_grid = np.meshgrid(lons, lats)
+        points = np.column_stack((x_grid.ravel(), y_grid.ravel()))
+        mask = Path(list(zip(fov_x, fov_y))).contains_points(points)
+        indices = np.flatnonzero(mask)
+        if cache_file is not None:
+            np.save(cache_file, indices)
+        self._indices[key] = indices
+        return indices
+
+
+def max_in_indices(values, indices):
+    """
+    Find the grid location of the maximum value among the given cells.
+
+    Args:
+        values (numpy.ndarray): 2D (lat, lon) array of values.
+        indices (numpy.ndarray): Sorted indices into the flattened array.
+
+    Returns:
+        tuple: (maxlat, maxlon) indices of the maximum value.
+
+    Raises:
+        ValueError: If there are no cells or they are all NaN.
+    """
+    in_fov = values.ravel()[indices]
+    # First occurrence of the max, as np.nanargmax over the whole array
+    return np.unravel_index(indices[np.nanargmax(in_fov)], values.shape)
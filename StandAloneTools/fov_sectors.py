@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Camera field of view (FOV) sector polygons.
+
+A sector is the camera position followed by points along an arc from
+yaw - fov/2 to yaw + fov/2 (angles clockwise from north). fov_sectors makes
+the polygons for arrays of (camlat, camlon, yaw, fov) in one vectorised call,
+e.g. the nominal and yaw error FOVs together or a sweep of yaw errors over
+many camera days.
+
+By default the arc is FOV_RADIUS degrees from the camera on the lon/lat
+grid, as the FOV has always been drawn. Given radius_km the arc is instead
+that many km from the camera along geodesics on the WGS84 ellipsoid, worked
+out with one cached pyproj.Geod for all the sectors.
+
+"""
+
+from functools import lru_cache
+import numpy as np
+import pyproj
+
+# Radius of the sector in degrees of lon/lat
+FOV_RADIUS = 0.35
+# Points along the arc of each sector
+N_POINTS = 100
+
+
+@lru_cache(maxsize=1)
+def wgs84_geod():
+    """
+    The pyproj.Geod used for the geodesic sectors.
+    """
+    return pyproj.Geod(ellps='WGS84')
+
+
+def _arc(start, end, n_points):
+    """
+    n_points evenly spaced from start to end along the last axis, as
+    np.linspace(start, end, n_points) for each start/end.
+    """
+    step = (end - start) / (n_points - 1)
+    arc = np.arange(n_points) * step[..., None] + start[..., None]
+    arc[..., -1] = end
+    return arc
+
+
+def fov_sectors(camlat, camlon, yaw_degrees, fov_degrees, radius=FOV_RADIUS,
+                n_points=N_POINTS, radius_km=None):
+    """
+    Polygons of the FOV sectors of cameras.
+
+    Args:
+        camlat (array_like): Latitudes of the cameras.
+        camlon (array_like): Longitudes of the cameras.
+        yaw_degrees (array_like): Yaw of each camera in degrees.
+        fov_degrees (array_like): Horizontal field of view in degrees.
+        radius (float): Radius of the sectors in degrees of lon/lat.
+        n_points (int): Points along the arc of each sector.
+        radius_km (float): Radius of the sectors in km along geodesics
+            (instead of radius).
+
+    Returns:
+        tuple: (fov_x, fov_y) numpy arrays of the polygon longitudes and
+        latitudes, of the broadcast shape of the inputs plus a last axis of
+        n_points + 1 (the camera then the arc).
+    """
+    camlat, camlon, yaw_degrees, fov_degrees = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in
+          (camlat, camlon, yaw_degrees, fov_degrees)))
+    shape = camlat.shape + (n_points,)
+    if radius_km is None:
+        angles = _arc(np.radians(yaw_degrees - fov_degrees / 2),
+                      np.radians(yaw_degrees + fov_degrees / 2), n_points)
+        arc_x = camlon[..., None] + radius * np.sin(angles)
+        arc_y = camlat[..., None] + radius * np.cos(angles)
+    else:
+        azimuths = _arc(yaw_degrees - fov_degrees / 2,
+                        yaw_degrees + fov_degrees / 2, n_points)
+        arc_x, arc_y, _ = wgs84_geod().fwd(
+            np.broadcast_to(camlon[..., None], shape).ravel(),
+            np.broadcast_to(camlat[..., None], shape).ravel(),
+            azimuths.ravel(), np.full(azimuths.size, radius_km * 1000.0))
+        arc_x = arc_x.reshape(shape)
+        arc_y = arc_y.reshape(shape)
+    fov_x = np.concatenate((camlon[..., None], arc_x), axis=-1)
+    fov_y = np.concatenate((camlat[..., None], arc_y), axis=-1)
+    return fov_x, fov_y
+
+
+def fov_sector(camlat, camlon, yaw_degrees, fov_degrees, radius=FOV_RADIUS,
+               n_points=N_POINTS, radius_km=None):
+    """
+    Polygon of one camera's FOV sector, see fov_sectors.
+
+    Returns:
+        tuple: (fov_x, fov_y) 1D numpy arrays of n_points + 1 points.
+    """
+    return fov_sectors(float(camlat), float(camlon), float(yaw_degrees),
+                       float(fov_degrees), radius, n_points, radius_km)
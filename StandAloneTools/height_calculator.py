@@ -6,6 +6,8 @@ Project: DCMEX
 
 Description:
 This script calculates the height of clouds based on pixel position, distance, and pitch.
+CloudHeightCalculator also accepts arrays of pixels, distances and pitches
+(e.g. whole DataFrame columns), which are converted in one vectorised pass.
 
 Usage: python calculate_heights.py <pixels> <distance> <pitch>
 where: 
@@ -19,15 +21,17 @@ Example: python calculate_heights.py 1000 2.5 30
 
 import sys
 import math
+import numpy as np
 
 class CloudHeightCalculator:
     """
     A class to calculate the height of clouds.
 
     Attributes:
-        pixels (int): y-pixel position of the cloud on the photo (0,0 being the left hand corner).
-        distance (float): Distance to the cloud in kilometers.
-        pitch (float): Pitch of the camera in degrees.
+        pixels (int or array): y-pixel position of the cloud on the photo (0,0 being the left hand corner).
+        distance (float or array): Distance to the cloud in kilometers.
+        pitch (float or array): Pitch of the camera in degrees.
+        camera (Camera): Camera used to take the photo.
     """
 
     def __init__(self, pixels, distance, pitch):
@@ -35,13 +39,14 @@ class CloudHeightCalculator:
         Initialize the CloudHeightCalculator with pixel position, distance, and pitch.
 
         Args:
-            pixels (int): y-pixel position of the cloud on the photo.
-            distance (float): Distance to the cloud in kilometers.
-            pitch (float): Pitch of the camera in degrees.
+            pixels (int or array): y-pixel position of the cloud on the photo.
+            distance (float or array): Distance to the cloud in kilometers.
+            pitch (float or array): Pitch of the camera in degrees.
         """
-        self.pixels = int(pixels)
-        self.distance = float(distance)
-        self.pitch = float(pitch)
+        self.pixels = np.asarray(pixels, dtype=float).astype(int)
+        self.distance = np.asarray(distance, dtype=float)
+        self.pitch = np.asarray(pitch, dtype=float)
+        self.camera = Camera()
 
     def calculate_height(self):
         """
@@ -51,10 +56,12 @@ class CloudHeightCalculator:
         then corrects this height based on the camera's pitch.
 
         Returns:
-            float: The corrected height of the cloud.
+            float or array: The corrected height of the cloud.
         """
         height_raw = self.camera.find_height(self.pixels, self.distance)
         height_corrected = self.camera.pitch_correct(self.pitch, height_raw)
+        if np.ndim(height_corrected) == 0:
+            return float(height_corrected)
         return height_corrected
 
 class Camera:
@@ -103,25 +110,25 @@ class Camera:
         Calculate the height of an object given its pixel position on the photo.
 
         Args:
-            P (int): y-pixel position of the object on the photo.
-            Distance (float): Distance to the object in km
+            P (int or array): y-pixel position of the object on the photo.
+            Distance (float or array): Distance to the object in km
 
         Returns:
-            float: Height of the object in kilometers (rounded to 2 decimal places).
+            float or array: Height of the object in kilometers (rounded to 2 decimal places).
         """
         OHS = self.find_OHS(P)
         height = (Distance * 10**3 * OHS) / self.focal_length_mm
-        return round(height / 10**3, 2)
+        return np.round(height / 10**3, 2)
 
     def find_OHS(self, P):
         """
         Calculate the Object Height on Sensor.
 
         Args:
-            P (int): Pixel position of the object on the photo.
+            P (int or array): Pixel position of the object on the photo.
 
         Returns:
-            float: Object Height on Sensor.
+            float or array: Object Height on Sensor.
         """
         OHS = self.sensor_height_mm * P / self.sensor_height_pixels
         return OHS
@@ -131,11 +138,11 @@ class Camera:
         Correct the pitch of the camera based on angles and height.
 
         Args:
-            P (float): pitch.
-            h (float): Height on the inclined plane.
+            P (float or array): pitch.
+            h (float or array): Height on the inclined plane.
 
         Returns:
-            float: True height after pitch correction.
+            float or array: True height after pitch correction.
         """
         # See diagram for angles a, b and c
         a = 90 - P - self.fov_vertical_deg / 2
@@ -143,7 +150,7 @@ class Camera:
         # image plane incline from vertical
         c = 180 - a - b
         # x is true height, h is height on inclined place
-        x = h * math.cos(math.radians(c))
+        x = h * np.cos(np.radians(c))
         return x
 
 if __name__ == "__main__":
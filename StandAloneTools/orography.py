@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python: 3.8 Jasmin NERC servers
+Project: DCMEX
+
+Description:
+Process-wide cache of the orography drawn on the optical depth plots.
+
+The orography file and the lat/lon box of the plots never change, so the
+subset and its 2400/2500/2800/3300 m contour lines are worked out once and
+reused by every plot. Orography objects only hold numpy arrays so they can be
+pickled and handed to worker processes with init_worker, which saves each
+worker opening the netCDF file again.
+
+"""
+
+import contourpy
+import numpy as np
+import xarray as xr
+
+# Orography file
+OROG_FILE = '/gws/nopw/j04/dcmex/users/dfinney/data/globe_orog_data_NM.nc'
+OROG_LEVELS = (2400, 2500, 2800, 3300)
+
+# Orography already loaded in this process
+_cache = {}
+
+
+class Orography:
+    """
+    Orography subset to a lat/lon box with precomputed contour lines.
+
+    Attributes:
+        X (numpy.ndarray): Longitudes.
+        Y (numpy.ndarray): Latitudes.
+        topo (numpy.ndarray): 2D (Y, X) height in meters.
+        levels (tuple): Heights of the contours in meters.
+        lines (dict): List of (n, 2) lon/lat arrays for each level.
+    """
+
+    def __init__(self, X, Y, topo, levels=OROG_LEVELS):
+        """
+        Initialize the orography and work out its contour lines.
+        """
+        self.X = np.asarray(X)
+        self.Y = np.asarray(Y)
+        self.topo = np.asarray(topo)
+        self.levels = tuple(levels)
+        # Same algorithm as matplotlib uses for contour plots
+        generator = contourpy.contour_generator(self.X, self.Y, self.topo,
+                                                name='mpl2014')
+        self.lines = {level: generator.lines(level)[0]
+                      for level in self.levels}
+
+    @classmethod
+    def from_file(cls, orog_file, lon1, lon2, lat1, lat2, levels=OROG_LEVELS):
+        """
+        Read the orography inside the lat/lon box from a netCDF file.
+        """
+        with xr.open_dataset(orog_file) as ds:
+            orog = ds['topo'].sel(X=slice(lon1, lon2),
+                                  Y=slice(lat1, lat2)).load()
+        return cls(orog['X'].values, orog['Y'].values, orog.values, levels)
+
+    def plot_contours(self, ax, colors='k'):
+        """
+        Draw the contour lines on a matplotlib axes.
+        """
+        from matplotlib.collections import LineCollection
+        segments = [line for level in self.levels
+                    for line in self.lines[level]]
+        ax.add_collection(LineCollection(segments, colors=colors))
+
+
+def load_orography(lon1, lon2, lat1, lat2, orog_file=OROG_FILE,
+                   levels=OROG_LEVELS):
+    """
+    Return the orography for the lat/lon box, only reading it once per process.
+
+    Parameters:
+    - lon1, lon2, lat1, lat2 (float): Lat/lon box to subset to.
+    - orog_file (str): Orography netCDF file.
+    - levels (tuple): Heights of the contours in meters.
+
+    Returns:
+    - Orography: The cached orography.
+    """
+    key = (orog_file, lon1, lon2, lat1, lat2, tuple(levels))
+    if key not in _cache:
+        _cache[key] = Orography.from_file(orog_file, lon1, lon2, lat1, lat2,
+                                          levels)
+    return _cache[key]
+
+
+def init_worker(cache):
+    """
+    Process pool initializer installing orography loaded by the parent.
+
+    Usage Example:
+    ```python
+    load_orography(lon1, lon2, lat1, lat2)
+    pool = ProcessPoolExecutor(initializer=init_worker,
+                               initargs=(orography_cache(),))
+    ```
+    """
+    _cache.update(cache)
+
+
+def orography_cache():
+    """
+    Copy of the orography loaded in this process, to pass to init_worker.
+    """
+    return dict(_cache)
@@ -0,0 +1,242 @@
+"""
+python script batch_cloud_pixels.py
+
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Usage: python batch_cloud_pixels.py <cameras> <start date> [<end date>]
+                                    [--workers N] [--scale S] [--no-cache]
+                                    [--no-boxes]
+where
+cameras : comma separated cameras e.g. 1,2
+start date : string 'yyyy-mm-dd'
+end date : string 'yyyy-mm-dd' (defaults to the start date)
+--workers : number of worker processes (defaults to the number of cores)
+--scale : find the boxes in the photos decoded at 1/S size, 1, 2, 4 or 8
+          (defaults to DETECT_SCALE in cloudtop_pixel_heights.py)
+--no-cache : find the boxes in every photo again instead of reading the
+             boxes of unchanged photos from the box cache (box_cache.py)
+--no-boxes : don't save the photos with the boxes drawn on (they are only
+             needed for the image_pairs.py pngs, not its --video)
+
+Batch version of cloudtop_pixel_heights.py for reprocessing a whole campaign.
+The photos to box are selected per camera and day exactly as in
+cloudtop_pixel_heights.py, then find_contours is run over a process pool for
+every selected photo of every day and camera. The boxes are merged back into
+one cloud_pixels_camera_<n>.csv per day in timestamp order and the throughput
+in images per second is reported. A day with cloud distances but no photos
+to box gets a csv with just the header. A photo that can't be boxed (e.g. a
+corrupt JPEG) is reported and left out of its day's csv and the box cache
+instead of stopping the batch.
+
+"""
+# import modules
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import pandas as pd
+import cloudtop_pixel_heights as cph
+
+
+def campaign_dates(start_date, end_date=None):
+    """
+    List the 'yyyy-mm-dd' date strings from start_date to end_date inclusive.
+    """
+    if end_date is None:
+        end_date = start_date
+    return list(pd.date_range(start_date, end_date).strftime('%Y-%m-%d'))
+
+
+def plan_tasks(cameras, dates):
+    """
+    Build the list of photos to box for every camera and day.
+
+    Parameters:
+    - cameras (list): Camera numbers.
+    - dates (list): 'yyyy-mm-dd' date strings.
+
+    Returns:
+    - list: (camera, date, file name, 'HHMMSS') for every photo to process.
+    - list: (camera, date) of every day planned, with or without photos to
+      process.
+    """
+    tasks = []
+    days = []
+    for date_to_use in dates:
+        for camera in cameras:
+            fnames = cph.find_image_files(camera, date_to_use)
+            if not fnames:
+                print('no photos for camera', camera, 'on', date_to_use)
+                continue
+            try:
+                cloud_distances = cph.load_cloud_distances(camera,
+                                                           date_to_use)
+            except FileNotFoundError:
+                print('no cloud distances for camera', camera, 'on',
+                      date_to_use)
+                continue
+            cph.setup_directories(camera, date_to_use)
+            time_list, datetime_objects = cph.extract_image_times(fnames)
+            keep = cph.select_cloudy_images(datetime_objects, cloud_distances)
+            print('camera', camera, 'on', date_to_use + ':', end=' ')
+            cph.report_plan(keep, fnames)
+            days.append((camera, date_to_use))
+            for i in keep:
+                tasks.append((camera, date_to_use, fnames[i], time_list[i]))
+    return tasks, days
+
+
+def process_task(task, scale=cph.DETECT_SCALE, save_image=True):
+    """
+    Run find_contours on one photo (called in the worker processes).
+
+    Parameters:
+    - task (tuple): (camera, date, file name, 'HHMMSS') from plan_tasks.
+    - scale (int): Find the boxes in the photo decoded at 1/scale size.
+    - save_image (bool): Save the photo with the boxes drawn on.
+
+    Returns:
+    - tuple: (camera, date, 'HHMMSS', find_contours output)
+    """
+    camera, date_to_use, fname, time_str = task
+    cloudbox = cph.find_contours(fname, date_to_use + '-' + time_str + '_',
+                                 cph.WHITENESS_THRESHOLD, cph.THICKNESS,
+                                 cph.NOTSKY,
+                                 cph.image_root(camera, date_to_use),
+                                 scale=scale, save_image=save_image)
+    return camera, date_to_use, time_str, cloudbox
+
+
+def try_task(task, scale=cph.DETECT_SCALE, save_image=True):
+    """
+    Run process_task, returning the error instead of raising it.
+
+    Returns:
+    - tuple: (camera, date, 'HHMMSS', find_contours output or None, error
+      message or None)
+    """
+    try:
+        return process_task(task, scale, save_image) + (None,)
+    except Exception:
+        camera, date_to_use, _, time_str = task
+        return camera, date_to_use, time_str, None, traceback.format_exc()
+
+
+def run_batch(cameras, dates, workers=None, chunksize=1,
+              scale=cph.DETECT_SCALE, cache_file=cph.BOX_CACHE_FILE,
+              save_image=True):
+    """
+    Box the clouds in every selected photo over a process pool and write one
+    cloud_pixels_camera_<n>.csv per camera and day.
+
+    Parameters:
+    - cameras (list): Camera numbers.
+    - dates (list): 'yyyy-mm-dd' date strings.
+    - workers (int): Number of worker processes (None uses every core).
+    - chunksize (int): Photos handed to a worker at a time.
+    - scale (int): Find the boxes in the photos decoded at 1/scale size.
+    - cache_file (str): Box cache file (None to not use the cache).
+    - save_image (bool): Save the photos with the boxes drawn on.
+
+    Returns:
+    - dict: cloud pixel DataFrame keyed by (camera, date).
+    """
+    tasks, days = plan_tasks(cameras, dates)
+    results = {}
+    # Only the photos not in the box cache are handed to the pool
+    cache = None if cache_file is None else cph.open_box_cache(cache_file)
+    todo = []
+    for task in tasks:
+        camera, date_to_use, fname, time_str = task
+        cloudbox = None if cache is None else cph.cached_boxes(
+            cache, fname, date_to_use + '-' + time_str + '_',
+            cph.image_root(camera, date_to_use), scale,
+            save_image=save_image)
+        if cloudbox is None:
+            todo.append(task)
+        else:
+            results.setdefault((camera, date_to_use), []).append(
+                (time_str, cloudbox))
+    print(len(todo), 'photos to process')
+    start = time.perf_counter()
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task, (camera, date_to_use, time_str, cloudbox, error) in zip(
+                todo, pool.map(partial(try_task, scale=scale,
+                                       save_image=save_image), todo,
+                               chunksize=chunksize)):
+            if error is not None:
+                print('could not box', task[2] + ':', error)
+                failed.append(task[2])
+                continue
+            results.setdefault((camera, date_to_use), []).append(
+                (time_str, cloudbox))
+            if cache is not None:
+                cache.put(task[2], cph.WHITENESS_THRESHOLD, cph.NOTSKY,
+                          cloudbox, scale, cph.N_BOXES)
+    elapsed = time.perf_counter() - start
+    if cache is not None:
+        cache.save()
+        cache.report()
+
+    cloud_pixels = {}
+    for key in days:
+        # Header only for the days without any photos boxed
+        results.setdefault(key, [])
+    for (camera, date_to_use), boxes in sorted(results.items()):
+        # 'HHMMSS' strings sort in timestamp order
+        boxes.sort(key=lambda item: item[0])
+        df = cph.cloud_pixels_dataframe([item[0] for item in boxes],
+                                        [item[1] for item in boxes])
+        df.to_csv(os.path.join(cph.results_root(date_to_use),
+                               f'cloud_pixels_camera_{camera}.csv'))
+        cloud_pixels[(camera, date_to_use)] = df
+
+    rate = len(todo) / elapsed if elapsed > 0 else float('nan')
+    print(f'processed {len(todo)} photos in {elapsed:.1f} s '
+          f'({rate:.2f} images/s)')
+    if failed:
+        print(len(failed), 'photos could not be boxed:')
+        for fname in failed:
+            print(fname)
+    return cloud_pixels
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Box clouds in photos for many days and cameras.')
+    parser.add_argument('cameras', help="comma separated cameras e.g. '1,2'")
+    parser.add_argument('start_date', help="'yyyy-mm-dd'")
+    parser.add_argument('end_date', nargs='?', default=None,
+                        help="'yyyy-mm-dd' (defaults to start_date)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='photos handed to a worker at a time')
+    parser.add_argument('--scale', type=int, default=cph.DETECT_SCALE,
+                        choices=[1, 2, 4, 8],
+                        help='find the boxes in the photos decoded at 1/scale '
+                        'size')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='find the boxes in every photo again')
+    parser.add_argument('--no-boxes', action='store_true',
+                        help="don't save the photos with the boxes drawn on")
+    args = parser.parse_args()
+    cameras = [int(camera) for camera in args.cameras.split(',')]
+    run_batch(cameras, campaign_dates(args.start_date, args.end_date),
+              workers=args.workers, chunksize=args.chunksize,
+              scale=args.scale,
+              cache_file=None if args.no_cache else cph.BOX_CACHE_FILE,
+              save_image=not args.no_boxes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+python module box_cache.py
+
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+On-disk cache of the cloud boxes find_contours finds in each photo.
+
+Reruns of cloudtop_pixel_heights.py over photos that have not changed look
+the eight box values up here instead of decoding the photo again. An entry is
+only used if everything that decides the boxes is the same:
+
+- the photo path, size in bytes and modification time,
+- WHITENESS_THRESHOLD, NOTSKY, the detection scale and the number of boxes
+  (N_BOXES),
+- the box algorithm version (BOX_ALGORITHM_VERSION in
+  cloudtop_pixel_heights.py, to be bumped whenever the boxes found change).
+
+Putting a new entry for a photo drops any older entries for the same path,
+entries from other algorithm versions are dropped when the cache is read, and
+once there are more than max_entries the least recently used are evicted when
+the cache is saved. The cache is kept as columns of numpy arrays in a single
+.npz file, which is replaced atomically on saving.
+
+A hit does not draw the boxed image again; the one saved when the boxes were
+first found is left as it was. The scripts using the cache treat a hit for a
+photo whose boxed image is missing (e.g. images2 was cleared) as a miss, so
+the image that image_pairs.py reads is always drawn. THICKNESS only changes
+the boxed images, so it is not part of the key: clear images2 after changing
+it.
+
+"""
+# import modules
+import os
+import time
+import numpy as np
+
+
+class BoxCache:
+    """
+    Cache of the find_contours output for each photo and set of settings.
+
+    Attributes:
+        cache_file (str): The .npz file the cache is kept in.
+        version (int): Box algorithm version of the entries.
+        max_entries (int): Most entries kept when saving.
+        hits (int): Number of lookups found in the cache.
+        misses (int): Number of lookups not found.
+        evictions (int): Number of entries dropped to keep to max_entries.
+    """
+
+    def __init__(self, cache_file, version, max_entries=500000):
+        """
+        Read the cache file if there is one.
+        """
+        self.cache_file = cache_file
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._boxes = {}
+        self._last_used = {}
+        self._paths = {}
+        if os.path.exists(cache_file):
+            self._read()
+
+    def _read(self):
+        """
+        Load the entries for this algorithm version from the cache file.
+        """
+        with np.load(self.cache_file) as columns:
+            if 'n_boxes' not in columns.files:
+                # Written before the number of boxes was in the key
+                return
+            keep = columns['version'] == self.version
+            keys = zip(columns['path'][keep], columns['size'][keep],
+                       columns['mtime_ns'][keep], columns['threshold'][keep],
+                       columns['nosky'][keep], columns['scale'][keep],
+                       columns['n_boxes'][keep])
+            for key, boxes, last_used in zip(keys, columns['boxes'][keep],
+                                             columns['last_used'][keep]):
+                key = (str(key[0]),) + tuple(int(value) for value in key[1:])
+                self._add(key, tuple(int(value) for value in boxes),
+                          float(last_used))
+
+    def _add(self, key, boxes, last_used):
+        """
+        Add an entry, dropping older entries for the same photo path.
+        """
+        old = self._paths.get(key[0])
+        if old is not None and old != key:
+            self._boxes.pop(old, None)
+            self._last_used.pop(old, None)
+        self._paths[key[0]] = key
+        self._boxes[key] = boxes
+        self._last_used[key] = last_used
+
+    @staticmethod
+    def key(fname, WHITENESS_THRESHOLD, NOSKY, scale=1, n_boxes=2):
+        """
+        Cache key of a photo: (path, size, mtime in ns, whiteness threshold,
+        NOSKY row, scale, number of boxes).
+        """
+        stat = os.stat(fname)
+        return (os.path.abspath(fname), int(stat.st_size),
+                int(stat.st_mtime_ns), int(WHITENESS_THRESHOLD), int(NOSKY),
+                int(scale), int(n_boxes))
+
+    def get(self, fname, WHITENESS_THRESHOLD, NOSKY, scale=1, n_boxes=2):
+        """
+        Look up the boxes of a photo.
+
+        Returns:
+        - tuple: The eight find_contours values, or None if not cached.
+        """
+        key = self.key(fname, WHITENESS_THRESHOLD, NOSKY, scale, n_boxes)
+        if key not in self._boxes:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._last_used[key] = time.time()
+        return self._boxes[key]
+
+    def put(self, fname, WHITENESS_THRESHOLD, NOSKY, cloudbox, scale=1,
+            n_boxes=2):
+        """
+        Store the eight find_contours values for a photo.
+        """
+        key = self.key(fname, WHITENESS_THRESHOLD, NOSKY, scale, n_boxes)
+        self._add(key, tuple(int(value) for value in cloudbox), time.time())
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def save(self):
+        """
+        Write the cache file, evicting the least recently used entries over
+        max_entries.
+        """
+        keys = sorted(self._boxes, key=self._last_used.get, reverse=True)
+        for key in keys[self.max_entries:]:
+            del self._boxes[key]
+            del self._last_used[key]
+            del self._paths[key[0]]
+            self.evictions += 1
+        keys = keys[:self.max_entries]
+        folder = os.path.dirname(self.cache_file)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        columns = {
+            'path': np.array([key[0] for key in keys], dtype=str),
+            'size': np.array([key[1] for key in keys], dtype=np.int64),
+            'mtime_ns': np.array([key[2] for key in keys], dtype=np.int64),
+            'threshold': np.array([key[3] for key in keys], dtype=np.int32),
+            'nosky': np.array([key[4] for key in keys], dtype=np.int32),
+            'scale': np.array([key[5] for key in keys], dtype=np.int8),
+            'n_boxes': np.array([key[6] for key in keys], dtype=np.int32),
+            'version': np.full(len(keys), self.version, dtype=np.int32),
+            'boxes': np.array([self._boxes[key] for key in keys],
+                              dtype=np.int32).reshape(-1, 8),
+            'last_used': np.array([self._last_used[key] for key in keys],
+                                  dtype=np.float64)}
+        # Write to a temporary file then swap it in so a crash can't leave a
+        # half written cache
+        tmp_file = self.cache_file + '.tmp.npz'
+        np.savez(tmp_file, **columns)
+        os.replace(tmp_file, self.cache_file)
+
+    def report(self):
+        """
+        Print the hit and miss counts.
+        """
+        print(f'box cache: {self.hits} hits, {self.misses} misses, '
+              f'{self.evictions} evicted, {len(self)} entries')
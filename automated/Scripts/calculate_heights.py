@@ -23,28 +23,29 @@ The output of these scripts is csv file of time series of cloud heights and
 scatter plots of cloud top heights vs time. for completeness the cloud base
 and x loc is also stored
 
+The functions can also be imported (see stream_pipeline.py which works out
+the heights photo by photo without the intermediate csv files).
+
 """
 # Import modules
 import sys
 import math
-from datetime import datetime
 import pandas as pd
-import matplotlib.pyplot as plt
+import os
 import numpy as np
-from matplotlib.dates import DateFormatter
-
-
-# Extract arguments
-camera = int(sys.argv[1])
-date_to_use = str(sys.argv[2])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'StandAloneTools'))
+from camera_details import camera_details
+from time_matching import nearest_time_join, parse_pixel_times
 
-# Processing date format
-parts = date_to_use.split('-')
-date = parts[-1]+'-'+parts[1]+'-'+parts[0]
 
 # File storage path
 storage = '/home/users/hburns/GWS/DCMEX/users/hburns/'
 
+# Largest time difference allowed between a photo and the optical depth scan
+# matched to it (None matches the nearest scan whatever the difference)
+MATCH_TOLERANCE = None
+
 # Camera info
 # https://www.digicamdb.com/specs/canon_eos-6d-mark-ii/
 #
@@ -82,14 +83,6 @@ fov_horizontal_deg = math.degrees(fov_horizontal_rad)
 fov_vertical_deg = math.degrees(fov_vertical_rad)
 FOV = fov_vertical_deg
 
-# Displaying FOV angles
-print("FOV Horizontal Angle:", fov_horizontal_deg, "degrees")
-print("FOV Vertical Angle:", fov_vertical_deg, "degrees")
-
-# Reading camera details and cloud data
-cam_details = storage+'/camera_details.csv'
-cam_df = pd.read_csv(cam_details)
-
 # Function to find height of an object given its pixel position on the sensor
 
 
@@ -98,8 +91,8 @@ def find_height(P, Distance, focal_length_mm, sensor_height_mm):
     Calculate the height of an object given its pixel position on the sensor.
 
     Parameters:
-    - P: Pixel position of the object on the sensor
-    - Distance: Distance to the object in millimeters
+    - P: Pixel position of the object on the sensor (scalar or array)
+    - Distance: Distance to the object in millimeters (scalar or array)
     - focal_length_mm: Focal length of the camera lens in millimeters
     - sensor_height_mm: Height of the camera sensor in millimeters
 
@@ -108,7 +101,7 @@ def find_height(P, Distance, focal_length_mm, sensor_height_mm):
     """
     OHS = find_OHS(P, sensor_height_mm)
     H = (Distance * 10**3 * OHS) / focal_length_mm
-    return round(H / 10**3, 2)
+    return np.round(H / 10**3, 2)
 
 # Object height on sensor =  (Sensor height (mm) × Object height (pixels))
 #                                      / Sensor height (pixels)
@@ -124,7 +117,7 @@ def find_OHS(P, sensor_height_mm):
     Calculate the Object Height on Sensor.
 
     Parameters:
-    - P: Pixel position of the object on the sensor
+    - P: Pixel position of the object on the sensor (scalar or array)
     - sensor_height_mm: Height of the camera sensor in millimeters
 
     Returns:
@@ -142,7 +135,7 @@ def pitch_correct(P, FieldOfView, h):
     Parameters:
     - P: Pixel position of the object on the sensor
     - FieldOfView: Field of View of the camera in degrees
-    - h: Height on the inclined plane
+    - h: Height on the inclined plane (scalar or array)
 
     Returns:
     - True height after pitch correction
@@ -153,228 +146,206 @@ def pitch_correct(P, FieldOfView, h):
     # image plane incline from vertical
     c = 180 - a - b
     # x is true height, h is height on incled place
-    x = h * math.cos(math.radians(c))
+    x = h * np.cos(np.radians(c))
     return x
 
 
-# Filtering camera details for the given date and camera
-filtered_df = cam_df[(cam_df['Date'] == date) & (cam_df['camera'] == camera)]
-yaw_degrees = filtered_df.yaw.values[0]
-pitch = filtered_df.pitch.values[0]
-camera_height = filtered_df.height.values[0]/1000
-cloud_distances = pd.read_csv(storage + '/results/' + date_to_use +
-                              '/Cloud_distnaces_camera_' + str(camera) +
-                              '.csv')
-cloud_pixels = pd.read_csv(storage + '/results/' + date_to_use +
-                           '/cloud_pixels_camera_' + str(camera) + '.csv')
-
-# Formatting date and time
-date_format_distances = '%Y-%m-%dT%H:%M:%S'
-date_format_pixels = '%Y-%m-%dT%H%M%S'
-date_object_distances = datetime.strptime(
-    cloud_distances.Datetimes.iloc[0].split('.')[0], date_format_distances)
-date_object_pixels = datetime.strptime(
-    date_to_use+'T'+str(cloud_pixels.Times.iloc[0]), date_format_pixels)
-
-# Adding Date_Time columns to DataFrames
-cloud_distances['Date_Time'] = pd.to_datetime(cloud_distances.Datetimes)
-cloud_pixels['Date_Time'] = ''
-for index, row in cloud_pixels.iterrows():
-    cloud_pixels['Date_Time'].iloc[index] = datetime.strptime(
-        date_to_use+'T'+str(cloud_pixels.Times.iloc[index]),
-        date_format_pixels)
-
-# Matching cloud distances to corresponding pixels
-cloud_pixels['Distance'] = ''
-for index, row in cloud_pixels.iterrows():
-    timestamp1 = row.Date_Time
-
-    # Iterate through files in folder2 to find the closest match
-    closest_file2 = None
-    closest_time_difference = float('inf')
-    for index2, row2 in cloud_distances.iterrows():
-
-        timestamp2 = row2.Date_Time
-        time_difference = abs((timestamp1 - timestamp2).total_seconds())
-
-        if time_difference < closest_time_difference:
-            closest_time_difference = time_difference
-            closest_file2 = row2
-
-    # Load images and create a subplot
-    if closest_file2 is not None:
-        cloud_pixels['Distance'].iloc[index] = closest_file2.Distance
-
-
-# Filtering cloud dataframe based on distance criteria
-try:
-    condition = (cloud_pixels['Distance'] > 30) | (
-        cloud_pixels['Distance'] < 10)
-except TypeError:
-    cloud_pixels = cloud_pixels[cloud_pixels != 'no cloud']
-    cloud_pixels['Distance'] = pd.to_numeric(cloud_pixels['Distance'])
+def cloud_heights(df_filtered, pitch, camera_height):
+    """
+    Calculate the cloud top and base heights for every photo in one pass.
+
+    Parameters:
+    - df_filtered: cloud pixels DataFrame with Date_Time and Distance columns
+    - pitch: Pitch of the camera in degrees
+    - camera_height: Height of the camera in kilometers
+
+    Returns:
+    - DataFrame of cloud top and base heights, pixel rows, widths and x
+      locations of the two boxes and the max cloud top height, with the
+      columns in the order the heights csv has always had them (including
+      the empty CTBP2 column)
+    """
+    distance = df_filtered.Distance.to_numpy(dtype=float)
+
+    def corrected_height(pixels):
+        # Height above the camera pitch corrected and offset to sea level
+        height = find_height(4160 - pixels.to_numpy(dtype=float), distance,
+                             focal_length_mm, sensor_height_mm)
+        return np.round(pitch_correct(pitch, FOV, height) + camera_height, 2)
+
+    CTH1 = corrected_height(df_filtered.CB1)
+    CBH1 = corrected_height(df_filtered.CT2)
+    CTH2 = corrected_height(df_filtered.CB2)
+    CBH2 = corrected_height(df_filtered.CT1)
+    return pd.DataFrame({
+        'Time': df_filtered.Date_Time.to_numpy(),
+        'distance_to_cloud': distance,
+        'CT1': CTH2, 'CT2': CTH1, 'CB1': CBH1, 'CB2': CBH2,
+        'CTP1': df_filtered.CB2.to_numpy(), 'CTP2': df_filtered.CB1.to_numpy(),
+        'CBP1': df_filtered.CT2.to_numpy(),
+        'CTBP2': np.full(len(distance), np.nan),
+        'W1': df_filtered.W1.to_numpy(), 'W2': df_filtered.W2.to_numpy(),
+        'X1': df_filtered.CX1.to_numpy(), 'X2': df_filtered.CX2.to_numpy(),
+        'MAXCTH': np.fmax(CTH1, CTH2),
+        # CBP2 has always come last, after the never filled (misspelt) CTBP2
+        'CBP2': df_filtered.CT1.to_numpy()})
+
+
+def camera_date(date_to_use):
+    """
+    Convert a 'yyyy-mm-dd' date to the 'dd-mm-yyyy' used in camera_details.csv.
+    """
+    parts = date_to_use.split('-')
+    return parts[-1]+'-'+parts[1]+'-'+parts[0]
+
+
+def load_camera_details(camera, date_to_use):
+    """
+    Read the pitch and height of a camera on a given day.
+
+    Parameters:
+    - camera: Camera number 1 or 2
+    - date_to_use: Date string 'yyyy-mm-dd'
+
+    Returns:
+    - Pitch of the camera in degrees and height of the camera in kilometers
+    """
+    # Camera details are read once per process
+    details = camera_details(camera, date_to_use,
+                             csv_file=storage+'/camera_details.csv')
+    return details.pitch, details.height/1000
+
+
+def filter_distances(cloud_pixels):
+    """
+    Keep the photos matched to a cloud between 10 and 30 km from the camera.
+
+    Parameters:
+    - cloud_pixels: cloud pixels DataFrame with a Distance column
+
+    Returns:
+    - Filtered DataFrame with a numeric Distance column and a new index
+    """
+    # ('no cloud'/'none' distances become NaN)
+    cloud_pixels['Distance'] = pd.to_numeric(cloud_pixels['Distance'],
+                                             errors='coerce')
     condition = (cloud_pixels['Distance'] > 30) | (
         cloud_pixels['Distance'] < 10)
+    df_filtered = cloud_pixels[~condition]
+    return df_filtered.reset_index(drop=True)
 
 
-df_filtered = cloud_pixels[~condition]
-# Initializing DataFrame for processed data
-df_filtered = df_filtered.reset_index(drop=True)
-df2 = pd.DataFrame(index=range(len(df_filtered)), columns=[
-                   'Time', 'distance_to_cloud', 'CT1', 'CT2', 'CB1', 'CB2',
-                   'CTP1', 'CTP2', 'CBP1', 'CTBP2', 'W1', 'W2', 'X1', 'X2',
-                   'MAXCTH'])
-
-# Processing cloud data to calculate heights and distances
-for row in df_filtered.itertuples():
-    CT2 = row.CT1
-    CT1 = row.CT2
-    W1 = row.W1
-    X1 = row.CX1
-    CB1 = row.CB1
-    W2 = row.W2
-    X2 = row.CX2
-    CB2 = row.CB2
-    hb1 = find_height(4160-CT1, row.Distance,
-                      focal_length_mm, sensor_height_mm)
-    ht1 = find_height(4160-CB1, row.Distance,
-                      focal_length_mm, sensor_height_mm)
-    CTH1 = round(pitch_correct(pitch, FOV, ht1) + camera_height, 2)
-    CBH1 = round(pitch_correct(pitch, FOV, hb1) + camera_height, 2)
-    hb2 = find_height(4160-CT2, row.Distance,
-                      focal_length_mm, sensor_height_mm)
-    ht2 = find_height(4160-CB2, row.Distance,
-                      focal_length_mm, sensor_height_mm)
-    CTH2 = round(pitch_correct(pitch, FOV, ht2) + camera_height, 2)
-    CBH2 = round(pitch_correct(pitch, FOV, hb2) + camera_height, 2)
-    df2.at[row.Index, 'Time'] = row.Date_Time
-    df2.at[row.Index, 'distance_to_cloud'] = row.Distance
-    df2.at[row.Index, 'CT1'] = CTH2
-    df2.at[row.Index, 'CB1'] = CBH1
-    df2.at[row.Index, 'CTP1'] = CB2
-    df2.at[row.Index, 'CBP1'] = CT1
-    df2.at[row.Index, 'X1'] = X1
-    df2.at[row.Index, 'W1'] = W1
-    df2.at[row.Index, 'CT2'] = CTH1
-    df2.at[row.Index, 'CB2'] = CBH2
-    df2.at[row.Index, 'CTP2'] = CB1
-    df2.at[row.Index, 'CBP2'] = CT2
-    df2.at[row.Index, 'X2'] = X2
-    df2.at[row.Index, 'W2'] = W2
-    df2.at[row.Index, 'MAXCTH'] = np.nanmax([CTH1, CTH2])
-
-# -------------------------------- Plots and CSV ----------------------------- #
-print('saving to '+storage+'/results/'+date_to_use+'/'+date_to_use+'_camera_'+str(camera)+'_cloud_top_heights.csv')
-df2.to_csv(storage+'/results/'+date_to_use+'/'+date_to_use+'_camera_'+str(camera)+'_cloud_top_heights.csv')
-# Configuring plot font size
-plt.rcParams['font.size'] = 16
-
-# Plotting and saving various scatter plots
-# Each plot corresponds to different aspects of cloud height, base, distance,
-# and pixel coordinates
-
-# Plot 1: Cloud Top Height 1 vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['CT1'], marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('Height (km)')
-axs.set_title('Max estimated cloud top height in photo for ' + date +
-              '\n camera: ' + str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' + date_to_use +
-            '_camera_'+str(camera) + '_cloud_top_height1.png')
-plt.close('all')
-
-# Plot 2: Max Cloud Top Height vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['MAXCTH'], marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('Height (km)')
-axs.set_title('Max estimated cloud top height in photo for ' + date +
-              '\n camera: ' + str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' + date_to_use +
-            '_camera_' + str(camera) + '_cloud_top_height_max_height.png')
-plt.close('all')
-
-# Plot 3: Cloud Top Height2 vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['CT2'], marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('Height (km)')
-axs.set_title('Max estimated cloud top height in photo for '+date +
-              '\n camera: '+str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' +
-            date_to_use + '_camera_'+str(camera)+'_cloud_top_height2.png')
-plt.close('all')
-
-# Plot 4: Max Cloud Base Height1 vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['CB1'], marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('Height (km)')
-axs.set_title('Max estimated cloud base height in photo for '+date +
-              '\n camera: '+str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' +
-            date_to_use + '_camera_'+str(camera)+'_cloud_base_height1.png')
-plt.close('all')
-
-# Plot 5: Max Cloud Base Height2 vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['CB2'], marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('Height (km)')
-axs.set_title('Max estimated cloud base height in photo for '+date +
-              '\n camera: '+str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' +
-            date_to_use + '_camera_'+str(camera)+'_cloud_base_height2.png')
-plt.close('all')
-
-# Plot 6: Distance to cloud vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['distance_to_cloud'], marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('Distance (km)')
-axs.set_title('Distance between camera and max optical depth for  '+date +
-              '\n camera: '+str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' +
-            date_to_use + '_camera_'+str(camera)+'_distance_vs_time.png')
-plt.close('all')
-
-# Plot 7: hotrizontal point of cloud box vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['X1']+df2['W1']/2, marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('pixels from left corner')
-axs.set_title('Horizontal pixel co-ordinate for center of box round clound  '
-              + date+'\n camera: '+str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' +
-            date_to_use + '_camera_'+str(camera) +
-            '_horizontal_movement_vs_time1.png')
-plt.close('all')
-
-# Plot 8: hotrizontal point of cloud box vs. Time
-fig, axs = plt.subplots(figsize=(20, 20))
-plt.scatter(df2['Time'], df2['X2']+df2['W2']/2, marker='o',)
-axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
-axs.set_xlabel('Time')
-axs.set_ylabel('pixels from left corner')
-axs.set_title('Horizontal pixel co-ordinate for center of box round clound  '
-              + date+'\n camera: '+str(camera))
-plt.xticks(rotation=45)
-plt.savefig(storage + 'results/' + date_to_use + '/' +
-            date_to_use + '_camera_'+str(camera) +
-            '_horizontal_movement_vs_time2.png')
-plt.close('all')
+def heights_csv(camera, date_to_use, outroot=None):
+    """
+    Path of the cloud top heights csv for a camera and day.
+    """
+    if outroot is None:
+        outroot = storage+'/results/'+date_to_use+'/'
+    return outroot+date_to_use+'_camera_'+str(camera)+'_cloud_top_heights.csv'
+
+
+def plot_heights(df2, camera, date_to_use, outroot=None):
+    """
+    Plot and save the scatter plots of cloud heights, distance and horizontal
+    position against time.
+
+    Each plot corresponds to different aspects of cloud height, base,
+    distance, and pixel coordinates.
+
+    Parameters:
+    - df2: DataFrame returned by cloud_heights
+    - camera: Camera number 1 or 2
+    - date_to_use: Date string 'yyyy-mm-dd'
+    - outroot: Folder to save the plots to (default: the day's results folder)
+    """
+    # Only imported when plots are drawn
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+    if outroot is None:
+        outroot = storage + 'results/' + date_to_use + '/'
+    date = camera_date(date_to_use)
+    # Configuring plot font size
+    plt.rcParams['font.size'] = 16
+    top_title = ('Max estimated cloud top height in photo for ' + date +
+                 '\n camera: ' + str(camera))
+    base_title = ('Max estimated cloud base height in photo for ' + date +
+                  '\n camera: ' + str(camera))
+    x_title = ('Horizontal pixel co-ordinate for center of box round clound  '
+               + date + '\n camera: ' + str(camera))
+    # (y values, y label, title, file name ending) of each plot
+    plots = [
+        # Plot 1: Cloud Top Height 1 vs. Time
+        (df2['CT1'], 'Height (km)', top_title, '_cloud_top_height1.png'),
+        # Plot 2: Max Cloud Top Height vs. Time
+        (df2['MAXCTH'], 'Height (km)', top_title,
+         '_cloud_top_height_max_height.png'),
+        # Plot 3: Cloud Top Height2 vs. Time
+        (df2['CT2'], 'Height (km)', top_title, '_cloud_top_height2.png'),
+        # Plot 4: Max Cloud Base Height1 vs. Time
+        (df2['CB1'], 'Height (km)', base_title, '_cloud_base_height1.png'),
+        # Plot 5: Max Cloud Base Height2 vs. Time
+        (df2['CB2'], 'Height (km)', base_title, '_cloud_base_height2.png'),
+        # Plot 6: Distance to cloud vs. Time
+        (df2['distance_to_cloud'], 'Distance (km)',
+         'Distance between camera and max optical depth for  ' + date +
+         '\n camera: ' + str(camera), '_distance_vs_time.png'),
+        # Plot 7: hotrizontal point of cloud box vs. Time
+        (df2['X1']+df2['W1']/2, 'pixels from left corner', x_title,
+         '_horizontal_movement_vs_time1.png'),
+        # Plot 8: hotrizontal point of cloud box vs. Time
+        (df2['X2']+df2['W2']/2, 'pixels from left corner', x_title,
+         '_horizontal_movement_vs_time2.png')]
+    for values, ylabel, title, ending in plots:
+        fig, axs = plt.subplots(figsize=(20, 20))
+        plt.scatter(df2['Time'], values, marker='o',)
+        axs.xaxis.set_major_formatter(DateFormatter('%H:%M'))
+        axs.set_xlabel('Time')
+        axs.set_ylabel(ylabel)
+        axs.set_title(title)
+        plt.xticks(rotation=45)
+        plt.savefig(outroot + date_to_use + '_camera_' + str(camera) + ending)
+        plt.close('all')
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    # Extract arguments
+    camera = int(sys.argv[1])
+    date_to_use = str(sys.argv[2])
+
+    # Displaying FOV angles
+    print("FOV Horizontal Angle:", fov_horizontal_deg, "degrees")
+    print("FOV Vertical Angle:", fov_vertical_deg, "degrees")
+
+    # Reading camera details and cloud data
+    pitch, camera_height = load_camera_details(camera, date_to_use)
+    cloud_distances = pd.read_csv(storage + '/results/' + date_to_use +
+                                  '/Cloud_distnaces_camera_' + str(camera) +
+                                  '.csv')
+    cloud_pixels = pd.read_csv(storage + '/results/' + date_to_use +
+                               '/cloud_pixels_camera_' + str(camera) + '.csv')
+
+    # Adding Date_Time columns to DataFrames
+    cloud_distances['Date_Time'] = pd.to_datetime(cloud_distances.Datetimes)
+    cloud_pixels['Date_Time'] = parse_pixel_times(date_to_use,
+                                                  cloud_pixels.Times)
+
+    # Matching cloud distances to corresponding pixels
+    cloud_pixels = nearest_time_join(cloud_pixels, cloud_distances,
+                                     ['Distance'], tolerance=MATCH_TOLERANCE)
+
+    # Filtering cloud dataframe based on distance criteria
+    df_filtered = filter_distances(cloud_pixels)
+    # Processing cloud data to calculate heights and distances
+    df2 = cloud_heights(df_filtered, pitch, camera_height)
+
+    # ----------------------------- Plots and CSV -------------------------- #
+    print('saving to ' + heights_csv(camera, date_to_use))
+    df2.to_csv(heights_csv(camera, date_to_use))
+    plot_heights(df2, camera, date_to_use)
+
+
+if __name__ == "__main__":
+    main()
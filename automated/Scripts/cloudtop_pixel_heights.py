@@ -17,6 +17,20 @@ the optical depth script returned if there was a cloud that day. If so then
 uses OpenCV to find the edge of the cloud and draws a box over the two largest
 contours and writes information to csv file.
 
+With DETECT_SCALE (or the scale argument of find_contours) set to 4 or 8 the
+contours are found in a 1/4 or 1/8 size copy of each photo decoded straight
+from the JPEG, and only strips round the top and bottom of each box are
+looked at again in a 1/2 size copy (REFINE_SCALE). The full size photo is
+only decoded when the boxed image is saved. The cloud top and base rows then
+agree with the full size detection to within 2 pixels whenever the same
+cloud is found at both sizes, while the x location and width are only as
+accurate as the reduced photo (within 2 x scale pixels). Clouds only a few
+pixels apart can join up into one contour in the reduced photo, which gives a
+bigger box.
+
+The functions can also be imported (see batch_cloud_pixels.py for running
+many days and both cameras over a process pool).
+
 """
 
 # import modules
@@ -25,125 +39,473 @@ import os
 import sys
 from datetime import datetime
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
-from skimage import color
-from skimage import io
 import cv2
-
-# Extract arguments
-camera = int(sys.argv[1])
-date_to_use = str(sys.argv[2])
+from box_cache import BoxCache
 
 # Set Constants for edge detection:
-# How white vs grey (this might need to be set by trial and error)    
+# How white vs grey (this might need to be set by trial and error)
 WHITENESS_THRESHOLD = 115
 # line thickness of box
 THICKNESS = 16
 # The part of every photo is just ground set to 0 if whole photo is cloud
 NOTSKY = 3800
+# Number of boxes drawn round the largest clouds (the csv has the two largest)
+N_BOXES = 2
+# Find the boxes in the photo decoded at 1/DETECT_SCALE size (1, 2, 4 or 8).
+# The top and bottom rows of the boxes are then found again at
+# 1/REFINE_SCALE size.
+DETECT_SCALE = 1
+# JPEG decoding straight to a reduced size for each DETECT_SCALE
+REDUCED_READ = {2: cv2.IMREAD_REDUCED_COLOR_2,
+                4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8}
+# The top and bottom rows of boxes found in a reduced photo are found again in
+# the photo decoded at 1/REFINE_SCALE size (a third of the time of a full
+# size decode)
+REFINE_SCALE = 2
 # Set file paths and directories
 storage = '/home/users/hburns/GWS/DCMEX/users/hburns/'
-imgroot = os.path.join(storage, "images2/cloud_top_heights", 
-                        date_to_use, str(camera))
-result_root = os.path.join(storage, 'results2', date_to_use)
 dataroot = '/gws/nopw/j04/dcmex/data'
+# Cache of the boxes found in each photo (see box_cache.py). Bump the version
+# whenever a change to find_contours changes the boxes it finds.
+BOX_CACHE_FILE = os.path.join(storage, 'cache', 'cloud_boxes.npz')
+BOX_ALGORITHM_VERSION = 2
+
+
+def image_root(camera, date_to_use):
+    """
+    Folder the boxed cloud images for a camera and day are written to.
+    """
+    return os.path.join(storage, "images2/cloud_top_heights",
+                        date_to_use, str(camera))
+
+
+def results_root(date_to_use):
+    """
+    Folder the results csv files for a day are written to.
+    """
+    return os.path.join(storage, 'results2', date_to_use)
+
+
+def setup_directories(camera, date_to_use):
+    """
+    Create the image and results directories if they don't exist.
+    """
+    for folder in [image_root(camera, date_to_use),
+                   results_root(date_to_use)]:
+        if not os.path.exists(folder):
+            # If it doesn't exist, create it
+            os.makedirs(folder)
+
+
+def find_image_files(camera, date_to_use):
+    """
+    List the photos taken by a camera on a given day.
+
+    Parameters:
+    - camera (int): Camera number 1 or 2.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+
+    Returns:
+    - list: File paths of the amof-cam jpgs for that camera and day.
+    """
+    # Choose file paths based on the camera
+    if camera == 2:
+        return glob.glob(dataroot + '/stereocams/' + date_to_use +
+                         '/secondary_red/amof-cam-2-' + date_to_use +
+                         '-*.jpg')
+    return glob.glob(dataroot + '/stereocams/' + date_to_use +
+                     '/primary_blue/amof-cam-1-' + date_to_use + '-*.jpg')
+
+
+def extract_image_times(fnames):
+    """
+    Extract date and time information from amof-cam file names.
+
+    Parameters:
+    - fnames (list): File paths of the amof-cam jpgs.
+
+    Returns:
+    - time_list (list): 'HHMMSS' strings for each file.
+    - datetime_objects (list): datetime of each file to the minute.
+    """
+    time_list = []
+    datetime_objects = []
+    for file_name in fnames:
+        parts = os.path.splitext(os.path.basename(file_name))[0].split('-')
+        yyyy, mm, dd, hhmmss = parts[3], parts[4], parts[5], parts[6]
+        date_time = datetime.strptime(f"{yyyy}-{mm}-{dd}-{hhmmss}",
+                                      "%Y-%m-%d-%H%M%S")
+        # Formatting time and truncating to the minute
+        time_list.append(date_time.strftime("%H%M%S"))
+        datetime_objects.append(date_time.replace(second=0))
+    return time_list, datetime_objects
+
+
+def load_cloud_distances(camera, date_to_use):
+    """
+    Read cloud distances CSV and convert Date_Time column to datetime.
+    """
+    cloud_distances = pd.read_csv(os.path.join(
+        results_root(date_to_use),
+        'Cloud_distnaces_camera_' + str(camera) + '.csv'))
+    # Rows with no scan time (e.g. no optical depth data) become NaT
+    cloud_distances['Date_Time'] = pd.to_datetime(cloud_distances.Datetimes,
+                                                  errors='coerce')
+    return cloud_distances
+
+
+# -------- Functions to select photos with clouds and detect edges ---------  #
+def select_cloudy_images(datetime_objects, cloud_distances):
+    """
+    Find which photos were taken when the optical depth script found a cloud
+    between 10 and 30 km from the camera.
+
+    Parameters:
+    - datetime_objects (list): datetime of each photo.
+    - cloud_distances (pd.DataFrame): Output of optical_depth_plotter.py with
+      a Date_Time column.
+
+    Returns:
+    - list: Indices of the photos to find contours in.
+
+    Note:
+    - Each photo is matched to the closest time in cloud_distances (the
+      earlier one if two are as close, as np.argmin of the absolute time
+      differences gives), for all the photos at once with np.searchsorted.
+    - 'none', 'no cloud' or missing distances are never kept.
+    """
+    times = cloud_distances.Date_Time.to_numpy(dtype='datetime64[ns]')
+    distances = pd.to_numeric(cloud_distances.Distance,
+                              errors='coerce').to_numpy(dtype=float)
+    photos = np.array(datetime_objects, dtype='datetime64[ns]')
+    valid = ~np.isnat(times)
+    times = times[valid]
+    distances = distances[valid]
+    if len(times) == 0 or len(photos) == 0:
+        return []
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    distances = distances[order]
+    # Closest time either side of each photo
+    right = np.minimum(np.searchsorted(times, photos), len(times) - 1)
+    left = np.searchsorted(times, times[np.maximum(right - 1, 0)])
+    use_left = np.abs(photos - times[left]) <= np.abs(times[right] - photos)
+    closest = np.where(use_left, left, right)
+    check = distances[closest]
+    return np.flatnonzero((check >= 10) & (check <= 30)).tolist()
+
+
+def report_plan(keep, fnames):
+    """
+    Print how many of the day's photos will be processed and how many skipped.
+    """
+    print(f'{len(keep)} of {len(fnames)} photos have cloud 10-30 km away '
+          f'({len(fnames) - len(keep)} skipped)')
+
+
+def bounding_rects(contours):
+    """
+    Bounding rectangles of all the contours at once.
+
+    Parameters:
+    - contours (tuple): Contours from cv2.findContours, (n, 1, 2) arrays.
+
+    Returns:
+    - numpy.ndarray: (len(contours), 4) int array of x, y, w, h as given by
+      cv2.boundingRect for each contour.
+    """
+    if len(contours) == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    starts = np.zeros(len(contours), dtype=np.int64)
+    starts[1:] = np.cumsum([len(contour) for contour in contours])[:-1]
+    lower = np.minimum.reduceat(points, starts)
+    upper = np.maximum.reduceat(points, starts)
+    return np.column_stack((lower, upper - lower + 1))
+
+
+def largest_boxes(contours, n_boxes=N_BOXES, return_index=False):
+    """
+    Find the bounding boxes with the largest areas.
+
+    Parameters:
+    - contours (tuple): Contours from cv2.findContours.
+    - n_boxes (int): Number of boxes to find.
+    - return_index (bool): Also return the index of each box's contour.
+
+    Returns:
+    - numpy.ndarray: Up to n_boxes rows of x, y, w, h, largest area first.
+      Every box has a different area (boxes the same size as a larger one
+      are skipped), so fewer rows are returned if there are fewer sizes.
+    - numpy.ndarray: Index into contours of each box (if return_index).
+
+    Notes:
+    - The areas are only partly sorted (np.argpartition) so the time taken
+      grows linearly with the number of contours.
+    - Where several boxes have the same area the one chosen is the one that
+      sorting the contours by cv2.contourArea and keeping the last box of
+      each area would choose (the smallest contour area, then the last
+      contour).
+    """
+    rects = bounding_rects(contours)
+    areas = rects[:, 2] * rects[:, 3]
+    n_rects = len(areas)
+    if n_rects == 0 or n_boxes < 1:
+        if return_index:
+            return rects[:0], np.zeros(0, dtype=np.int64)
+        return rects[:0]
+    # Take more of the largest areas until there are n_boxes different ones
+    n_top = min(n_boxes, n_rects)
+    while True:
+        top = np.argpartition(areas, n_rects - n_top)[n_rects - n_top:]
+        sizes = np.unique(areas[top])[::-1]
+        if len(sizes) >= n_boxes or n_top == n_rects:
+            break
+        n_top = min(2 * n_top, n_rects)
+    chosen = []
+    for size in sizes[:n_boxes]:
+        same = np.flatnonzero(areas == size)
+        if len(same) > 1:
+            contour_areas = np.array([cv2.contourArea(contours[i])
+                                      for i in same])
+            # Smallest contour area, last contour if still tied
+            same = same[contour_areas == np.min(contour_areas)]
+        chosen.append(same[-1])
+    chosen = np.array(chosen, dtype=np.int64)
+    if return_index:
+        return rects[chosen], chosen
+    return rects[chosen]
+
+
+def cloud_edges(img, WHITENESS_THRESHOLD, NOSKY, out=None):
+    """
+    Canny edges round the white (cloud) parts of a photo above row NOSKY.
+
+    Parameters:
+    - img (numpy.ndarray): (rows, columns, 3) uint8 photo.
+    - WHITENESS_THRESHOLD (int): Every channel has to be above this.
+    - NOSKY (int): First row that is ground.
+    - out (tuple): (mask, blur, edges) uint8 (rows, columns) arrays to work
+      in, new arrays are made if not given.
+
+    Returns:
+    - numpy.ndarray: uint8 edge image from cv2.Canny (the edges array of
+      out if given).
+    """
+    if out is None:
+        out = tuple(np.empty(img.shape[:2], dtype=np.uint8) for _ in range(3))
+    mask, blur, edges = out
+    # 255 where every channel is above the threshold, 0 elsewhere
+    cv2.inRange(img, (WHITENESS_THRESHOLD + 1,) * 3, (255,) * 3, dst=mask)
+    mask[max(NOSKY, 0):, :] = 0
+    cv2.GaussianBlur(mask, (5, 5), 0, dst=blur)
+    return cv2.Canny(blur, 0, 200, edges=edges)
+
+
+def edge_rows(img, row0, row1, col0, col1, WHITENESS_THRESHOLD, NOSKY,
+              pad=4):
+    """
+    Rows from row0 to row1 with cloud edges between columns col0 and col1.
+
+    A few rows either side of the strip are included when finding the edges
+    so the blur and Canny see the same pixels as for the whole photo.
+    """
+    top = max(row0 - pad, 0)
+    bottom = min(row1 + pad, img.shape[0])
+    edges = cloud_edges(img[top:bottom, col0:col1], WHITENESS_THRESHOLD,
+                        NOSKY - top)
+    rows = np.flatnonzero(edges[row0 - top:row1 - top].any(axis=1))
+    return rows + row0
 
-# Create directories if they don't exist
-if not os.path.exists(imgroot):
-    # If it doesn't exist, create it
-    os.makedirs(imgroot)
-
-if not os.path.exists(storage+'results2/'+date_to_use+'/'):
-    os.makedirs(storage+'results2/'+date_to_use+'/')
-
-# Read camera details from CSV
-cam_details = storage + '/camera_details.csv'
-cam_df = pd.read_csv(cam_details)
-
-# Choose file paths based on the camera
-if camera == 2:
-    fnames = glob.glob(dataroot + '/stereocams/' + date_to_use +
-                       '/secondary_red/amof-cam-2-' + date_to_use + '-*.jpg')
-else:
-    fnames = glob.glob(dataroot + '/stereocams/' + date_to_use +
-                       '/primary_blue/amof-cam-1-' + date_to_use + '-*.jpg')
-
-# Extract date and time information from file names
-date_list = []
-time_list = []
-hour_list = []
-for file_name in fnames:
-    parts = os.path.splitext(os.path.basename(file_name))[0].split('-')
-    yyyy, mm, dd, hhmmss = parts[3], parts[4], parts[5], parts[6]
-    date_time = datetime.strptime(f"{yyyy}-{mm}-{dd}-{hhmmss}",
-                                  "%Y-%m-%d-%H%M%S")
-    # Formatting date and time
-    formatted_date = date_time.strftime("%Y-%m-%d")
-    formatted_time = date_time.strftime("%H%M%S")
-    formatted_hours = date_time.strftime("%H%M")
-    date_list.append(formatted_date)
-    time_list.append(formatted_time)
-    hour_list.append(formatted_hours)
-
-# Extract unique dates and create datetime objects
-date_fnames = list(set(date_list))
-datetime_objects = [datetime.strptime(f'{date} {time[:2]}:{time[2:]}',
-                                      '%Y-%m-%d %H:%M') 
-                    for date, time in zip(date_list, hour_list)]
-
-
-# Read cloud distances CSV and convert Date_Time column to datetime
-cloud_distances = pd.read_csv(storage + '/results2/' + date_to_use +
-                              '/Cloud_distnaces_camera_' + str(camera) +
-                              '.csv')
-cloud_distances['Date_Time'] = pd.to_datetime(cloud_distances.Datetimes)
-
-
-# -------- Functions to select photos with clouds and detect edges ---------  # 
-# Function to find the index of the closest date in an array
-def find_closest_index(target_date, date_array):
-    """
-Find the index of the closest date in a sorted array.
-
-Parameters:
-- target_date (str or numpy.datetime64): The target date for which to find 
-  the closest match.
-- date_array (numpy.ndarray): A sorted array of dates.
-
-Returns:
-- int: The index of the closest date in the array.
-
-Note:
-- This function assumes that date_array is sorted.
-- If date_array is not sorted, the result may not be correct.
-- If there are duplicate dates, the index of the first occurrence with the 
-  minimum absolute difference is returned.
-- The function uses numpy's argmin function to find the index.
-
-Example:
-
->>> closest_index = find_closest_index(target_date, date_array)
->>> print(closest_index)
-Output: 1 (index of '2022-07-25:17:33')
-"""
-    return np.argmin(np.abs(target_date - date_array))
 
+def refine_box_rows(img, contour, scale, WHITENESS_THRESHOLD, NOSKY,
+                    img_scale=1):
+    """
+    Find the top and bottom of a cloud found in a reduced photo again in a
+    bigger copy of the photo.
+
+    Parameters:
+    - img (numpy.ndarray): Photo at 1/img_scale size.
+    - contour (numpy.ndarray): Contour of the cloud in the reduced photo.
+    - scale (int): How many times smaller the reduced photo is.
+    - NOSKY (int): First row that is ground in the full size photo.
+    - img_scale (int): How many times smaller img is than the full size
+      photo (scale or less).
+
+    Returns:
+    - tuple: x, y, w, h of the box round the cloud in full size pixels.
+      y and h come from the edges of img in strips round the top and bottom
+      of the contour, x and w from the reduced photo.
+    """
+    points = contour.reshape(-1, 2)
+    (x, y), (x_end, y_end) = points.min(axis=0), points.max(axis=0)
+    ratio = scale // img_scale
+    margin = 3 * ratio
+
+    def strip_rows(row, at_row):
+        # Edge rows of img near row, in the columns the contour is in at
+        # that row (so neighbouring clouds are left out where possible)
+        cols = points[at_row, 0]
+        col0 = max(cols.min() * ratio - margin, 0)
+        col1 = min((cols.max() + 1) * ratio + margin, img.shape[1])
+        return edge_rows(img, max(row - margin, 0), row + margin, col0, col1,
+                         WHITENESS_THRESHOLD, -(-NOSKY // img_scale))
+
+    rows = strip_rows(y * ratio, points[:, 1] <= y + 1)
+    top = rows[0] if len(rows) else y * ratio
+    rows = strip_rows((y_end + 1) * ratio, points[:, 1] >= y_end - 1)
+    bottom = rows[-1] + 1 if len(rows) else (y_end + 1) * ratio
+    return (int(x * scale), int(top * img_scale),
+            int((x_end - x + 1) * scale), int((bottom - top) * img_scale))
+
+
+class FrameProcessor:
+    """
+    Finds the cloud boxes in photos, reusing the same working arrays.
+
+    The whiteness mask, blurred mask and edges are worked out in uint8
+    arrays kept from one photo to the next (one set for each photo size), so
+    the only new full size array for each photo is the decoded photo itself.
+    With scale above 1 the photo is only decoded at full size when the boxed
+    image is saved. The boxes are drawn straight onto the decoded photo, and
+    only when the boxed image is saved.
+
+    Attributes:
+        WHITENESS_THRESHOLD (int): How white vs grey a cloud pixel is.
+        THICKNESS (int): Line thickness of the boxes.
+        NOSKY (int): First row of the photos that is ground.
+        n_boxes (int): Number of boxes to find (at least 2).
+        scale (int): Find the boxes in the photos decoded at 1/scale size
+            (1, 2, 4 or 8) and refine their top and bottom at 1/REFINE_SCALE
+            size.
+    """
+
+    def __init__(self, WHITENESS_THRESHOLD=WHITENESS_THRESHOLD,
+                 THICKNESS=THICKNESS, NOSKY=NOTSKY, n_boxes=N_BOXES,
+                 scale=DETECT_SCALE):
+        """
+        Initialize the processor with no working arrays yet.
+        """
+        self.WHITENESS_THRESHOLD = WHITENESS_THRESHOLD
+        self.THICKNESS = THICKNESS
+        self.NOSKY = NOSKY
+        self.n_boxes = max(n_boxes, 2)
+        self.scale = scale
+        self._buffers = {}
+
+    def buffers(self, shape):
+        """
+        (mask, blur, edges) uint8 working arrays for photos of a given size.
+        """
+        shape = tuple(shape[:2])
+        if shape not in self._buffers:
+            self._buffers[shape] = tuple(np.empty(shape, dtype=np.uint8)
+                                         for _ in range(3))
+        return self._buffers[shape]
+
+    def edges(self, img, NOSKY):
+        """
+        Cloud edges of a photo, in the edges working array for its size
+        (overwritten by the next photo of the same size).
+        """
+        return cloud_edges(img, self.WHITENESS_THRESHOLD, NOSKY,
+                           self.buffers(img.shape))
+
+    def find_boxes(self, fname, full_image=True):
+        """
+        Find the largest cloud boxes in a photo.
+
+        Parameters:
+        - fname (str): File path of the photo.
+        - full_image (bool): Also decode the full size photo (to draw the
+          boxes on), it is always decoded with scale 1.
+
+        Returns:
+        - img (numpy.ndarray): The full size RGB photo, None if not
+          full_image and scale is above 1.
+        - boxes (numpy.ndarray or list): x, y, w, h of each box in full size
+          pixels, largest first.
+        """
+        if self.scale == 1:
+            img = read_rgb(fname)
+            contours, _ = cv2.findContours(self.edges(img, self.NOSKY),
+                                           cv2.RETR_EXTERNAL,
+                                           cv2.CHAIN_APPROX_SIMPLE)
+            return img, largest_boxes(contours, self.n_boxes)
+        small = cv2.imread(fname, REDUCED_READ[self.scale])
+        contours, _ = cv2.findContours(
+            self.edges(small, -(-self.NOSKY // self.scale)),
+            cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        _, index = largest_boxes(contours, self.n_boxes, return_index=True)
+        refine_scale = min(REFINE_SCALE, self.scale)
+        if len(index) == 0:
+            refine_img = None
+        elif refine_scale == self.scale:
+            refine_img = small
+        else:
+            refine_img = cv2.imread(fname, REDUCED_READ[refine_scale])
+        boxes = [refine_box_rows(refine_img, contours[i], self.scale,
+                                 self.WHITENESS_THRESHOLD, self.NOSKY,
+                                 refine_scale)
+                 for i in index]
+        # Boxes of similar size can swap places once refined
+        boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+        return read_rgb(fname) if full_image else None, boxes
+
+    def find_contours(self, fname, title, imgroot, save_image=True):
+        """
+        Find the cloud boxes in a photo and optionally save the boxed image.
+
+        Returns:
+        - Tuple[int, int, int, int, int, int, int, int]: as find_contours.
+        """
+        img, boxes = self.find_boxes(fname, full_image=save_image)
+        return draw_boxes(img, boxes, title, self.THICKNESS, imgroot,
+                          save_image)
+
+
+# Frame processors made so far in this process
+_frame_processors = {}
+
+
+def frame_processor(WHITENESS_THRESHOLD=WHITENESS_THRESHOLD,
+                    THICKNESS=THICKNESS, NOSKY=NOTSKY, n_boxes=N_BOXES,
+                    scale=DETECT_SCALE):
+    """
+    The FrameProcessor for these settings, made once per process.
+    """
+    key = (WHITENESS_THRESHOLD, THICKNESS, NOSKY, max(n_boxes, 2), scale)
+    if key not in _frame_processors:
+        _frame_processors[key] = FrameProcessor(*key)
+    return _frame_processors[key]
+
+
+def read_rgb(fname):
+    """
+    Read a photo as an RGB uint8 array (as skimage.io.imread does).
+    """
+    img = cv2.imread(fname)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
 
-# Convert datetime_objects to numpy array for indexing
-array1 = np.array([np.datetime64(dt) for dt in datetime_objects])
-closest_indices = [find_closest_index(dt, cloud_distances.Date_Time.values)
-                   for dt in array1]
 
 # Function to find contours in an image
-def find_contours(fname, title, WHITENESS_THRESHOLD, THICKNESS, NOSKY):
+def find_contours(fname, title, WHITENESS_THRESHOLD, THICKNESS, NOSKY,
+                  imgroot, n_boxes=N_BOXES, scale=DETECT_SCALE,
+                  save_image=True):
     """
     Find contours in an image and draw bounding boxes around detected objects.
 
     Parameters:
     - fname (str): File path of the image to analyze.
     - title (str): Prefix for the saved images.
+    - imgroot (str): Folder to save the boxed image to.
+    - n_boxes (int): Number of boxes to draw round the largest clouds (at
+      least 2, the two largest are returned).
+    - scale (int): Find the boxes in the photo decoded at 1/scale size (1,
+      2, 4 or 8) and refine their top and bottom at 1/REFINE_SCALE size.
+    - save_image (bool): Save the photo with the boxes drawn on.
 
     Returns:
     - Tuple[int, int, int, int, int, int, int, int]: Coordinates and dimensions of the detected bounding boxes.
@@ -152,126 +514,179 @@ def find_contours(fname, title, WHITENESS_THRESHOLD, THICKNESS, NOSKY):
     Notes:
     - This function loads an image, applies edge detection, and identifies contours to find objects.
     - Bounding boxes are drawn around detected objects, and the resulting image is saved.
+    - The work is done by a FrameProcessor kept for the process, which
+      reuses its working arrays from one photo to the next.
+    - The boxes are found in one pass with largest_boxes.
     - Adjust the WHITENESS_THRESHOLD and thickness values as needed.
     - If no bounding box is detected, a tuple of zeros is returned.
 
     Example:
-    >>> find_contours('path/to/image.jpg', 'output_prefix')
+    >>> find_contours('path/to/image.jpg', 'output_prefix', 115, 16, 3800,
+    ...               'path/to/boxes')
     Output: (y_max, h_max, y_max1, h_max1, x_max, x_max1, w_max, w_max1)
     """
-    # Load the image and convert to grayscale
-    img = io.imread(glob.glob(fname)[0])
-    img_grey = color.rgb2gray(img)
-    # Create a mask based on pixel whiteness
-    mask = np.all(img > WHITENESS_THRESHOLD, axis=-1)
-    img_grey[~mask] = 0
-    img_grey[NOSKY::, :] = 0
-    img_grey[img_grey>0] = 1
-    # Use NumPy for operations instead of PIL and CV2
-    cv_grey = cv2.GaussianBlur(img_grey.astype(np.uint8) * 255, (5, 5), 0)
-    edges = cv2.Canny(cv_grey, 0, 200)
-
-    # Find contours and sort by area
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, 
-                                   cv2.CHAIN_APPROX_SIMPLE)
-    sorted_contours = sorted(contours, key=cv2.contourArea, reverse=True)
-
-    # Initialize variables for bounding box with the maximum area
-    bounding_box_image = img.copy()
-    max_max = 0
-
-    for contour in sorted_contours:
-        (x, y, w, h) = cv2.boundingRect(contour)
-        rectangle_area = w * h
-        
-        if rectangle_area >= max_max:
-            x_max1, y_max1, w_max1, h_max1 = x, y, w, h
-            max_max = rectangle_area
-
-    try:
-       # Draw a rectangle around the detected object with the maximum area
-       cv2.rectangle(bounding_box_image, (x_max1, y_max1), 
-                  (x_max1 + w_max1, y_max1 + h_max1), (0, 255, 0), 
-                  THICKNESS)
-
-    except :
-        # Return zeros if no bounding box is detected
-        return 0, 0, 0, 0, 0, 0, 0, 0
+    processor = frame_processor(WHITENESS_THRESHOLD, THICKNESS, NOSKY,
+                                n_boxes, scale)
+    return processor.find_contours(glob.glob(fname)[0], title, imgroot,
+                                   save_image)
+
 
-    # Find the second-largest bounding box
-    max_c = 0
-
-    for contour in sorted_contours:
-        (x, y, w, h) = cv2.boundingRect(contour)
-        rectangle_area = w * h
-
-        if rectangle_area >= max_c:
-            if rectangle_area < max_max:
-                x_max, y_max, w_max, h_max = x, y, w, h
-                max_c = rectangle_area
-    try:            
-        # Draw a rectangle around the second-largest detected object
-        cv2.rectangle(bounding_box_image, (x_max, y_max), 
-                  (x_max + w_max, y_max + h_max), (0, 255, 0), THICKNESS)
-    except UnboundLocalError:
+def draw_boxes(img, boxes, title, THICKNESS, imgroot, save_image=True):
+    """
+    Draw the boxes on the photo, save it and return the two largest.
+
+    Parameters:
+    - img (numpy.ndarray): The photo (drawn on, so pass a copy to keep it).
+    - boxes (list): x, y, w, h of each box, largest first.
+    - title (str): Prefix for the saved image.
+    - THICKNESS (int): Line thickness of the boxes.
+    - imgroot (str): Folder to save the boxed image to.
+    - save_image (bool): Draw the boxes and save the image.
+
+    Returns:
+    - Tuple[int, int, int, int, int, int, int, int]: as find_contours, zeros
+      if there are fewer than two boxes.
+    """
+    if len(boxes) < 2:
         # Return zeros if no bounding box is detected
         return 0, 0, 0, 0, 0, 0, 0, 0
-    # Save the image with bounding boxes
-    #print(imgroot+'/'+title + '_cloud_box.png')
-    cv2.imwrite(imgroot+'/'+title + '_cloud_box.png', bounding_box_image)
 
+    if save_image:
+        # Draw a rectangle around each of the detected objects
+        for x, y, w, h in boxes:
+            cv2.rectangle(img, (int(x), int(y)), (int(x + w), int(y + h)),
+                          (0, 255, 0), THICKNESS)
+        # Save the image with bounding boxes
+        cv2.imwrite(boxed_image_path(imgroot, title), img)
+
+    # Largest and second-largest bounding boxes
+    x_max1, y_max1, w_max1, h_max1 = (int(value) for value in boxes[0])
+    x_max, y_max, w_max, h_max = (int(value) for value in boxes[1])
     return y_max, h_max, y_max1, h_max1, x_max, x_max1, w_max, w_max1
 
-# ---- loop though the list of files to find the clouds and generate DF ----- #
-
-# Lists to store cloud pixel information
-cb1 = []
-ct1 = []
-cb2 = []
-ct2 = []
-cx1 = []
-cx2 = []
-w1 = []
-w2 = []
-time_list2 = []
-index = 0
-# Loop through the images and find cloud pixel information
-for i in range(len(fnames)):
-    check = cloud_distances.Distance.iloc[closest_indices[index]]
-    index += 1
-
-    if check == 'none' or check == 'no cloud':
-        continue
-    try:
-        check = float(check)
-        if check > 30 or check < 10:
-            continue
-    except TypeError:
-        print('error:', check)
-        continue
-    fig, axs = plt.subplots(figsize=(20, 20))
-    print(fnames[i])
-    cloudbox1 = find_contours(fnames[i],
-                              date_fnames[0] + '-' + time_list[i] + '_',
-                              WHITENESS_THRESHOLD, THICKNESS, NOTSKY)
-    y_max, h_max, y_max1, h_max1, x_max, x_max1, w_max, w_max1 = cloudbox1
-    time_list2.append(time_list[index-1])
-    cb1.append(y_max1)
-    ct1.append(y_max1+h_max1)
-    cb2.append(y_max)
-    ct2.append(y_max+h_max)
-    cx1.append(x_max)
-    cx2.append(x_max1)
-    w1.append(w_max)
-    w2.append(w_max1)
-    plt.close('all')
-# https://gis.stackexchange.com/questions/289044/creating-buffer-circle-x-kilometers-from-point-using-python
-
-# Create DataFrame and save to CSV
-cloud_pixels = pd.DataFrame({'Times': time_list2, 'CB1': cb1, 'CB2': cb2,
-                             'CT1': ct1, 'CT2': ct2, 'CX1': cx1, 'CX2': cx2,
-                             'W1': w1, 'W2': w2})
-
-cloud_pixels.to_csv(os.path.join(result_root,
-                                 f'cloud_pixels_camera_{camera}.csv'))
-                               
+
+def boxed_image_path(imgroot, title):
+    """
+    File the photo with the boxes drawn on is saved to.
+    """
+    return imgroot + '/' + title + '_cloud_box.png'
+
+
+def open_box_cache(cache_file=BOX_CACHE_FILE):
+    """
+    Open the on-disk cache of the boxes found in each photo.
+    """
+    return BoxCache(cache_file, BOX_ALGORITHM_VERSION)
+
+
+def cached_boxes(cache, fname, title, imgroot, scale=DETECT_SCALE,
+                 n_boxes=N_BOXES, save_image=True):
+    """
+    Look up the boxes of a photo in the box cache.
+
+    Parameters:
+    - cache (BoxCache): The box cache.
+    - fname (str): File path of the photo.
+    - title (str): Prefix of the boxed image.
+    - imgroot (str): Folder of the boxed images.
+    - scale (int): Detection scale.
+    - n_boxes (int): Number of boxes drawn.
+    - save_image (bool): The boxed image is wanted, so a hit only counts if
+      it is on disk.
+
+    Returns:
+    - tuple: The eight find_contours values, or None if the photo has to be
+      boxed (again).
+    """
+    cloudbox = cache.get(fname, WHITENESS_THRESHOLD, NOTSKY, scale, n_boxes)
+    # No boxed image is saved for a photo without two boxes (all zeros)
+    if (cloudbox is not None and save_image and any(cloudbox) and
+            not os.path.exists(boxed_image_path(imgroot, title))):
+        return None
+    return cloudbox
+
+
+def cloud_pixels_dataframe(time_list, cloudboxes):
+    """
+    Build the cloud pixel DataFrame written to cloud_pixels_camera_<n>.csv.
+
+    Parameters:
+    - time_list (list): 'HHMMSS' string for each processed photo.
+    - cloudboxes (list): find_contours output for each processed photo.
+
+    Returns:
+    - pd.DataFrame: Columns Times, CB1, CB2, CT1, CT2, CX1, CX2, W1, W2.
+    """
+    # Lists to store cloud pixel information
+    cb1 = []
+    ct1 = []
+    cb2 = []
+    ct2 = []
+    cx1 = []
+    cx2 = []
+    w1 = []
+    w2 = []
+    for cloudbox1 in cloudboxes:
+        y_max, h_max, y_max1, h_max1, x_max, x_max1, w_max, w_max1 = cloudbox1
+        cb1.append(y_max1)
+        ct1.append(y_max1+h_max1)
+        cb2.append(y_max)
+        ct2.append(y_max+h_max)
+        cx1.append(x_max)
+        cx2.append(x_max1)
+        w1.append(w_max)
+        w2.append(w_max1)
+    return pd.DataFrame({'Times': list(time_list), 'CB1': cb1, 'CB2': cb2,
+                         'CT1': ct1, 'CT2': ct2, 'CX1': cx1, 'CX2': cx2,
+                         'W1': w1, 'W2': w2})
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    # Extract arguments
+    camera = int(sys.argv[1])
+    date_to_use = str(sys.argv[2])
+
+    imgroot = image_root(camera, date_to_use)
+    # Create directories if they don't exist
+    setup_directories(camera, date_to_use)
+
+    fnames = find_image_files(camera, date_to_use)
+    time_list, datetime_objects = extract_image_times(fnames)
+    cloud_distances = load_cloud_distances(camera, date_to_use)
+
+    # Plan which photos to decode before reading any of them
+    keep = select_cloudy_images(datetime_objects, cloud_distances)
+    report_plan(keep, fnames)
+
+    # ---- loop though the list of files to find the clouds and generate DF - #
+    time_list2 = []
+    cloudboxes = []
+    # Boxes already found in unchanged photos are read from the cache
+    cache = open_box_cache()
+    # Loop through the images and find cloud pixel information
+    for i in keep:
+        print(fnames[i])
+        title = date_to_use + '-' + time_list[i] + '_'
+        cloudbox1 = cached_boxes(cache, fnames[i], title, imgroot)
+        if cloudbox1 is None:
+            cloudbox1 = find_contours(fnames[i], title, WHITENESS_THRESHOLD,
+                                      THICKNESS, NOTSKY, imgroot)
+            cache.put(fnames[i], WHITENESS_THRESHOLD, NOTSKY, cloudbox1,
+                      DETECT_SCALE, N_BOXES)
+        time_list2.append(time_list[i])
+        cloudboxes.append(cloudbox1)
+    cache.save()
+    cache.report()
+    # https://gis.stackexchange.com/questions/289044/creating-buffer-circle-x-kilometers-from-point-using-python
+
+    # Create DataFrame and save to CSV
+    cloud_pixels = cloud_pixels_dataframe(time_list2, cloudboxes)
+    cloud_pixels.to_csv(os.path.join(results_root(date_to_use),
+                                     f'cloud_pixels_camera_{camera}.csv'))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,74 +7,94 @@ project: DCMEX
 
 Description
 
-Usage: python image_pairs.py <camera> <date>
+Usage: python image_pairs.py <camera> <date> [--raster] [--width W]
+                              [--workers N] [--video] [--fps FPS]
 where
 camera : interger 1 or 2
 date : string 'yyyy-mm-dd'
+--raster : draw the pairs straight into images W pixels wide (see
+           pair_raster.py) instead of as matplotlib figures
+--width : width of the --raster and --video images in pixels (default 2000)
+--workers : number of worker processes (defaults to the number of cores)
+--video : write every photo of the day, with its boxes and heights drawn on,
+          and its optical depth plot into one video
+          (images2/videos/<date>_camera_<n>.mp4, see panel_video.py) instead
+          of a png per pair. Only the photos, the heights csv and the
+          satellite files are read, no boxed images or FOV plots
+--fps : frames per second of the --video (default 4)
 
-this scrip takes the output from calculate_heights.py and loads the 
+this scrip takes the output from calculate_heights.py and loads the
 corresponding cloud photos and optical depths plots and annotates the estimated
 cloud to heights and height of the base of the box round the clouds and plots
-this along side the closest match in time optical depth field of view plot. 
+this along side the closest match in time optical depth field of view plot.
 
-The output of this scripts can be used to verify the timeseires data or to 
+The output of this scripts can be used to verify the timeseires data or to
 illustrate the work flow
 
+The pairs are all found before any image is loaded: each folder is listed
+once and the times in the file names parsed into a sorted array, each boxed
+image is matched to the closest optical depth plot by bisection
+(nearest_time_index in time_matching.py) and the heights table is read once
+with its times parsed and joined on to the pairs. The pairs are then drawn
+by a pool of worker processes.
+
 """
 # import modules
+import argparse
 import os
 import datetime
-import sys
-from PIL import Image
-import cv2 as cv2
-import matplotlib.pyplot as plt
+import re
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+import numpy as np
 import pandas as pd
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'StandAloneTools'))
+from camera_details import camera_details
+from time_matching import nearest_time_index
 
+# outline folder structure of plots and storage/ csv location
+storage = '/home/users/hburns/GWS/DCMEX/users/hburns/'
+# Boxed cloud images e.g. 2022-07-27-160500__cloud_box.png
+PHOTO_FILE = re.compile(r'^(\d{4}-\d{2}-\d{2}-\d{6})_.*\.png$')
+# Optical depth plots, 2022-07-27_1605.png from stream_pipeline.py or
+# 2022-07-27T16:05.png from optical_depth_plotter.py
+FOV_FILE = re.compile(r'^(\d{4}-\d{2}-\d{2})[_T](\d{2}):?(\d{2})\.png$')
+# Photos e.g. amof-cam-2-2022-07-27-160500.jpg
+PHOTO_JPG = re.compile(r'(\d{4}-\d{2}-\d{2}-\d{6})\.jpg$')
+HEIGHT_COLUMNS = ['CT1', 'CT2', 'CB1', 'CB2', 'CTP1', 'CTP2', 'CBP1', 'CBP2',
+                  'W1', 'W2', 'X1', 'X2', 'distance_to_cloud']
 
-# Extract arguments
-camera = int(sys.argv[1])
-date_to_use = str(sys.argv[2])
 
+def folders(camera, date_to_use):
+    """
+    Folders of the boxed images, optical depth plots and image pairs.
+    """
+    folder1 = (storage + 'images2/cloud_top_heights/' + date_to_use + '/' +
+               str(camera) + '/')
+    folder2 = (storage + 'images2/FOV_on_optical_depth/' + date_to_use +
+               '/camera/' + str(camera) + '/')
+    folder3 = (storage + 'images2/image_pairs/' + date_to_use + '/' +
+               str(camera) + '/')
+    return folder1, folder2, folder3
 
-# outline folder structure of plots and storage/ csv location
-storage = '/home/users/hburns/GWS/DCMEX/users/hburns/'
-folder1 = storage+'images2/cloud_top_heights/'+date_to_use+'/'+str(camera)+'/'
-folder2 = storage+'images2/FOV_on_optical_depth/' + \
-    date_to_use+'/camera/'+str(camera)+'/'
-folder3 = storage+'images2/image_pairs/'+date_to_use+'/'+str(camera)+'/'
-cloud_heights = pd.read_csv(storage+'/results2/'+date_to_use +
-                            '/'+date_to_use+'_camera_'+str(camera)
-                            +'_cloud_top_heights.csv')
-
-
-# Reading camera details and cloud data
-cam_details = storage+'/camera_details.csv'
-cam_df = pd.read_csv(cam_details)
-# Processing date format
-parts = date_to_use.split('-')
-date = parts[-1]+'-'+parts[1]+'-'+parts[0]
-filtered_df = cam_df[(cam_df['Date'] == date) & (cam_df['camera'] == camera)]
-yaw_degrees = filtered_df.yaw.values[0]
-pitch = filtered_df.pitch.values[0]
-
-# Ensure folder3 exists
-if not os.path.exists(folder3):
-    os.makedirs(folder3)
 
 # Function to extract timestamp from file name in folder1
 def extract_timestamp_folder1(filename):
     """
     Extract timestamp from the filename in folder1.
-    
+
     Parameters:
     - filename (str): The filename to extract the timestamp from.
-    
+
     Returns:
     - datetime.datetime: Timestamp extracted from the filename.
     """
-    timestamp_str = filename.split('_')[0]  
+    timestamp_str = filename.split('_')[0]
     return datetime.datetime.strptime(timestamp_str, '%Y-%m-%d-%H%M%S')
 
+
 # Function to extract timestamp from file name in folder2
 def extract_timestamp_folder2(filename):
     """
@@ -86,78 +106,279 @@ def extract_timestamp_folder2(filename):
     Returns:
     - datetime.datetime: Timestamp extracted from the filename.
     """
-    timestamp_str = filename.split('.')[0]
-    return datetime.datetime.strptime(timestamp_str, '%Y-%m-%d%_H:%M')
-
-
-# Iterate through files in folder1
-for file1 in os.listdir(folder1):
-    if file1.endswith('.png'):
-        timestamp1 = extract_timestamp_folder1(file1)
-        # Iterate through files in folder2 to find the closest match
-        closest_file2 = None
-        closest_time_difference = float('inf')
-
-        for file2 in os.listdir(folder2):
-            if file2.endswith('.png'):
-                timestamp2 = extract_timestamp_folder2(file2)
-                time_difference = abs(
-                    (timestamp1 - timestamp2).total_seconds())
-                if time_difference < closest_time_difference:
-                    closest_time_difference = time_difference
-                    closest_file2 = file2
-
-        # Load images and create a subplot
-        if closest_file2 is not None:
-            file1_path = os.path.join(folder1, file1)
-            file2_path = os.path.join(folder2, closest_file2)
-            filtered_df = cloud_heights[(pd.to_datetime(
-                cloud_heights['Time']) == timestamp1)]
-            timestamp_nearest = extract_timestamp_folder2(closest_file2)
-            img1 = cv2.imread(file1_path)
-            img2 = Image.open(file2_path)
-            # Create a new figure with subplots
-            plt.figure(figsize=(40, 20))
-            # Display the images in subplots
-            plt.subplot(1, 2, 1)
-            plt.imshow(img1)
-            try:
-                # Plotting boxes and text for cloud top and base heights
-                plt.plot(filtered_df.W1.values[0]/2+filtered_df.X1.values[0],
-                         filtered_df.CTP1.values[0], 'o', color='r')
-                plt.text(filtered_df.W1.values[0]/2+filtered_df.X1.values[0]-100, 
-                         filtered_df.CTP1.values[0]-30, str(
-                    filtered_df.CT1.values[0])+' km', fontsize=16, color='k')
-                plt.plot(filtered_df.W1.values[0]/2+filtered_df.X1.values[0],
-                         filtered_df.CBP1.values[0], 'o', color='r')
-                plt.text(filtered_df.W1.values[0]/2+filtered_df.X1.values[0]-100,
-                         filtered_df.CBP1.values[0]+100, str(
-                    filtered_df.CB1.values[0])+' km', fontsize=16, color='k')
-                plt.plot(filtered_df.W2.values[0]/2+filtered_df.X2.values[0],
-                         filtered_df.CTP2.values[0], 'o', color='r')
-                plt.text(filtered_df.W2.values[0]/2+filtered_df.X2.values[0]-100, 
-                         filtered_df.CTP2.values[0]-30, str(
-                    filtered_df.CT2.values[0])+' km', fontsize=16, color='k')
-                plt.plot(filtered_df.W2.values[0]/2+filtered_df.X2.values[0],
-                         filtered_df.CBP2.values[0], 'o', color='r')
-                plt.text(filtered_df.W2.values[0]/2+filtered_df.X2.values[0]-100, 
-                         filtered_df.CBP2.values[0]+100, str(
-                    filtered_df.CB2.values[0])+' km', fontsize=16, color='k')
-            except IndexError:
-                print('no box')
-            plt.title(str(timestamp1)+'\n boxed cloud image \n pitch: '+str(pitch),fontsize="20")
-            plt.subplot(1, 2, 2)
-            plt.imshow(img2)
-            plt.axis('off')  # Turn off axes
-            try:
-                # Adding title for the right subplot
-                plt.title(str(timestamp_nearest)+
-                          ' optical depth \n Distance to Cloud: ' +
-                          str(int(filtered_df.distance_to_cloud.values[0])) 
-                          + ' km')
-            except IndexError:
-                print('no box')
-                plt.title(str(timestamp_nearest)+' optical depth',fontsize="20")
-            # Saving the figure
-            plt.savefig(folder3+timestamp1.strftime('%Y-%m-%dT%H:%M')+'.png')
-            plt.close('all')
+    yyyy_mm_dd, hh, mm = FOV_FILE.match(filename).groups()
+    return datetime.datetime.strptime(yyyy_mm_dd + hh + mm, '%Y-%m-%d%H%M')
+
+
+def scan_folder(folder, pattern, extract_timestamp):
+    """
+    List the images in a folder once, sorted by the time in their names.
+
+    Parameters:
+    - folder (str): Folder to list.
+    - pattern (re.Pattern): File names to keep.
+    - extract_timestamp (function): Time from a file name.
+
+    Returns:
+    - np.ndarray: Sorted datetime64 times of the images.
+    - list: File names in the same order.
+    """
+    names = [name for name in os.listdir(folder) if pattern.match(name)]
+    times = np.array([extract_timestamp(name) for name in names],
+                     dtype='datetime64[ns]')
+    order = np.argsort(times, kind='stable')
+    return times[order], [names[i] for i in order]
+
+
+def day_photos(camera, date_to_use):
+    """
+    A camera's photos for a day, sorted by time.
+
+    Returns:
+    - np.ndarray: Sorted datetime64 times of the photos.
+    - list: Photo file paths in the same order.
+    """
+    from cloudtop_pixel_heights import find_image_files
+    fnames = [fname for fname in find_image_files(camera, date_to_use)
+              if PHOTO_JPG.search(fname)]
+    times = np.array([extract_timestamp_folder1(
+        PHOTO_JPG.search(fname).group(1)) for fname in fnames],
+        dtype='datetime64[ns]')
+    order = np.argsort(times, kind='stable')
+    return times[order], [fnames[i] for i in order]
+
+
+def heights_by_time(cloud_heights):
+    """
+    Key the heights table by its parsed times (the first row for each time).
+    """
+    heights = cloud_heights.assign(Time=pd.to_datetime(cloud_heights['Time']))
+    return heights.drop_duplicates('Time').set_index('Time')[HEIGHT_COLUMNS]
+
+
+def pair_images(folder1, folder2, cloud_heights):
+    """
+    Pair each boxed image with the closest optical depth plot in time and
+    its heights.
+
+    Parameters:
+    - folder1 (str): Folder of the boxed cloud images.
+    - folder2 (str): Folder of the optical depth FOV plots.
+    - cloud_heights (pd.DataFrame): Table from calculate_heights.py.
+
+    Returns:
+    - pd.DataFrame: file1, timestamp1, file2 and timestamp_nearest for each
+      pair, sorted by time, with the heights columns (NaN and has_heights
+      False if the photo has no heights).
+    """
+    times1, files1 = scan_folder(folder1, PHOTO_FILE,
+                                 extract_timestamp_folder1)
+    return pair_times(times1, files1, folder2, cloud_heights)
+
+
+def pair_times(times1, files1, folder2, cloud_heights):
+    """
+    Pair images at the given times with the closest optical depth plot in
+    time and their heights.
+
+    Parameters:
+    - times1 (np.ndarray): Sorted datetime64 times of the images.
+    - files1 (list): Image files in the same order.
+    - folder2 (str): Folder of the optical depth FOV plots (None to only
+      join on the heights).
+    - cloud_heights (pd.DataFrame): Table from calculate_heights.py.
+
+    Returns:
+    - pd.DataFrame: As pair_images (file2 and timestamp_nearest are None and
+      NaT if there are no optical depth plots).
+    """
+    if folder2 is not None and os.path.exists(folder2):
+        times2, files2 = scan_folder(folder2, FOV_FILE,
+                                     extract_timestamp_folder2)
+    else:
+        times2, files2 = np.array([], dtype='datetime64[ns]'), []
+    pairs = pd.DataFrame({'file1': files1, 'timestamp1': times1})
+    if len(files2) == 0:
+        pairs['file2'] = None
+        pairs['timestamp_nearest'] = pd.NaT
+    else:
+        nearest = nearest_time_index(times1, times2)
+        pairs['file2'] = [files2[i] for i in nearest]
+        pairs['timestamp_nearest'] = times2[nearest]
+    heights = heights_by_time(cloud_heights)
+    pairs['has_heights'] = pairs['timestamp1'].isin(heights.index)
+    return pairs.join(heights, on='timestamp1')
+
+
+def plot_pair(pair, pitch, folder1, folder2, folder3):
+    """
+    Plot a boxed image with its heights next to its optical depth plot.
+
+    Parameters:
+    - pair (SimpleNamespace): Row of the pair_images table.
+    - pitch (float): Camera pitch in degrees.
+    - folder1, folder2, folder3 (str): Folders of the boxed images, optical
+      depth plots and image pairs.
+    """
+    # Only imported when plots are drawn
+    from PIL import Image
+    import cv2 as cv2
+    import matplotlib.pyplot as plt
+    timestamp1 = pd.Timestamp(pair.timestamp1).to_pydatetime()
+    timestamp_nearest = pd.Timestamp(pair.timestamp_nearest).to_pydatetime()
+    img1 = cv2.imread(os.path.join(folder1, pair.file1))
+    img2 = Image.open(os.path.join(folder2, pair.file2))
+    # Create a new figure with subplots
+    plt.figure(figsize=(40, 20))
+    # Display the images in subplots
+    plt.subplot(1, 2, 1)
+    plt.imshow(img1)
+    if pair.has_heights:
+        # Plotting boxes and text for cloud top and base heights
+        plt.plot(pair.W1/2+pair.X1, pair.CTP1, 'o', color='r')
+        plt.text(pair.W1/2+pair.X1-100, pair.CTP1-30,
+                 str(pair.CT1)+' km', fontsize=16, color='k')
+        plt.plot(pair.W1/2+pair.X1, pair.CBP1, 'o', color='r')
+        plt.text(pair.W1/2+pair.X1-100, pair.CBP1+100,
+                 str(pair.CB1)+' km', fontsize=16, color='k')
+        plt.plot(pair.W2/2+pair.X2, pair.CTP2, 'o', color='r')
+        plt.text(pair.W2/2+pair.X2-100, pair.CTP2-30,
+                 str(pair.CT2)+' km', fontsize=16, color='k')
+        plt.plot(pair.W2/2+pair.X2, pair.CBP2, 'o', color='r')
+        plt.text(pair.W2/2+pair.X2-100, pair.CBP2+100,
+                 str(pair.CB2)+' km', fontsize=16, color='k')
+    else:
+        print('no box')
+    plt.title(str(timestamp1)+'\n boxed cloud image \n pitch: '+str(pitch),fontsize="20")
+    plt.subplot(1, 2, 2)
+    plt.imshow(img2)
+    plt.axis('off')  # Turn off axes
+    if pair.has_heights:
+        # Adding title for the right subplot
+        plt.title(str(timestamp_nearest)+
+                  ' optical depth \n Distance to Cloud: ' +
+                  str(int(pair.distance_to_cloud))
+                  + ' km')
+    else:
+        plt.title(str(timestamp_nearest)+' optical depth',fontsize="20")
+    # Saving the figure
+    plt.savefig(folder3+timestamp1.strftime('%Y-%m-%dT%H:%M')+'.png')
+    plt.close('all')
+
+
+def draw_pair(task):
+    """
+    Draw one image pair in a worker process.
+
+    Parameters:
+    - task (tuple): (pair as a dict, pitch, (folder1, folder2, folder3),
+      raster width or None for a matplotlib figure).
+
+    Returns:
+    - str: Time of the pair.
+    """
+    row, pitch, (folder1, folder2, folder3), width = task
+    pair = SimpleNamespace(**row)
+    if width is None:
+        plot_pair(pair, pitch, folder1, folder2, folder3)
+    else:
+        from pair_raster import render_pair
+        render_pair(pair, pitch, os.path.join(folder1, pair.file1),
+                    os.path.join(folder2, pair.file2),
+                    folder3 + pd.Timestamp(pair.timestamp1).strftime(
+                        '%Y-%m-%dT%H:%M') + '.png', width)
+    return str(pair.timestamp1)
+
+
+def run_pairs(camera, date_to_use, raster=False, width=2000, workers=None,
+              video=False, fps=4):
+    """
+    Draw the image pairs (or the video) of a day.
+
+    Parameters:
+    - camera (int): Camera number 1 or 2.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - raster (bool): Draw the pairs without matplotlib.
+    - width (int): Width of the raster and video images in pixels.
+    - workers (int): Number of worker processes (None uses every core, 1
+      draws the pairs in this process).
+    - video (bool): Write the day to one video instead of pngs.
+    - fps (float): Frames per second of the video.
+
+    Returns:
+    - int: Number of image pairs or video frames drawn.
+    """
+    folder1, folder2, folder3 = folders(camera, date_to_use)
+    cloud_heights = pd.read_csv(storage+'/results2/'+date_to_use +
+                                '/'+date_to_use+'_camera_'+str(camera)
+                                +'_cloud_top_heights.csv')
+
+    # Reading camera details
+    pitch = camera_details(camera, date_to_use,
+                           csv_file=storage+'/camera_details.csv').pitch
+
+    if video:
+        from panel_video import panel_frames, write_video
+        video_folder = storage + 'images2/videos/'
+        if not os.path.exists(video_folder):
+            os.makedirs(video_folder)
+        times1, files1 = day_photos(camera, date_to_use)
+        # The FOV plots are drawn in memory from the scans
+        pairs = pair_times(times1, files1, None, cloud_heights)
+        out_path = (video_folder + date_to_use + '_camera_' + str(camera) +
+                    '.mp4')
+        n_frames = write_video(panel_frames(pairs, pitch, width), out_path,
+                               fps)
+        print(n_frames, 'frames written to', out_path)
+        return n_frames
+
+    # Ensure folder3 exists
+    if not os.path.exists(folder3):
+        os.makedirs(folder3)
+
+    # All the pairs are found before any image is loaded
+    pairs = pair_images(folder1, folder2, cloud_heights)
+    pairs = pairs[pairs['file2'].notna()]
+    print(len(pairs), 'image pairs')
+    tasks = [(row, pitch, (folder1, folder2, folder3),
+              width if raster else None)
+             for row in pairs.to_dict('records')]
+    if workers == 1:
+        for done in map(draw_pair, tasks):
+            print(done)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for done in pool.map(draw_pair, tasks):
+                print(done)
+    return len(tasks)
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    # Extract arguments
+    parser = argparse.ArgumentParser(
+        description='Plot the boxed cloud images next to the optical depth '
+        'plots')
+    parser.add_argument('camera', type=int)
+    parser.add_argument('date_to_use')
+    parser.add_argument('--raster', action='store_true',
+                        help='draw the pairs without matplotlib')
+    parser.add_argument('--width', type=int, default=2000,
+                        help='width of the --raster and --video images in '
+                        'pixels')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes')
+    parser.add_argument('--video', action='store_true',
+                        help='write the day to one video instead of pngs')
+    parser.add_argument('--fps', type=float, default=4,
+                        help='frames per second of the --video')
+    args = parser.parse_args()
+    run_pairs(args.camera, args.date_to_use, raster=args.raster,
+              width=args.width, workers=args.workers, video=args.video,
+              fps=args.fps)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,18 @@ Optical Depth Plotter
 
 Filter out cirrus cloud below 3.6
 Plot camera FOV, orography and find location on max optical depth in that area
+The max in the FOV is found for all the day's times in one go (see
+StandAloneTools/fov_cube.py), reading the scans in chunks of times
 
 To run: 
-python optical_depth_plotter.py <camera> <yyyy-mm-dd>
+python optical_depth_plotter.py <camera> <yyyy-mm-dd> [--no-plot]
+                                [--plot-only [<yyyy-mm-ddTHH:MM> ...]]
 where:
     <camera> is an integer: 1/2
     <yyyy-mm-dd> is a date string e.g. <2022-07-29>
+    --no-plot only writes the distance csv (matplotlib.pyplot is never
+        imported)
+    --plot-only only draws the plots, for all times or the times given
 
  
 """
@@ -19,19 +25,33 @@ where:
 import xarray as xr
 import glob
 import os
+import argparse
 import pandas as pd
 from datetime import datetime
-import matplotlib.pyplot as plt
-from matplotlib.path import Path
-import pyproj
 import numpy as np
-import haversine as hs
 import math
 import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'StandAloneTools'))
+from fov_masks import FOVMaskIndex, max_in_indices
+from fov_sectors import fov_sector, fov_sectors
+from fov_cube import fov_max_cube
+from camera_details import camera_details
+from orography import OROG_FILE, load_orography
 
 # Extract arguments
-camera = int(sys.argv[1])
-date_to_use = str(sys.argv[2])
+parser = argparse.ArgumentParser(
+    description='Find the distance to the max optical depth in the camera FOV')
+parser.add_argument('camera', type=int)
+parser.add_argument('date_to_use')
+parser.add_argument('--no-plot', action='store_true',
+                    help='only write the distance csv')
+parser.add_argument('--plot-only', nargs='*', default=None,
+                    help='only draw the plots (for the yyyy-mm-ddTHH:MM '
+                    'times given)')
+args = parser.parse_args()
+camera = args.camera
+date_to_use = args.date_to_use
 # Path to area to write images and results to
 storage = '/home/users/hburns/GWS/DCMEX/users/hburns/'
 # Path to write created images
@@ -46,9 +66,9 @@ yaw_error = 10
 # Optical depth threshold (cumulus cloud not cirrus)
 optical_depth_threshold = 3.6
 
-# Retireve camera details for the selected day
-cam_details = storage + '/camera_details.csv'
-cam_df = pd.read_csv(cam_details)
+# Grid points inside the camera FOV, kept on disk as the camera position and
+# yaw are fixed for the day
+fov_masks = FOVMaskIndex(cache_dir=storage + 'fov_masks/')
 
 # -------- Extract relevant files and camera info --------------------------- #
 # Create any folders that don't already exist
@@ -90,11 +110,11 @@ date_fnames2 = list(set(date_list2))
 
 
 # Load data related to camera details
-filtered_df = cam_df[(cam_df['Date'] == date_fnames[0])
-                     & (cam_df['camera'] == camera)]
-yaw_degrees = filtered_df.yaw.values[0]
-camlat = filtered_df.camlat.values[0]
-camlon = filtered_df.camlon.values[0]
+details = camera_details(camera, date_fnames2[0],
+                         csv_file=storage + '/camera_details.csv')
+yaw_degrees = details.yaw
+camlat = details.camlat
+camlon = details.camlon
 print('camlat: ', camlat)
 print('camlon: ', camlon)
 
@@ -109,10 +129,8 @@ file_root = "/gws/nopw/j04/dcmex/data/GOES16pcrgd/Magda/"
 channel1 = "ABI-L2-CODC/"
 fname_root = "/*/OR_ABI-L2-CODC-M6_G16*_select_pcrgd.nc"
 
-# Orography file
-orog_file = '/gws/nopw/j04/dcmex/users/dfinney/data/globe_orog_data_NM.nc'
-orog = xr.open_dataset(orog_file)['topo'].sel(
-    X=slice(lon1, lon2), Y=slice(lat1, lat2))
+# Orography file (read with its contours the first time a plot is drawn)
+orog_file = OROG_FILE
 southbaldy = [33.99, -107.19]
 MRO = [33.98481699, -107.18926709]
 CB = [34.0248532, -106.9267249]
@@ -168,8 +186,8 @@ Parameters:
 - fov_horizontal_deg (float): Horizontal field of view angle in degrees.
 
 Returns:
-- fov_x (list): List of x-coordinates representing the FOV polygon.
-- fov_y (list): List of y-coordinates representing the FOV polygon.
+- fov_x (numpy.ndarray): x-coordinates representing the FOV polygon.
+- fov_y (numpy.ndarray): y-coordinates representing the FOV polygon.
 
 Note:
 - The FOV is assumed to be a segment of a circular area on the map.
@@ -186,31 +204,12 @@ cam_fov = 60.0
 fov_x, fov_y = FOV_area(cam_latitude, cam_longitude, cam_yaw, cam_fov)
 ```
 
-Adjust the `fov_radius` parameter inside the function to control the radius of the FOV on the map.
+The radius of the FOV on the map is FOV_RADIUS in StandAloneTools/fov_sectors.py (fov_sectors makes many FOVs in one call).
 """
-    # Field of view angle (in degrees)
-    fov_degrees = fov_horizontal_deg
+    return fov_sector(camlat, camlon, yaw_degrees, fov_horizontal_deg)
 
-    # Calculate the endpoints of the field of view
-    fov_radius = 0.35  # Adjust this value for the desired FOV radius on the map
-    fov_start = yaw_degrees - fov_degrees / 2
-    fov_end = yaw_degrees + fov_degrees / 2
 
-    # Convert the yaw angles to radians
-    fov_start_rad = np.radians(fov_start)
-    fov_end_rad = np.radians(fov_end)
-
-    # Calculate the FOV coordinates
-    fov_x = [camlon] + [camlon + fov_radius *
-                        np.sin(a) for a in np.linspace(fov_start_rad,
-                                                       fov_end_rad, 100)]
-    fov_y = [camlat] + [camlat + fov_radius *
-                        np.cos(a) for a in np.linspace(fov_start_rad,
-                                                       fov_end_rad, 100)]
-    return fov_x, fov_y
-
-
-def find_max_in_fov(data, fov_x, fov_y):
+def find_max_in_fov(data, fov_x, fov_y, fov_key=None):
     """
 Find the maximum value and corresponding location within a specified field of view (FOV) on a gridded dataset.
 
@@ -218,6 +217,7 @@ Parameters:
 - data (numpy.ndarray): The 2D array of values representing the dataset, e.g., temperature, humidity.
 - fov_x (list): List of x-coordinates defining the FOV polygon.
 - fov_y (list): List of y-coordinates defining the FOV polygon.
+- fov_key (tuple): (camlat, camlon, yaw, fov width) the polygon was made from, used to look up the grid points within the FOV (default: the polygon coordinates).
 
 Returns:
 - maxlat (int): Index of the latitude with the maximum value within the FOV.
@@ -225,8 +225,8 @@ Returns:
 
 Note:
 - The function uses a given FOV defined by its x and y coordinates to identify the grid points within the FOV.
+- The grid points within the FOV are worked out once and reused from fov_masks for the same FOV and grid.
 - The maximum value and its corresponding location within the FOV are then determined.
-- The input data array is masked, setting values outside the FOV to NaN.
 
 Usage Example:
 ```python
@@ -237,35 +237,92 @@ maxlat, maxlon = find_max_in_fov(temperature_data, fov_x, fov_y)
 
 Replace 'temperature_data' with the actual 2D array representing your dataset.
 """
-    # Define a grid of latitude and longitude within the FOV area
     lons = data.coords['lon'].values
     lats = data.coords['lat'].values
-    # Define a grid of latitude and longitude within the FOV area
-    polygon_points = list(zip(fov_x, fov_y))
-    polygon_path = Path(polygon_points)
-    x_grid, y_grid = np.meshgrid(lons, lats)
+    if fov_key is None:
+        fov_key = tuple(fov_x) + tuple(fov_y)
+    # Grid cells inside the FOV are only worked out once per FOV and grid
+    indices = fov_masks.flat_indices(lons, lats, fov_x, fov_y, fov_key)
+    maxlat, maxlon = max_in_indices(data.values, indices)
 
-    # Flatten the grid arrays to 1D arrays
-    x_flat = x_grid.flatten()
-    y_flat = y_grid.flatten()
+    return maxlat, maxlon
 
-    # Create an array of (x, y) points
-    points = np.column_stack((x_flat, y_flat))
 
-    # Check if each point is within the polygon
-    mask = polygon_path.contains_points(points)
+def fov_error_indices(data, camlat, camlon, yaw):
+    """
+Grid points within the FOV (with yaw plus minus the YAW error) of the data's lat/lon grid.
 
-    # Reshape the mask back to 2D
-    mask = mask.reshape(x_grid.shape)
+Parameters:
+- data (xr.DataArray): Array with lat and lon coordinates.
+- camlat (float): Latitude of the camera's position.
+- camlon (float): Longitude of the camera's position.
+- yaw (float): Yaw angle of the camera in degrees.
 
-    # Apply the mask to your original array
-    # Replace original_array with your actual array that you want to mask
-    masked_array = data.values.copy()
-    masked_array[~mask] = np.nan  # Set values outside the polygon to NaN
-    maxlat, maxlon = np.unravel_index(
-        np.nanargmax(masked_array), masked_array.shape)
+Returns:
+- indices (numpy.ndarray): Sorted indices into the flattened (lat, lon) grid.
+"""
+    fov_xp5, fov_yp5 = FOV_area(
+        camlat, camlon, yaw, fov_horizontal_deg + 2*yaw_error)
+    return fov_masks.flat_indices(
+        data.coords['lon'].values, data.coords['lat'].values,
+        fov_xp5, fov_yp5,
+        (camlat, camlon, yaw, fov_horizontal_deg + 2*yaw_error))
+
+
+def find_clouds(cube, camlat, camlon, yaw):
+    """
+Find the maximum optical depth in the camera's field of view (FOV) for every time of a cube at once.
+
+Parameters:
+- cube (xr.DataArray): (t, lat, lon) optical depth, read lazily through dask chunks along t.
+- camlat (float): Latitude of the camera's position.
+- camlon (float): Longitude of the camera's position.
+- yaw (float): Yaw angle of the camera in degrees.
+
+Returns:
+- cloud_distances (pd.DataFrame): Datetimes, Distance, CT_lat, CT_lon and Status for each time, as find_cloud gives them.
+"""
+    found = fov_max_cube(cube, fov_error_indices(cube, camlat, camlon, yaw),
+                         camlat, camlon, optical_depth_threshold)
+    cloud = found.status == 'cloud'
+    print(int(cloud.sum()), 'of', len(cloud), 'times with cloud in the FOV')
+    return pd.DataFrame(
+        {'Datetimes': cube.t.values.astype(str),
+         'Distance': [D if is_cloud else 'no cloud'
+                      for D, is_cloud in zip(found.distance, cloud)],
+         'CT_lat': [maxlat if is_cloud else 'none'
+                    for maxlat, is_cloud in zip(found.maxlat, cloud)],
+         'CT_lon': [maxlon if is_cloud else 'none'
+                    for maxlon, is_cloud in zip(found.maxlon, cloud)],
+         'Status': found.status})
+
+def find_cloud(data, camlat, camlon, yaw):
+    """
+Find the maximum optical depth in the camera's field of view (FOV) without plotting.
+
+Parameters:
+- data (xr.DataArray): 2D array of values representing the dataset.
+- camlat (float): Latitude of the camera's position.
+- camlon (float): Longitude of the camera's position.
+- yaw (float): Yaw angle of the camera in degrees.
+
+Returns:
+- D (float or str): Haversine distance between the camera and the maximum optical depth point, or 'no cloud' if no cloud is found.
+- maxlat_2 (int or str): Index of the latitude with the maximum optical depth within the FOV, or 'none' if no cloud is found.
+- maxlon_2 (int or str): Index of the longitude with the maximum optical depth within the FOV, or 'none' if no cloud is found.
+- status (str): 'cloud', 'no cloud in area' or 'no cloud in FOV'.
+"""
+    # One time of the cube search in find_clouds
+    found = fov_max_cube(data.expand_dims('t'),
+                         fov_error_indices(data, camlat, camlon, yaw),
+                         camlat, camlon, optical_depth_threshold)
+    status = found.status[0]
+    if status != 'cloud':
+        print(status)
+        return 'no cloud', 'none', 'none', status
+    print('cloud found')
+    return found.distance[0], found.maxlat[0], found.maxlon[0], 'cloud'
 
-    return maxlat, maxlon
 
 # Fuction to plot 1km rings from
 
@@ -289,7 +346,8 @@ Returns:
 
 Note:
 - The function visualizes the FOV, FOV error, and cloud-related information on a plot.
-- It uses a threshold value of 3.6 for cloud detection.
+- The cloud is found with find_cloud, which can be used on its own when no plot is wanted.
+- It uses a threshold value of 3.6 for the plotted optical depth.
 - The FOV is discretized into 100 points for smoother visualization.
 - The function returns information about the maximum optical depth point within the FOV.
 
@@ -307,59 +365,22 @@ Replace 'data', 'camlat', 'camlon', 'yaw', and 'title' with your specific values
     masked_data.plot.pcolormesh(x="lon", y="lat", ax=ax, levels=[
                                 3.6, 9.4, 23, 60, 100],
                                 cbar_kwargs={'label': 'optical depth'})
-    day1 = data.values
     lons = data.coords['lon'].values
     lats = data.coords['lat'].values
-    fov_x, fov_y = FOV_area(camlat, camlon, yaw, fov_horizontal_deg)
-    # Yaw is plus minus the YAW error
-    fov_xp5, fov_yp5 = FOV_area(
-        camlat, camlon, yaw, fov_horizontal_deg + 2*yaw_error)
-    try:
-        test = np.unravel_index(np.nanargmax(day1), day1.shape)
-        if test:
-            print('cloud found')
-    except:
-        print('no cloud in area')
-        D = 'no cloud'
-        maxlat_2 = 'none'
-        maxlon_2 = 'none'
-        orog.plot.contour(x="X", y="Y", colors='k', ax=ax,
-                          levels=[2400, 2500, 2800, 3300])
-        ax.fill(fov_x, fov_y, color='silver', alpha=0.3, label='Field of View')
-        ax.fill(fov_xp5, fov_yp5, color='silver',
-                alpha=0.2, label='Field of View Error')
-        ax.scatter(camlon, camlat, color='r',
-                   marker='D', s=400, label='Camera')
-        ax.scatter(MRO[1], MRO[0], marker='+', color='k', s=200, label='MRO')
-        ax.scatter(CB[1], CB[0], marker='+', color='k', s=150, label='CB')
-        ax.scatter(southbaldy[1], southbaldy[0], marker='^',
-                   color='k', label='South Baldy peak', s=200)
-        ax.set_title(title, fontsize='15')
-        ax.set_xticks(np.arange(camlon - 1, camlon + 1, 0.1))
-        ax.set_yticks(np.arange(camlat - 1, camlat + 1, 0.1))
-        ax.set_xlim(lon1, lon2)
-        ax.set_ylim(lat1, lat2)
-        # Add a legend
-        ax.legend()
-        return D, maxlat_2, maxlon_2
-
-    orog.plot.contour(x="X", y="Y", colors='k', ax=ax,
-                      levels=[2400, 2500, 2800, 3300])
+    # The FOV and the FOV with yaw plus minus the YAW error
+    (fov_x, fov_xp5), (fov_y, fov_yp5) = fov_sectors(
+        camlat, camlon, yaw,
+        [fov_horizontal_deg, fov_horizontal_deg + 2*yaw_error])
+    D, maxlat_2, maxlon_2, status = find_cloud(data, camlat, camlon, yaw)
+
+    orog = load_orography(lon1, lon2, lat1, lat2, orog_file)
+    orog.plot_contours(ax, colors='k')
     ax.fill(fov_x, fov_y, color='silver', alpha=0.3, label='Field of View')
     ax.fill(fov_xp5, fov_yp5, color='silver',
             alpha=0.2, label='Field of View Error')
-
-    try:
-        maxlat_2, maxlon_2 = find_max_in_fov(data, fov_xp5, fov_yp5)
+    if status == 'cloud':
         ax.scatter(lons[maxlon_2], lats[maxlat_2], marker='x',
                    color='r', s=400, label='Max optical depth')
-        D = hs.haversine((lats[maxlat_2], lons[maxlon_2]), (camlat, camlon))
-
-    except:
-        print('no cloud in FOV')
-        D = 'no cloud'
-        maxlat_2 = 'none'
-        maxlon_2 = 'none'
 
     ax.scatter(camlon, camlat, color='r', marker='D', s=400, label='Camera')
     ax.scatter(MRO[1], MRO[0], marker='+', color='k', s=200, label='MRO')
@@ -376,43 +397,45 @@ Replace 'data', 'camlat', 'camlon', 'yaw', and 'title' with your specific values
     return D, maxlat_2, maxlon_2
 
 
-# -------------- Loop through times to create plots ------------------------- #
-# Set font size for plots
-plt.rcParams['font.size'] = 16
-
-# Lists to store distances, datetimes, and coordinates
-distances = []
-datetimes = []
-CT_lat = []
-CT_lon = []
-# Loop through the time dimension of the satellite data
-for i in range(len(data[0].t)):
-    timestamp = data[0].t[i].values
-    hour = np.datetime64(timestamp, 'h').item().hour
-    if int(time_list[0])/100 < hour < int(time_list[-1])/100:
-        # Create a new plot for each timestamp
-        fig, axs = plt.subplots(figsize=(20, 20))
-        proj_wgs84 = pyproj.Proj('+proj=longlat +datum=WGS84')
-        # Plot the data, FOV, and additional annotations
-        D, maxlat_2, maxlon_2 = plotring(data[0][i], axs, camlat, camlon,
-                                         yaw_degrees,
-                                         np.datetime_as_string(data[0].t[i].data,
-                                                               unit='m'))
-        # Append results to lists
-        distances.append(D)
-        datetimes.append(data[0].t[i].data)
-        CT_lat.append(maxlat_2)
-        CT_lon.append(maxlon_2)
-        # Save the plot as an image
-        plt.tight_layout()
-        plt.savefig(
-            imgroot+np.datetime_as_string(data[0].t[i].data, unit='m')+'.png')
-        plt.close('all')
-
-# Create a DataFrame from the collected results and save it to a CSV file
-cloud_distances = pd.DataFrame(
-    {'Datetimes': datetimes, 'Distance': distances, 'CT_lat': CT_lat,
-     'CT_lon': CT_lon})
-cloud_distances.to_csv(
-    storage + 'results/' + date_to_use + '/Cloud_distnaces_camera_'
-    + str(camera) + '.csv')
+def render_plot(data, title):
+    """
+Draw and save the optical depth and FOV plot for one time.
+
+Parameters:
+- data (xr.DataArray): 2D optical depth for the time.
+- title (str): Title of the plot, also used as the file name.
+"""
+    # Only imported when plots are drawn
+    import matplotlib.pyplot as plt
+    plt.rcParams['font.size'] = 16
+    fig, axs = plt.subplots(figsize=(20, 20))
+    plotring(data, axs, camlat, camlon, yaw_degrees, title)
+    # Save the plot as an image
+    plt.tight_layout()
+    plt.savefig(imgroot + title + '.png')
+    plt.close('all')
+
+
+# -------------- Find the clouds and create plots ------------------------- #
+# Times between the first and last photo hours
+hours = pd.DatetimeIndex(data[0].t.values).hour
+steps = np.flatnonzero((int(time_list[0])/100 < hours)
+                       & (hours < int(time_list[-1])/100))
+if args.plot_only is None:
+    # All the times in one go, the scans read a chunk of times at a time
+    cloud_distances = find_clouds(data[0][steps], camlat, camlon,
+                                  yaw_degrees)
+    # Save the results to a CSV file
+    cloud_distances.to_csv(
+        storage + 'results/' + date_to_use + '/Cloud_distnaces_camera_'
+        + str(camera) + '.csv')
+# Loop through the times to draw the plots
+for i in steps:
+    title = np.datetime_as_string(data[0].t[i].data, unit='m')
+    if args.plot_only is not None:
+        # Plots only (for the times asked for)
+        if args.plot_only and title not in args.plot_only:
+            continue
+    elif args.no_plot:
+        break
+    render_plot(data[0][i], title)
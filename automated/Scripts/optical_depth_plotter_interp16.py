@@ -7,10 +7,13 @@ Filter out cirrus cloud below 3.6
 Plot camera FOV, orography and find location on max optical depth in that area
 
 To run: 
-python optical_depth_plotter.py <camera> <yyyy-mm-dd>
+python optical_depth_plotter_interp16.py <camera> <yyyy-mm-dd> [--no-plot]
 where:
     <camera> is an integer: 1/2
     <yyyy-mm-dd> is a date string e.g. <2022-07-29>
+    --no-plot only writes the distance csv (matplotlib.pyplot is never
+        imported), the plots can be made later for the photos wanted with
+        CloudOpticalDepthProcessor(fname).process_file(show='save')
 
  
 """
@@ -27,6 +30,7 @@ import Distance_Estimator as de
 # Extract arguments
 camera = int(sys.argv[1])
 date_to_use = str(sys.argv[2])
+no_plot = '--no-plot' in sys.argv[3:]
 # Path to area to write images and results to
 storage = '/gws/nopw/j04/dcmex/users/hburns/'
 # Path to write created images
@@ -41,10 +45,6 @@ yaw_error = 10
 # Optical depth threshold (cumulus cloud not cirrus)
 optical_depth_threshold = 3.6
 
-# Retireve camera details for the selected day
-cam_details = storage + '/camera_details.csv'
-cam_df = pd.read_csv(cam_details)
-
 # -------- Extract relevant files and camera info --------------------------- #
 # Create any folders that don't already exist
 if not os.path.exists(imgroot):
@@ -69,12 +69,17 @@ CT_lon = []
 for fname in fnames:
     processor = de.CloudOpticalDepthProcessor(fname)
     datetime_to_use = datetime.strptime(processor.date_to_use+processor.time_to_use, "%Y-%m-%d%H%M")
-    D, maxlat_2, maxlon_2 = processor.process_file(show='save')
+    if no_plot:
+        D, maxlat_2, maxlon_2, status = processor.find_distance()
+    else:
+        D, maxlat_2, maxlon_2 = processor.process_file(show='save')
     # Append results to lists
     distances.append(D)
     datetimes.append(datetime_to_use)
     CT_lat.append(maxlat_2)
     CT_lon.append(maxlon_2)
+# Every processor shares the satellite data cached for each hour
+print('satellite files opened:', de.GOES_CACHE.files_opened)
 # Create a DataFrame from the collected results and save it to a CSV file
 cloud_distances = pd.DataFrame(
     {'Datetimes': datetimes, 'Distance': distances, 'CT_lat': CT_lat,
@@ -0,0 +1,174 @@
+"""
+python module pair_raster.py
+
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Draw an image pair straight into an output raster, without matplotlib.
+
+The boxed cloud image goes on the left with the cloud top and base heights
+marked, and the optical depth FOV plot goes on the right, each under its
+title, as in the image_pairs.py figures. The output is width pixels wide and
+half as high. Each image is only decoded at the size it is drawn: when it is
+at least 2, 4 or 8 times bigger than its space it is read at 1/2, 1/4 or 1/8
+size (cv2.IMREAD_REDUCED_COLOR_*) and then shrunk to fit, so a worker only
+ever holds one small image pair at a time.
+
+pair_image can also draw the boxes on the photo from the heights and take
+the optical depth plot as an image in memory, so the videos of
+panel_video.py are made from the photos themselves without any image files
+in between.
+
+"""
+# import modules
+import cv2
+from PIL import Image, ImageDraw, ImageFont
+from cloudtop_pixel_heights import REDUCED_READ, THICKNESS
+
+# Width of the output image pairs in pixels
+WIDTH = 2000
+
+
+def fit_array(img, max_width, max_height):
+    """
+    Shrink an image in memory to fit in max_width x max_height.
+
+    Parameters:
+    - img (np.ndarray): (rows, columns, 3) image.
+    - max_width (int): Widest the image can be drawn.
+    - max_height (int): Highest the image can be drawn.
+
+    Returns:
+    - np.ndarray: The image at the size it is drawn.
+    """
+    height, width = img.shape[:2]
+    fit = min(max_width / width, max_height / height, 1.0)
+    size = (max(1, round(width * fit)), max(1, round(height * fit)))
+    if (width, height) == size:
+        return img
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def read_to_fit(path, max_width, max_height):
+    """
+    Read an image as RGB, shrunk to fit in max_width x max_height.
+
+    Parameters:
+    - path (str): Image file.
+    - max_width (int): Widest the image can be drawn.
+    - max_height (int): Highest the image can be drawn.
+
+    Returns:
+    - np.ndarray: RGB image at the size it is drawn.
+    - float: Drawn size over the size of the image file.
+    """
+    # Only the header is read for the size
+    with Image.open(path) as header:
+        width, height = header.size
+    fit = min(max_width / width, max_height / height, 1.0)
+    reduce = max([1] + [factor for factor in REDUCED_READ
+                        if factor <= 1 / fit])
+    if reduce == 1:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+    else:
+        img = cv2.imread(path, REDUCED_READ[reduce])
+    size = (max(1, round(width * fit)), max(1, round(height * fit)))
+    if (img.shape[1], img.shape[0]) != size:
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), fit
+
+
+def draw_title(draw, text, centre_x, bottom, font):
+    """
+    Draw a title, centred on centre_x, with its last line at bottom.
+    """
+    draw.multiline_text((centre_x, bottom), text, fill='black', font=font,
+                        anchor='md', align='center')
+
+
+def pair_image(pair, pitch, photo_path, fov_path, width=WIDTH,
+               draw_boxes=False):
+    """
+    Draw an image pair.
+
+    Parameters:
+    - pair (SimpleNamespace): Row of the image_pairs.pair_images table.
+    - pitch (float): Camera pitch in degrees.
+    - photo_path (str): Boxed cloud image (or the photo with draw_boxes).
+    - fov_path (str or np.ndarray): Optical depth FOV plot file, or the
+      plot as an RGB array (None if there isn't one).
+    - width (int): Width of the image pair in pixels.
+    - draw_boxes (bool): Draw the boxes round the clouds from the heights
+      (for photos without the boxes drawn on).
+
+    Returns:
+    - PIL.Image.Image: The image pair.
+    """
+    panel = width // 2
+    title_height = panel // 8
+    canvas = Image.new('RGB', (2 * panel, panel), 'white')
+    draw = ImageDraw.Draw(canvas)
+    title_font = ImageFont.load_default(size=max(8, panel // 50))
+    label_font = ImageFont.load_default(size=max(8, panel // 70))
+
+    photo, fit = read_to_fit(photo_path, panel, panel - title_height)
+    if draw_boxes and pair.has_heights:
+        thickness = max(1, round(THICKNESS * fit))
+        for X, W, CTP, CBP in ((pair.X1, pair.W1, pair.CTP1, pair.CBP1),
+                               (pair.X2, pair.W2, pair.CTP2, pair.CBP2)):
+            cv2.rectangle(photo, (round(X * fit), round(CTP * fit)),
+                          (round((X + W) * fit), round(CBP * fit)),
+                          (0, 255, 0), thickness)
+    left = (panel - photo.shape[1]) // 2
+    canvas.paste(Image.fromarray(photo), (left, title_height))
+    timestamp1 = str(pair.timestamp1)[:19].replace('T', ' ')
+    draw_title(draw, timestamp1 + '\n boxed cloud image \n pitch: ' +
+               str(pitch), panel // 2, title_height - 4, title_font)
+    if pair.has_heights:
+        # Cloud top and base heights at the middle of the top and bottom of
+        # each box
+        radius = max(2, panel // 250)
+        for W, X, CTP, CBP, CT, CB in (
+                (pair.W1, pair.X1, pair.CTP1, pair.CBP1, pair.CT1, pair.CB1),
+                (pair.W2, pair.X2, pair.CTP2, pair.CBP2, pair.CT2, pair.CB2)):
+            x = left + (W / 2 + X) * fit
+            for y, text, offset in ((CTP, CT, -30), (CBP, CB, 100)):
+                y = title_height + y * fit
+                draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                             fill='red')
+                draw.text((x - 100 * fit, y + offset * fit), str(text) +
+                          ' km', fill='black', font=label_font, anchor='ls')
+
+    if fov_path is None:
+        title = 'no optical depth plot'
+    else:
+        if isinstance(fov_path, str):
+            fov, _ = read_to_fit(fov_path, panel, panel - title_height)
+        else:
+            fov = fit_array(fov_path, panel, panel - title_height)
+        canvas.paste(Image.fromarray(fov),
+                     (panel + (panel - fov.shape[1]) // 2, title_height))
+        timestamp_nearest = str(pair.timestamp_nearest)[:19].replace('T', ' ')
+        title = timestamp_nearest + ' optical depth'
+        if pair.has_heights:
+            title += ' \n Distance to Cloud: ' + str(
+                int(pair.distance_to_cloud)) + ' km'
+    draw_title(draw, title, panel + panel // 2, title_height - 4, title_font)
+    return canvas
+
+
+def render_pair(pair, pitch, photo_path, fov_path, out_path, width=WIDTH):
+    """
+    Draw an image pair and save it.
+
+    Parameters:
+    - pair (SimpleNamespace): Row of the image_pairs.pair_images table.
+    - pitch (float): Camera pitch in degrees.
+    - photo_path (str): Boxed cloud image.
+    - fov_path (str): Optical depth FOV plot.
+    - out_path (str): File to save the image pair to.
+    - width (int): Width of the image pair in pixels.
+    """
+    pair_image(pair, pitch, photo_path, fov_path, width).save(out_path)
@@ -0,0 +1,111 @@
+"""
+python module panel_video.py
+
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Write a day's verification panels to one video instead of a png per panel.
+
+Each frame is a photo with the boxes round the clouds and the cloud top and
+base heights drawn on, next to the optical depth FOV plot of the scan
+nearest the photo (see pair_raster.py). The boxes are drawn from the heights
+table and the FOV plot is drawn in memory from the scan
+(CloudOpticalDepthProcessor.plotring, once per scan), so the video only needs
+the photos, the heights csv and the satellite files: no boxed images or FOV
+plots have to be saved first (see the --no-boxes and --no-plot options of
+stream_pipeline.py). The frames come from a generator and go straight to a
+cv2.VideoWriter, so no frame is ever written to disk as an image and only one
+frame is held in memory at a time. The video is written to a temporary file
+and renamed when it is finished.
+
+"""
+# import modules
+import os
+import sys
+from types import SimpleNamespace
+import cv2
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'StandAloneTools'))
+from Distance_Estimator import CloudOpticalDepthProcessor
+from pair_raster import pair_image
+
+# Frames per second of the videos
+FPS = 4
+# Codec of the videos
+FOURCC = 'mp4v'
+
+
+def panel_frames(pairs, pitch, width):
+    """
+    Draw the verification panel of each photo.
+
+    Parameters:
+    - pairs (pd.DataFrame): Photos with their heights
+      (image_pairs.pair_times), file1 the photo path.
+    - pitch (float): Camera pitch in degrees.
+    - width (int): Width of the frames in pixels.
+
+    Yields:
+    - np.ndarray: RGB frame for each photo in time order.
+    """
+    # The FOV plot of the last scan, photos in a row often share a scan
+    scan_time, fov = None, None
+    for row in pairs.to_dict('records'):
+        pair = SimpleNamespace(**row)
+        processor = CloudOpticalDepthProcessor(pair.file1)
+        try:
+            rad = processor.load_data()
+        except OSError:
+            # No satellite files for the hour the photo was taken
+            scan_time, fov = None, None
+        else:
+            if rad['t'].values != scan_time:
+                scan_time = rad['t'].values
+                # None if there is no cloud in the area
+                fov = processor.plotring(
+                    rad['var1'],
+                    f"Optical Depth Plot for {processor.date_to_use}",
+                    show='array')
+        pair.timestamp_nearest = scan_time
+        yield np.asarray(pair_image(pair, pitch, pair.file1, fov, width,
+                                    draw_boxes=True))
+
+
+def write_video(frames, out_path, fps=FPS):
+    """
+    Encode frames into a video.
+
+    Parameters:
+    - frames (iterable): RGB frames, all the same size.
+    - out_path (str): Video file to write e.g. '.../2022-07-27_camera_2.mp4'.
+    - fps (float): Frames per second.
+
+    Returns:
+    - int: Number of frames written (no file is written if there are none).
+    """
+    root, ext = os.path.splitext(out_path)
+    # Keep the extension so the container is chosen from it
+    tmp_path = root + '.tmp' + ext
+    writer = None
+    n_frames = 0
+    try:
+        for frame in frames:
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(
+                    tmp_path, cv2.VideoWriter_fourcc(*FOURCC), fps,
+                    (width, height))
+                if not writer.isOpened():
+                    raise IOError('could not open ' + tmp_path +
+                                  ' for writing')
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            n_frames += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    if n_frames:
+        os.replace(tmp_path, out_path)
+    return n_frames
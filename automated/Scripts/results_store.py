@@ -0,0 +1,518 @@
+"""
+python module results_store.py
+
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Optional Parquet storage of the results tables (needs pyarrow).
+
+The csv files pass the distance, cloud pixels and cloud top heights tables on
+with mixed types: Distance holds floats and the strings 'no cloud'/'none',
+Times is an 'HHMMSS' integer that loses its leading zeros and the times are
+strings to parse again. Here each table gets real types:
+
+- distances: Photo_Time and Scan_Time timestamps, Distance as a nullable
+  float, CT_lat/CT_lon as nullable integers and a Status column saying why
+  there is no distance,
+- pixels: Date_Time timestamp, Times kept as a zero padded 'HHMMSS' string
+  and the box rows/columns as integers,
+- heights: Time timestamp, heights and distance as floats and the pixel rows
+  as integers.
+
+The tables are kept under PARQUET_ROOT/<table>/date=<yyyy-mm-dd>/camera=<n>/
+so loading many days and cameras only reads the partitions asked for.
+The convert command converts the csv files of past days.
+
+Usage: python results_store.py convert <cameras> <start date> [<end date>]
+                               [--results-dir DIR]
+       python results_store.py consolidate [--results-dir DIR]
+       python results_store.py query [--start TIME] [--end TIME]
+                               [--cameras CAMERAS] [--hours HOURS]
+                               [--distance MIN MAX] [--by GROUPS]
+where
+cameras : comma separated cameras e.g. 1,2
+start date : string 'yyyy-mm-dd'
+end date : string 'yyyy-mm-dd' (defaults to the start date)
+--results-dir : folder holding the <date>/ csv folders (defaults to results2)
+--start/--end : first and last times to include e.g. '2022-07-01'
+--hours : comma separated hours of the day e.g. 15,16
+--distance : band of distances to the cloud in km e.g. 10 20
+--by : comma separated groups from date, hour and camera (default date,hour)
+
+For questions over the whole campaign (e.g. the max cloud top each hour of
+July for camera 2) consolidate brings every day's cloud top heights csv into
+one table, CONSOLIDATED_FILE, only reading the csv files that are new or have
+changed since the last time. HeightsStore memory maps the table, finds the
+rows for the cameras and times asked for by bisection (the table is sorted by
+camera then time) and gives back the rows or the max cloud top height, mean
+cloud base height and number of photos for each group.
+
+"""
+# import modules
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+from time_matching import parse_pixel_times
+
+# File storage path
+storage = '/home/users/hburns/GWS/DCMEX/users/hburns/'
+# Folder the Parquet tables are kept in
+PARQUET_ROOT = os.path.join(storage, 'parquet')
+# Tables and the csv file each one is made from
+TABLES = {'distances': 'Cloud_distnaces_camera_{camera}.csv',
+          'pixels': 'cloud_pixels_camera_{camera}.csv',
+          'heights': '{date}_camera_{camera}_cloud_top_heights.csv'}
+# Status for the strings left in the Distance column by older csv files
+DISTANCE_STATUS = {'none': 'no cloud in area', 'no cloud': 'no cloud in FOV'}
+PIXEL_COLUMNS = ['CB1', 'CB2', 'CT1', 'CT2', 'CX1', 'CX2', 'W1', 'W2']
+HEIGHT_PIXEL_COLUMNS = ['CTP1', 'CTP2', 'CBP1', 'CBP2', 'W1', 'W2', 'X1',
+                        'X2']
+HEIGHT_COLUMNS = ['distance_to_cloud', 'CT1', 'CT2', 'CB1', 'CB2', 'MAXCTH']
+# Cloud top heights of the whole campaign in one memory mappable table
+CONSOLIDATED_FILE = os.path.join(PARQUET_ROOT, 'cloud_top_heights.arrow')
+HEIGHTS_FILE = re.compile(
+    r'(\d{4}-\d{2}-\d{2})_camera_(\d+)_cloud_top_heights\.csv$')
+
+
+def parquet_available():
+    """
+    True if pyarrow is installed so the Parquet tables can be used.
+    """
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def typed_distances(df, date_to_use):
+    """
+    Give the distance table real types.
+
+    Parameters:
+    - df (pd.DataFrame): Table read from Cloud_distnaces_camera_<n>.csv.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+
+    Returns:
+    - pd.DataFrame: Photo_Time (NaT in tables written before
+      stream_pipeline.py), Scan_Time, Distance, CT_lat, CT_lon and Status columns.
+    """
+    distance = pd.to_numeric(df['Distance'], errors='coerce')
+    if 'Status' in df:
+        status = df['Status'].astype('string')
+    else:
+        status = df['Distance'].astype(str).map(DISTANCE_STATUS).fillna(
+            'cloud')
+        status = status.where(distance.notna() | (status != 'cloud'),
+                              'no distance').astype('string')
+    if 'Times' in df:
+        photo_time = parse_pixel_times(date_to_use, df['Times'])
+    else:
+        photo_time = pd.Series(pd.NaT, index=df.index)
+    typed = pd.DataFrame({
+        'Photo_Time': photo_time.astype('datetime64[ns]'),
+        'Scan_Time': pd.to_datetime(df['Datetimes'],
+                                    errors='coerce').astype('datetime64[ns]'),
+        'Distance': distance.astype('Float64'),
+        'CT_lat': pd.to_numeric(df['CT_lat'], errors='coerce').astype('Int64'),
+        'CT_lon': pd.to_numeric(df['CT_lon'], errors='coerce').astype('Int64'),
+        'Status': status})
+    return typed.reset_index(drop=True)
+
+
+def typed_pixels(df, date_to_use):
+    """
+    Give the cloud pixels table real types.
+
+    Parameters:
+    - df (pd.DataFrame): Table read from cloud_pixels_camera_<n>.csv.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+
+    Returns:
+    - pd.DataFrame: Date_Time, Times ('HHMMSS' strings) and the box columns.
+    """
+    typed = pd.DataFrame({
+        'Date_Time': parse_pixel_times(date_to_use,
+                                       df['Times']).astype('datetime64[ns]'),
+        'Times': df['Times'].astype(str).str.zfill(6).astype('string')})
+    for column in PIXEL_COLUMNS:
+        typed[column] = pd.to_numeric(df[column]).astype('Int64')
+    return typed.reset_index(drop=True)
+
+
+def typed_heights(df):
+    """
+    Give the cloud top heights table real types.
+
+    Parameters:
+    - df (pd.DataFrame): Table read from the cloud top heights csv.
+
+    Returns:
+    - pd.DataFrame: Time and the height, distance and pixel columns.
+    """
+    typed = pd.DataFrame(
+        {'Time': pd.to_datetime(df['Time']).astype('datetime64[ns]')})
+    for column in HEIGHT_COLUMNS:
+        typed[column] = pd.to_numeric(df[column],
+                                      errors='coerce').astype('Float64')
+    for column in HEIGHT_PIXEL_COLUMNS:
+        typed[column] = pd.to_numeric(df[column]).astype('Int64')
+    return typed.reset_index(drop=True)
+
+
+def partition_dir(table, camera, date_to_use, root=PARQUET_ROOT):
+    """
+    Folder of the Parquet files of a table for a camera and day.
+    """
+    return os.path.join(root, table, 'date=' + date_to_use,
+                        'camera=' + str(camera))
+
+
+def write_table(df, table, camera, date_to_use, root=PARQUET_ROOT):
+    """
+    Write (or replace) a table for a camera and day.
+
+    Parameters:
+    - df (pd.DataFrame): Typed table from typed_distances, typed_pixels or
+      typed_heights.
+    - table (str): 'distances', 'pixels' or 'heights'.
+    - camera (int): Camera number 1 or 2.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - root (str): Folder the tables are kept in.
+    """
+    folder = partition_dir(table, camera, date_to_use, root)
+    # Written next to the old partition then swapped in
+    tmp_folder = folder + '.tmp'
+    if os.path.exists(tmp_folder):
+        shutil.rmtree(tmp_folder)
+    os.makedirs(tmp_folder)
+    df.to_parquet(os.path.join(tmp_folder, 'part-0.parquet'), index=False)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.replace(tmp_folder, folder)
+
+
+def write_day(camera, date_to_use, results_dir, root=PARQUET_ROOT):
+    """
+    Convert the csv files of a camera and day to Parquet tables.
+
+    Parameters:
+    - camera (int): Camera number 1 or 2.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - results_dir (str): Folder holding the day's csv files.
+    - root (str): Folder the tables are kept in.
+
+    Returns:
+    - list: The tables written (tables with no csv file are skipped).
+    """
+    written = []
+    for table, csv_name in TABLES.items():
+        csv_file = os.path.join(results_dir, csv_name.format(
+            camera=camera, date=date_to_use))
+        if not os.path.exists(csv_file):
+            continue
+        df = pd.read_csv(csv_file, index_col=0)
+        if table == 'distances':
+            df = typed_distances(df, date_to_use)
+        elif table == 'pixels':
+            df = typed_pixels(df, date_to_use)
+        else:
+            df = typed_heights(df)
+        write_table(df, table, camera, date_to_use, root)
+        written.append(table)
+    return written
+
+
+def load_table(table, dates=None, cameras=None, root=PARQUET_ROOT):
+    """
+    Load a table for many days and cameras.
+
+    Parameters:
+    - table (str): 'distances', 'pixels' or 'heights'.
+    - dates (list): 'yyyy-mm-dd' dates to load (None for all).
+    - cameras (list): Cameras to load (None for all).
+    - root (str): Folder the tables are kept in.
+
+    Returns:
+    - pd.DataFrame: The table with date (str) and camera (int) columns.
+    """
+    filters = []
+    if dates is not None:
+        filters.append(('date', 'in', list(dates)))
+    if cameras is not None:
+        filters.append(('camera', 'in', [int(camera) for camera in cameras]))
+    df = pd.read_parquet(os.path.join(root, table),
+                         filters=filters or None)
+    df['date'] = df['date'].astype(str)
+    df['camera'] = df['camera'].astype(np.int64)
+    return df
+
+
+def heights_csv_files(results_dir):
+    """
+    Find the cloud top heights csv files under a results folder.
+
+    Parameters:
+    - results_dir (str): Folder holding the <date>/ csv folders.
+
+    Returns:
+    - dict: {(date, camera): csv file path}.
+    """
+    files = {}
+    for csv_file in glob.glob(os.path.join(results_dir, '*',
+                                           '*_cloud_top_heights.csv')):
+        match = HEIGHTS_FILE.match(os.path.basename(csv_file))
+        if match:
+            files[(match.group(1), int(match.group(2)))] = csv_file
+    return files
+
+
+def consolidate_heights(results_dir, consolidated_file=CONSOLIDATED_FILE):
+    """
+    Bring the cloud top heights csv files into one consolidated table.
+
+    Only csv files that are new or have changed since the table was last
+    written are read, the rows of the others are kept from the old table.
+    The table is sorted by camera then time so HeightsStore can find the
+    rows for a camera and time range by bisection, and is written as an
+    uncompressed Arrow file so it can be memory mapped.
+
+    Parameters:
+    - results_dir (str): Folder holding the <date>/ csv folders.
+    - consolidated_file (str): The Arrow file to write.
+
+    Returns:
+    - int: Number of csv files read.
+    """
+    import pyarrow as pa
+    files = heights_csv_files(results_dir)
+    stamps = {}
+    for key, csv_file in files.items():
+        stat = os.stat(csv_file)
+        stamps['{}/{}'.format(*key)] = [stat.st_size, stat.st_mtime_ns]
+    tables = []
+    old_stamps = {}
+    if os.path.exists(consolidated_file):
+        old = pa.ipc.open_file(pa.memory_map(consolidated_file)).read_all()
+        old_stamps = json.loads(old.schema.metadata[b'sources'])
+    if old_stamps:
+        unchanged = [key for key, stamp in old_stamps.items()
+                     if stamps.get(key) == stamp]
+        keys = pd.Series(old.column('date').to_numpy(zero_copy_only=False)
+                         ).str.cat(old.column('camera').to_numpy().astype(str),
+                                   sep='/')
+        tables.append(old.filter(pa.array(keys.isin(unchanged).to_numpy()))
+                      .replace_schema_metadata(None))
+    n_read = 0
+    for key, csv_file in files.items():
+        name = '{}/{}'.format(*key)
+        if old_stamps.get(name) == stamps[name]:
+            continue
+        df = typed_heights(pd.read_csv(csv_file, index_col=0))
+        df['hour'] = df['Time'].dt.hour.astype(np.int8)
+        df['date'] = key[0]
+        df['camera'] = np.int8(key[1])
+        tables.append(pa.Table.from_pandas(df, preserve_index=False))
+        n_read += 1
+    if tables:
+        table = pa.concat_tables(tables, promote_options='permissive')
+        table = table.sort_by([('camera', 'ascending'),
+                               ('Time', 'ascending')])
+    else:
+        table = pa.table({'Time': pa.array([], pa.timestamp('ns')),
+                          'camera': pa.array([], pa.int8())})
+    table = table.combine_chunks().replace_schema_metadata(
+        {'sources': json.dumps(stamps)})
+    folder = os.path.dirname(consolidated_file)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    # Write to a temporary file then swap it in so a crash (or a query
+    # reading the old table) can't see a half written file
+    tmp_file = consolidated_file + '.tmp'
+    with pa.OSFile(tmp_file, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file, consolidated_file)
+    return n_read
+
+
+class HeightsStore:
+    """
+    Queries over the consolidated cloud top heights of the whole campaign.
+
+    The consolidated table (see consolidate_heights) is memory mapped, so
+    only the pages of the rows asked for are read from disk.
+
+    Attributes:
+        table (pyarrow.Table): The memory mapped table.
+    """
+
+    def __init__(self, consolidated_file=CONSOLIDATED_FILE):
+        """
+        Memory map the consolidated table.
+        """
+        import pyarrow as pa
+        self.table = pa.ipc.open_file(
+            pa.memory_map(consolidated_file)).read_all()
+        # Zero copy views of the sort columns
+        self._camera = self.table.column('camera').to_numpy()
+        self._time = self.table.column('Time').to_numpy()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def _row_ranges(self, start=None, end=None, cameras=None):
+        """
+        (first, last + 1) rows of each camera between start and end.
+        """
+        if cameras is None:
+            cameras = np.unique(self._camera)
+        ranges = []
+        for camera in cameras:
+            first = np.searchsorted(self._camera, camera, side='left')
+            last = np.searchsorted(self._camera, camera, side='right')
+            times = self._time[first:last]
+            if end is not None:
+                last = first + np.searchsorted(
+                    times, np.datetime64(pd.Timestamp(end), 'ns'),
+                    side='right')
+            if start is not None:
+                first += np.searchsorted(
+                    times, np.datetime64(pd.Timestamp(start), 'ns'),
+                    side='left')
+            if last > first:
+                ranges.append((first, last))
+        return ranges
+
+    def query(self, start=None, end=None, cameras=None, hours=None,
+              distance=None):
+        """
+        Rows of the consolidated table.
+
+        Parameters:
+        - start (str): First time to include e.g. '2022-07-01' (None for
+          the first).
+        - end (str): Last time to include e.g. '2022-07-31 23:59:59' (None
+          for the last).
+        - cameras (list): Cameras to include (None for all).
+        - hours (list): Hours of the day to include (None for all).
+        - distance (tuple): (min, max) distance to the cloud in km to
+          include (None for all).
+
+        Returns:
+        - pd.DataFrame: The cloud top heights with hour, date and camera
+          columns.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        slices = [self.table.slice(first, last - first)
+                  for first, last in self._row_ranges(start, end, cameras)]
+        if not slices:
+            return self.table.slice(0, 0).to_pandas()
+        table = pa.concat_tables(slices)
+        mask = None
+        if hours is not None:
+            mask = pc.is_in(table.column('hour'),
+                            value_set=pa.array(list(hours), pa.int8()))
+        if distance is not None:
+            column = table.column('distance_to_cloud')
+            in_band = pc.and_(pc.greater_equal(column, distance[0]),
+                              pc.less_equal(column, distance[1]))
+            mask = in_band if mask is None else pc.and_(mask, in_band)
+        if mask is not None:
+            table = table.filter(mask)
+        return table.to_pandas()
+
+    def aggregate(self, by=('date', 'hour'), **kwargs):
+        """
+        Max cloud top height, mean cloud base height and photo counts.
+
+        Parameters:
+        - by (tuple): Columns to group by, from 'date', 'hour' and 'camera'.
+        - **kwargs: The query arguments (start, end, cameras, hours,
+          distance).
+
+        Returns:
+        - pd.DataFrame: max_CTH (max of MAXCTH), mean_CBH (mean of CB1 and
+          CB2 over both boxes) and count (photos) for each group.
+        """
+        df = self.query(**kwargs)
+        by = list(by)
+        grouped = df.groupby(by)
+        result = pd.DataFrame({
+            'max_CTH': grouped['MAXCTH'].max(),
+            'count': grouped.size()})
+        bases = pd.concat([df[by + ['CB1']].rename(columns={'CB1': 'CBH'}),
+                           df[by + ['CB2']].rename(columns={'CB2': 'CBH'})])
+        result['mean_CBH'] = bases.groupby(by)['CBH'].mean()
+        return result[['max_CTH', 'mean_CBH', 'count']]
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Parquet tables and campaign queries of the results.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser(
+        'convert', help='convert the results csv files to Parquet tables')
+    convert.add_argument('cameras', help="comma separated cameras e.g. '1,2'")
+    convert.add_argument('start_date', help="'yyyy-mm-dd'")
+    convert.add_argument('end_date', nargs='?', default=None,
+                         help="'yyyy-mm-dd' (defaults to start_date)")
+    consolidate = subparsers.add_parser(
+        'consolidate', help='update the consolidated cloud top heights')
+    query = subparsers.add_parser(
+        'query', help='max CTH, mean CBH and counts from the consolidated '
+        'cloud top heights')
+    query.add_argument('--start', help="first time e.g. '2022-07-01'")
+    query.add_argument('--end', help="last time e.g. '2022-07-31 23:59'")
+    query.add_argument('--cameras', help="comma separated cameras e.g. '2'")
+    query.add_argument('--hours', help="comma separated hours e.g. '15,16'")
+    query.add_argument('--distance', nargs=2, type=float,
+                       metavar=('MIN', 'MAX'),
+                       help='distance to the cloud band in km')
+    query.add_argument('--by', default='date,hour',
+                       help="comma separated groups from date, hour and "
+                       "camera (default 'date,hour')")
+    for subparser in (convert, consolidate):
+        subparser.add_argument(
+            '--results-dir', default=os.path.join(storage, 'results2'),
+            help='folder holding the <date>/ csv folders')
+    args = parser.parse_args()
+    if not parquet_available():
+        parser.error('pyarrow is needed for the Parquet tables')
+
+    if args.command == 'convert':
+        cameras = [int(camera) for camera in args.cameras.split(',')]
+        end_date = args.end_date or args.start_date
+        for date_to_use in pd.date_range(args.start_date,
+                                         end_date).strftime('%Y-%m-%d'):
+            for camera in cameras:
+                written = write_day(camera, date_to_use,
+                                    os.path.join(args.results_dir,
+                                                 date_to_use))
+                print('camera', camera, 'on', date_to_use + ':',
+                      ', '.join(written) if written else 'no csv files')
+    elif args.command == 'consolidate':
+        n_read = consolidate_heights(args.results_dir)
+        print(n_read, 'csv files read,', len(HeightsStore()),
+              'rows in', CONSOLIDATED_FILE)
+    else:
+        store = HeightsStore()
+        print(store.aggregate(
+            by=args.by.split(','), start=args.start, end=args.end,
+            cameras=(None if args.cameras is None else
+                     [int(camera) for camera in args.cameras.split(',')]),
+            hours=(None if args.hours is None else
+                   [int(hour) for hour in args.hours.split(',')]),
+            distance=args.distance).to_string())
+
+
+if __name__ == "__main__":
+    main()
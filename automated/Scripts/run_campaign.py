@@ -0,0 +1,300 @@
+"""
+python script run_campaign.py
+
+author: helen burns CEMAC UoL 2023
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Usage: python run_campaign.py <cameras> <start date> [<end date>]
+                              [--workers N] [--no-plot] [--parquet]
+                              [--raster] [--video] [--width W] [--force]
+                              [--failed]
+where
+cameras : comma separated cameras e.g. 1,2
+start date : string 'yyyy-mm-dd'
+end date : string 'yyyy-mm-dd' (defaults to the start date)
+--workers : number of (camera, date) chains run at once (defaults to the
+            number of cores)
+--no-plot : only write the csv files (no optical depth FOV plots or
+            scatter plots of the heights)
+--parquet : also keep the day's tables as Parquet (see results_store.py,
+            needs pyarrow)
+--raster : draw the image pairs without matplotlib (see pair_raster.py)
+--video : write each day to one video (image_pairs.py --video) instead of
+          image pair pngs, and don't save the boxed photos, which only the
+          pngs need (with --no-plot no image is saved for each photo)
+--width : width of the --raster image pairs or --video in pixels
+          (default 2000)
+--force : run every stage again, even the ones already done
+--failed : only run the chains whose last run failed
+
+Runs the whole workflow (what Findclouds.sh did for one camera and day) for
+every camera and day from start date to end date. Each (camera, date) is a
+chain of four stages, each needing the one before:
+
+distance -> pixels -> heights -> pairs
+
+The distance, pixels and heights stages are run photo by photo by
+stream_pipeline.py and the pairs by image_pairs.py. The chains don't depend
+on each other so they are run at the same time over a process pool, one
+chain per worker (the image pairs of a chain are drawn in its own worker).
+Days a camera has no photos for are left out.
+
+The stages done, the time spent in each and the error of a failed chain are
+saved to results2/<date>/campaign_camera_<n>.json as each chain finishes.
+Running again skips the stages already done, so after a failure only the
+failed chains do any work, and the stream is picked up from its watermark
+(see stream_pipeline.py --incremental). A single day can be rerun alone by
+giving just that camera and date. The time spent in each stage, summed over
+the chains, is printed at the end.
+
+"""
+# import modules
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from batch_cloud_pixels import campaign_dates
+from calculate_heights import heights_csv
+from cloudtop_pixel_heights import find_image_files, results_root
+from stream_pipeline import replace_file, run_pipeline
+from image_pairs import run_pairs
+import results_store
+
+# Stages of each chain in the order they are run
+STAGES = ('distance', 'pixels', 'heights', 'pairs')
+# Stages run together photo by photo by stream_pipeline.py
+STREAM_STAGES = STAGES[:3]
+
+
+def state_file(camera, date_to_use):
+    """
+    State file of a (camera, date) chain.
+    """
+    return os.path.join(results_root(date_to_use),
+                        f'campaign_camera_{camera}.json')
+
+
+def load_state(camera, date_to_use):
+    """
+    Load the state of a chain.
+
+    Returns:
+    - dict: 'done' (stages done), 'timings' (seconds in each stage) and
+      'error' (None unless the last run failed).
+    """
+    path = state_file(camera, date_to_use)
+    if not os.path.exists(path):
+        return {'done': [], 'timings': {}, 'error': None}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(camera, date_to_use, state):
+    """
+    Save the state of a chain in one go.
+    """
+    if not os.path.exists(results_root(date_to_use)):
+        os.makedirs(results_root(date_to_use))
+    replace_file(state_file(camera, date_to_use),
+                 json.dumps(state, indent=1))
+
+
+def plan_chains(cameras, dates, force=False, failed=False):
+    """
+    Build the list of chains to run.
+
+    Parameters:
+    - cameras (list): Camera numbers.
+    - dates (list): 'yyyy-mm-dd' date strings.
+    - force (bool): Run every chain from the start.
+    - failed (bool): Only run the chains whose last run failed.
+
+    Returns:
+    - list: (camera, date) of each chain with stages left to run.
+    """
+    chains = []
+    for date_to_use in dates:
+        for camera in cameras:
+            if not find_image_files(camera, date_to_use):
+                print('no photos for camera', camera, 'on', date_to_use)
+                continue
+            if force:
+                chains.append((camera, date_to_use))
+                continue
+            state = load_state(camera, date_to_use)
+            if failed and state['error'] is None:
+                continue
+            if set(STAGES) - set(state['done']):
+                chains.append((camera, date_to_use))
+            else:
+                print('camera', camera, 'on', date_to_use, 'already done')
+    return chains
+
+
+def run_chain(task):
+    """
+    Run the stages of a chain not done yet (called in the worker processes).
+
+    Parameters:
+    - task (tuple): (camera, date, options) where options is a dict of
+      plot, parquet, raster, video, width and force.
+
+    Returns:
+    - tuple: (camera, date, state after the run, seconds for each stage
+      run this time)
+    """
+    camera, date_to_use, options = task
+    state = ({'done': [], 'timings': {}, 'error': None} if options['force']
+             else load_state(camera, date_to_use))
+    state['error'] = None
+    timings = {}
+    try:
+        if set(STREAM_STAGES) - set(state['done']):
+            timings.update(dict.fromkeys(STREAM_STAGES, 0.0))
+            run_pipeline(camera, date_to_use, plot=options['plot'],
+                         incremental=not options['force'],
+                         parquet=options['parquet'], timings=timings,
+                         save_boxes=not options['video'])
+            state['done'] = list(STREAM_STAGES)
+        if 'pairs' not in state['done']:
+            start = time.perf_counter()
+            # No heights csv is written for a day without any cloud
+            if os.path.exists(heights_csv(camera, date_to_use,
+                                          results_root(date_to_use) + '/')):
+                run_pairs(camera, date_to_use, raster=options['raster'],
+                          width=options['width'], workers=1,
+                          video=options['video'])
+            else:
+                print('no clouds for camera', camera, 'on', date_to_use)
+            timings['pairs'] = time.perf_counter() - start
+            state['done'].append('pairs')
+    except Exception:
+        state['error'] = traceback.format_exc()
+    for stage, seconds in timings.items():
+        state['timings'][stage] = state['timings'].get(stage, 0.0) + seconds
+    save_state(camera, date_to_use, state)
+    return camera, date_to_use, state, timings
+
+
+def timing_summary(timings):
+    """
+    Table of the time spent in each stage.
+
+    Parameters:
+    - timings (list): Seconds for each stage run, one dict per chain.
+
+    Returns:
+    - pd.DataFrame: Chains, total, mean and max seconds for each stage.
+    """
+    df = pd.DataFrame(timings, columns=list(STAGES))
+    return pd.DataFrame({'chains': df.count(), 'total_s': df.sum(),
+                         'mean_s': df.mean(), 'max_s': df.max()}).round(1)
+
+
+def run_campaign(cameras, dates, workers=None, plot=True, parquet=False,
+                 raster=False, width=2000, force=False, failed=False,
+                 video=False):
+    """
+    Run the chain of every camera and day over a process pool.
+
+    Parameters:
+    - cameras (list): Camera numbers.
+    - dates (list): 'yyyy-mm-dd' date strings.
+    - workers (int): Number of chains run at once (None uses every core).
+    - plot (bool): Save the FOV plots and the scatter plots of the heights.
+    - parquet (bool): Also write the day's tables to the Parquet store.
+    - raster (bool): Draw the image pairs without matplotlib.
+    - width (int): Width of the raster image pairs in pixels.
+    - force (bool): Run every stage again.
+    - failed (bool): Only run the chains whose last run failed.
+    - video (bool): Write a video of each day instead of image pair pngs.
+
+    Returns:
+    - dict: State of each chain run keyed by (camera, date).
+    """
+    chains = plan_chains(cameras, dates, force, failed)
+    print(len(chains), 'chains to run')
+    options = {'plot': plot, 'parquet': parquet, 'raster': raster,
+               'video': video, 'width': width, 'force': force}
+    states = {}
+    timings = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_chain, (camera, date_to_use, options)):
+                   (camera, date_to_use) for camera, date_to_use in chains}
+        for future in as_completed(futures):
+            camera, date_to_use = futures[future]
+            try:
+                _, _, state, chain_timings = future.result()
+            except Exception:
+                # The worker itself died, so the state file was not updated
+                state = load_state(camera, date_to_use)
+                state['error'] = traceback.format_exc()
+                chain_timings = {}
+            states[(camera, date_to_use)] = state
+            timings.append(chain_timings)
+            print('camera', camera, 'on', date_to_use + ':',
+                  'failed' if state['error'] else 'done',
+                  f"({sum(chain_timings.values()):.1f} s)")
+    elapsed = time.perf_counter() - start
+
+    print(timing_summary(timings).to_string())
+    print(f'{len(chains)} chains in {elapsed:.1f} s')
+    failures = sorted(key for key, state in states.items() if state['error'])
+    for camera, date_to_use in failures:
+        print('camera', camera, 'on', date_to_use, 'failed, see',
+              state_file(camera, date_to_use))
+    return states
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Find the cloud top heights and image pairs for many '
+        'days and cameras.')
+    parser.add_argument('cameras', help="comma separated cameras e.g. '1,2'")
+    parser.add_argument('start_date', help="'yyyy-mm-dd'")
+    parser.add_argument('end_date', nargs='?', default=None,
+                        help="'yyyy-mm-dd' (defaults to start_date)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of chains run at once')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='only write the csv files')
+    parser.add_argument('--parquet', action='store_true',
+                        help='also write the Parquet tables (needs pyarrow)')
+    parser.add_argument('--raster', action='store_true',
+                        help='draw the image pairs without matplotlib')
+    parser.add_argument('--video', action='store_true',
+                        help='write a video of each day instead of image '
+                        'pair pngs')
+    parser.add_argument('--width', type=int, default=2000,
+                        help='width of the --raster image pairs or --video '
+                        'in pixels')
+    parser.add_argument('--force', action='store_true',
+                        help='run every stage again')
+    parser.add_argument('--failed', action='store_true',
+                        help='only run the chains whose last run failed')
+    args = parser.parse_args()
+    if args.parquet and not results_store.parquet_available():
+        parser.error('pyarrow is needed for --parquet')
+    cameras = [int(camera) for camera in args.cameras.split(',')]
+    states = run_campaign(cameras,
+                          campaign_dates(args.start_date, args.end_date),
+                          workers=args.workers, plot=not args.no_plot,
+                          parquet=args.parquet, raster=args.raster,
+                          width=args.width, force=args.force,
+                          failed=args.failed, video=args.video)
+    if any(state['error'] for state in states.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""
+python script stream_pipeline.py
+
+author: helen burns CEMAC UoL 2023
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Usage: python stream_pipeline.py <camera> <date> [--no-plot] [--no-boxes]
+                                  [--incremental] [--parquet]
+where
+camera : interger 1 or 2
+date : string 'yyyy-mm-dd'
+--no-plot : only write the csv files (no optical depth FOV plots or
+            scatter plots of the heights)
+--no-boxes : don't save the photos with the boxes drawn on (they are only
+             needed for the image_pairs.py pngs, not its --video)
+--incremental : only process the photos taken since the last run, adding to
+                the csv files instead of starting them again
+--parquet : also keep the day's tables as Parquet (see results_store.py,
+            needs pyarrow)
+
+this script does the work of optical_depth_plotter.py,
+cloudtop_pixel_heights.py and calculate_heights.py photo by photo in one
+process. A generator walks through the day's photos in time order and each
+photo's distance to the max optical depth, cloud boxes and cloud heights are
+handed straight on to the next stage in memory instead of being written to a
+csv file and read back in by the next script.
+
+The distance is found from the optical depth scan nearest the photo (see
+CloudOpticalDepthProcessor in StandAloneTools/Distance_Estimator.py) and
+contours are only found in photos with a cloud between 10 and 30 km. A row is
+appended to each of the distance, cloud pixels and cloud top heights csv files
+in results2/<date>/ as soon as a photo is done, so the day's results start
+appearing straight away. The FOV plots and heights csv are the ones
+image_pairs.py reads.
+
+After each photo the time of the photo and the number of rows in each csv
+file are saved as a watermark (watermark_camera_<n>.json next to the csv
+files). With --incremental only photos newer than the watermark are
+processed, so the script can be rerun as new photos and satellite scans
+arrive during the day. A photo is held back until there is a satellite scan
+at or after the time it was taken, so it is matched to the same scan as in a
+full run. Each photo's rows are appended to the end of the csv files and
+flushed to disk, the watermark is replaced in one go (written to a temporary
+file then renamed), and any rows written after the last watermark, e.g. by a
+run that was killed part way through a photo, are dropped when the next
+incremental run starts.
+
+"""
+# import modules
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'StandAloneTools'))
+from Distance_Estimator import (CloudOpticalDepthProcessor, GOES_CACHE,
+                                GOESDataCache)
+from cloudtop_pixel_heights import (WHITENESS_THRESHOLD, THICKNESS, NOTSKY,
+                                    image_root, results_root,
+                                    setup_directories, find_image_files,
+                                    extract_image_times, find_contours,
+                                    cloud_pixels_dataframe)
+from calculate_heights import (cloud_heights, heights_csv,
+                               load_camera_details, plot_heights)
+from time_matching import parse_pixel_times
+import results_store
+
+
+def replace_file(path, text):
+    """
+    Write a text file in one go by writing a temporary file and renaming it.
+    """
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+class CSVAppender:
+    """
+    Write a csv file a few rows at a time.
+
+    The header is written with the first rows and each append only adds the
+    new rows to the end of the file, flushed to disk straight away. A row
+    half written when a run is killed is after the rows counted in the
+    watermark, so it is dropped when the file is opened again. The index
+    keeps counting up across appends, as if the whole DataFrame had been
+    written with to_csv in one go.
+
+    Attributes:
+        path (str): The csv file.
+        rows (int): Number of rows written so far.
+    """
+
+    def __init__(self, path, rows=None):
+        """
+        Start a new csv file, replacing any old one, or carry on with the
+        first rows rows of an existing one (dropping any after them).
+        """
+        self.path = path
+        self.rows = 0
+        if rows and os.path.exists(path):
+            with open(path) as f:
+                lines = f.readlines()
+            # Header and the rows to keep
+            self.rows = max(0, min(rows, len(lines) - 1))
+            if self.rows == 0:
+                # Start again, header and all
+                os.remove(path)
+            elif len(lines) > self.rows + 1:
+                replace_file(path, ''.join(lines[:self.rows + 1]))
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def append(self, df):
+        """
+        Append the rows of a DataFrame to the csv file.
+        """
+        df.index = range(self.rows, self.rows + len(df))
+        with open(self.path, 'a') as f:
+            f.write(df.to_csv(header=self.rows == 0))
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows += len(df)
+
+
+class Watermark:
+    """
+    The last photo processed for a camera and day and how many rows each csv
+    file had then.
+
+    Attributes:
+        path (str): The json file the watermark is kept in.
+        last_photo (str): 'HHMMSS' time of the last photo processed, None if
+            there has not been a run yet.
+        rows (dict): Number of rows in each csv file.
+    """
+
+    def __init__(self, path):
+        """
+        Read the watermark if there is one.
+        """
+        self.path = path
+        self.last_photo = None
+        self.rows = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.last_photo = state['last_photo']
+            self.rows = state['rows']
+
+    def save(self, last_photo, rows):
+        """
+        Move the watermark on to a photo.
+        """
+        self.last_photo = last_photo
+        self.rows = dict(rows)
+        replace_file(self.path, json.dumps({'last_photo': last_photo,
+                                            'rows': self.rows}))
+
+
+def add_time(timings, stage, start):
+    """
+    Add the time since start to the total time of a stage.
+
+    Parameters:
+    - timings (dict): Seconds spent in each stage (None to not keep them).
+    - stage (str): 'distance', 'pixels' or 'heights'.
+    - start (float): time.perf_counter() when the stage started.
+
+    Returns:
+    - float: time.perf_counter() now, the start of the next stage.
+    """
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+
+def latest_scan_time(date_to_use):
+    """
+    Time of the latest optical depth scan of a day on disk.
+
+    Returns:
+    - datetime: Start time of the scan, None if there are none yet.
+    """
+    date_path = date_to_use.replace('-', '/', 3)
+    fnames = glob.glob(GOESDataCache.file_root + GOESDataCache.channel1 +
+                       date_path + '/*' + GOESDataCache.fname_root)
+    times = []
+    for fname in fnames:
+        # Start time of the scan, s<yyyy><day of year><HHMMSS>
+        match = re.search(r'_s(\d{13})', os.path.basename(fname))
+        if match:
+            times.append(datetime.strptime(match.group(1), '%Y%j%H%M%S'))
+    return max(times) if times else None
+
+
+def new_photos(photos, date_to_use, last_photo, latest_scan):
+    """
+    Only pass on the photos newer than the last run that have a satellite
+    scan at or after the time they were taken.
+
+    Parameters:
+    - photos (iterator): (file path, 'HHMMSS') of the photos in time order.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - last_photo (str): 'HHMMSS' of the last photo processed, or None.
+    - latest_scan (datetime): Time of the latest scan, or None.
+
+    Yields:
+    - tuple: (file path, 'HHMMSS') of each photo to process.
+    """
+    for fname, hhmmss in photos:
+        if last_photo is not None and hhmmss <= last_photo:
+            continue
+        photo_time = datetime.strptime(date_to_use + hhmmss, '%Y-%m-%d%H%M%S')
+        if latest_scan is None or photo_time > latest_scan:
+            # Wait for the next scan (and keep the photos in order)
+            break
+        yield fname, hhmmss
+
+
+def photo_stream(camera, date_to_use):
+    """
+    Yield the day's photos in time order.
+
+    Parameters:
+    - camera (int): Camera number 1 or 2.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+
+    Yields:
+    - tuple: (file path, 'HHMMSS' time) of each photo.
+    """
+    fnames = sorted(find_image_files(camera, date_to_use))
+    time_list, _ = extract_image_times(fnames)
+    for fname, hhmmss in zip(fnames, time_list):
+        yield fname, hhmmss
+
+
+def process_photo(fname, hhmmss, date_to_use, pitch, camera_height, imgroot,
+                  plot=True, timings=None, save_boxes=True):
+    """
+    Find the distance, cloud boxes and cloud heights for one photo.
+
+    Parameters:
+    - fname (str): File path of the photo.
+    - hhmmss (str): Time the photo was taken.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - pitch (float): Pitch of the camera in degrees.
+    - camera_height (float): Height of the camera in kilometers.
+    - imgroot (str): Folder to save the boxed photo to.
+    - plot (bool): Also save the optical depth FOV plot.
+    - timings (dict): Seconds spent in each stage, added to (optional).
+    - save_boxes (bool): Save the photo with the boxes drawn on.
+
+    Returns:
+    - distance (pd.DataFrame): One row with the photo time, the time of the
+      scan used and the find_cloud output (status 'no optical depth data'
+      if there are no scans for the hour).
+    - pixels (pd.DataFrame): One cloud_pixels_dataframe row, or None if there
+      is no cloud between 10 and 30 km.
+    - heights (pd.DataFrame): One cloud_heights row, or None.
+    """
+    start = time.perf_counter()
+    processor = CloudOpticalDepthProcessor(fname)
+    try:
+        rad = processor.load_data()
+    except OSError:
+        # No satellite files for the hour the photo was taken
+        print('no optical depth data')
+        distance = pd.DataFrame({'Times': [hhmmss], 'Datetimes': ['none'],
+                                 'Distance': ['none'], 'CT_lat': ['none'],
+                                 'CT_lon': ['none'],
+                                 'Status': ['no optical depth data']})
+        add_time(timings, 'distance', start)
+        return distance, None, None
+    D, maxlat, maxlon, status = processor.find_cloud(rad['var1'])
+    distance = pd.DataFrame({'Times': [hhmmss],
+                             'Datetimes': [rad['t'].values],
+                             'Distance': [D], 'CT_lat': [maxlat],
+                             'CT_lon': [maxlon], 'Status': [status]})
+    # Same selection as select_cloudy_images and the distance filter in
+    # calculate_heights.py
+    if status != 'cloud' or D > 30 or D < 10:
+        add_time(timings, 'distance', start)
+        return distance, None, None
+    if plot:
+        # Folder CloudOpticalDepthProcessor saves the FOV plots to
+        fov_root = os.path.join(processor.imgroot, processor.camera)
+        if not os.path.exists(fov_root):
+            os.makedirs(fov_root)
+        processor.plotring(rad['var1'],
+                           f"Optical Depth Plot for {date_to_use}",
+                           show='save')
+    start = add_time(timings, 'distance', start)
+    cloudbox = find_contours(fname, date_to_use + '-' + hhmmss + '_',
+                             WHITENESS_THRESHOLD, THICKNESS, NOTSKY, imgroot,
+                             save_image=save_boxes)
+    pixels = cloud_pixels_dataframe([hhmmss], [cloudbox])
+    start = add_time(timings, 'pixels', start)
+    matched = pixels.assign(
+        Date_Time=parse_pixel_times(date_to_use, pixels.Times),
+        Distance=float(D))
+    heights = cloud_heights(matched, pitch, camera_height)
+    add_time(timings, 'heights', start)
+    return distance, pixels, heights
+
+
+def run_pipeline(camera, date_to_use, plot=True, incremental=False,
+                 parquet=False, timings=None, save_boxes=True):
+    """
+    Run the distance, contour and height stages photo by photo for a day.
+
+    Parameters:
+    - camera (int): Camera number 1 or 2.
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - plot (bool): Save the FOV plots and the scatter plots of the heights.
+    - incremental (bool): Only process photos newer than the watermark and
+      add to the csv files.
+    - parquet (bool): Also write the day's tables to the Parquet store.
+    - timings (dict): Seconds spent in the distance, pixels and heights
+      stages, added to (optional).
+    - save_boxes (bool): Save the photos with the boxes drawn on.
+
+    Returns:
+    - pd.DataFrame: The day's cloud top heights.
+    """
+    setup_directories(camera, date_to_use)
+    imgroot = image_root(camera, date_to_use)
+    outroot = results_root(date_to_use) + '/'
+    pitch, camera_height = load_camera_details(camera, date_to_use)
+
+    watermark = Watermark(outroot + 'watermark_camera_' + str(camera) +
+                          '.json')
+    resume = incremental and watermark.last_photo is not None
+    rows = watermark.rows if resume else {}
+    distance_csv = CSVAppender(
+        outroot + 'Cloud_distnaces_camera_' + str(camera) + '.csv',
+        rows.get('distance'))
+    pixels_csv = CSVAppender(
+        outroot + 'cloud_pixels_camera_' + str(camera) + '.csv',
+        rows.get('pixels'))
+    heights_out = CSVAppender(heights_csv(camera, date_to_use, outroot),
+                              rows.get('heights'))
+    photos = photo_stream(camera, date_to_use)
+    if incremental:
+        photos = new_photos(photos, date_to_use,
+                            watermark.last_photo if resume else None,
+                            latest_scan_time(date_to_use))
+    processed = 0
+    start = time.perf_counter()
+    for fname, hhmmss in photos:
+        print(fname)
+        distance, pixels, heights = process_photo(
+            fname, hhmmss, date_to_use, pitch, camera_height, imgroot, plot,
+            timings, save_boxes)
+        distance_csv.append(distance)
+        if heights is not None:
+            pixels_csv.append(pixels)
+            heights_out.append(heights)
+        watermark.save(hhmmss, {'distance': distance_csv.rows,
+                                'pixels': pixels_csv.rows,
+                                'heights': heights_out.rows})
+        processed += 1
+    elapsed = time.perf_counter() - start
+    print(f'{processed} photos processed in {elapsed:.1f} s '
+          f'({GOES_CACHE.files_opened} satellite files opened), '
+          f'{distance_csv.rows} photos, {heights_out.rows} with cloud, '
+          'so far today')
+
+    if heights_out.rows:
+        df2 = pd.read_csv(heights_out.path, index_col=0, parse_dates=['Time'])
+    else:
+        df2 = cloud_heights(pd.DataFrame(
+            columns=['Date_Time', 'Distance', 'CB1', 'CB2', 'CT1', 'CT2',
+                     'CX1', 'CX2', 'W1', 'W2']), pitch, camera_height)
+    if plot:
+        plot_start = time.perf_counter()
+        plot_heights(df2, camera, date_to_use, outroot)
+        add_time(timings, 'heights', plot_start)
+    if parquet:
+        results_store.write_day(camera, date_to_use, outroot)
+    return df2
+
+
+def main():
+    """
+    Main function to be run from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Find the distances, cloud boxes and cloud top heights '
+        'for a day photo by photo')
+    parser.add_argument('camera', type=int)
+    parser.add_argument('date_to_use')
+    parser.add_argument('--no-plot', action='store_true',
+                        help='only write the csv files')
+    parser.add_argument('--no-boxes', action='store_true',
+                        help="don't save the photos with the boxes drawn on")
+    parser.add_argument('--incremental', action='store_true',
+                        help='only process photos taken since the last run')
+    parser.add_argument('--parquet', action='store_true',
+                        help='also write the Parquet tables (needs pyarrow)')
+    args = parser.parse_args()
+    if args.parquet and not results_store.parquet_available():
+        parser.error('pyarrow is needed for --parquet')
+    run_pipeline(args.camera, args.date_to_use, plot=not args.no_plot,
+                 incremental=args.incremental, parquet=args.parquet,
+                 save_boxes=not args.no_boxes)
+
+
+if __name__ == "__main__":
+    main()
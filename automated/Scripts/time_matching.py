@@ -0,0 +1,105 @@
+"""
+python module time_matching.py
+
+python: 3.8 Jasmin NERC servers
+project: DCMEX
+
+Description
+
+Helpers for matching photo times to satellite scan times.
+
+parse_pixel_times turns the 'HHMMSS' Times column written by
+cloudtop_pixel_heights.py into timestamps in one vectorised call and
+nearest_time_join matches every row of one table to the row of another table
+closest in time with a sorted as-of merge, so the cost grows as
+O((n+m) log m) rather than comparing every pair of rows.
+nearest_time_index does the same for plain arrays of times with
+np.searchsorted, e.g. to pair up image files by the times in their names.
+
+"""
+# import modules
+import numpy as np
+import pandas as pd
+
+
+def parse_pixel_times(date_to_use, times):
+    """
+    Convert the 'HHMMSS' times of a day to timestamps.
+
+    Parameters:
+    - date_to_use (str): Date string 'yyyy-mm-dd'.
+    - times (pd.Series): 'HHMMSS' times, as strings or as integers that have
+      lost their leading zeros when read back from csv.
+
+    Returns:
+    - pd.Series: Timestamps with the same index as times.
+    """
+    hhmmss = times.astype(str).str.zfill(6)
+    return pd.to_datetime(date_to_use + 'T' + hhmmss,
+                          format='%Y-%m-%dT%H%M%S')
+
+
+def nearest_time_join(left, right, columns, on='Date_Time', tolerance=None):
+    """
+    Add the columns of the row of right closest in time to each row of left.
+
+    Parameters:
+    - left (pd.DataFrame): Table to add the columns to.
+    - right (pd.DataFrame): Table to take the columns from.
+    - columns (list): Columns of right to add to left.
+    - on (str): Name of the datetime column in both tables.
+    - tolerance (pd.Timedelta or str): Largest allowed time difference, rows
+      of left with no match within the tolerance get NaN (default: no limit).
+
+    Returns:
+    - pd.DataFrame: Copy of left, in the same row order, with the columns
+      added.
+
+    Note:
+    - Neither table needs to be sorted.
+    - If two rows of right are equally close the earlier one is used, and
+      of rows with the same time the first in right.
+    """
+    if tolerance is not None:
+        tolerance = pd.Timedelta(tolerance)
+    # merge_asof needs both keys at the same datetime resolution
+    left_sorted = left.assign(
+        _row=range(len(left)),
+        **{on: left[on].astype('datetime64[ns]')}).sort_values(
+            on, kind='stable')
+    right_sorted = right[[on] + list(columns)].astype(
+        {on: 'datetime64[ns]'}).dropna(subset=[on]).sort_values(
+            on, kind='stable')
+    # merge_asof would use the last of rows with the same time
+    right_sorted = right_sorted.drop_duplicates(on, keep='first')
+    merged = pd.merge_asof(left_sorted, right_sorted, on=on,
+                           direction='nearest', tolerance=tolerance)
+    merged = merged.sort_values('_row').drop(columns='_row')
+    merged.index = left.index
+    return merged
+
+
+def nearest_time_index(times, targets):
+    """
+    Find the closest in time of a sorted array of targets for each time.
+
+    Parameters:
+    - times (array-like): datetime64 times to match.
+    - targets (np.ndarray): Sorted datetime64 times to match them to.
+
+    Returns:
+    - np.ndarray: Index into targets of the closest target to each time (-1
+      if there are no targets).
+
+    Note:
+    - If two targets are equally close the earlier one is used.
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    targets = np.asarray(targets, dtype='datetime64[ns]')
+    if len(targets) < 2:
+        return np.full(len(times), len(targets) - 1)
+    after = np.clip(np.searchsorted(targets, times, side='left'), 1,
+                    len(targets) - 1)
+    before = after - 1
+    use_after = (targets[after] - times) < (times - targets[before])
+    return np.where(use_after, after, before)
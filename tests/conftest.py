@@ -0,0 +1,10 @@
+"""
+Put the StandAloneTools and automated/Scripts modules on the path so the
+tests can import them as the scripts do.
+"""
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in ('StandAloneTools', os.path.join('automated', 'Scripts')):
+    sys.path.insert(0, os.path.join(ROOT, folder))
@@ -0,0 +1,95 @@
+"""
+Tests of the on-disk cache of the boxes found in each photo
+(automated/Scripts/box_cache.py).
+"""
+import os
+import numpy as np
+from box_cache import BoxCache
+
+BOX = (1, 2, 3, 4, 5, 6, 7, 8)
+
+
+def make_photos(tmp_path, n):
+    photos = []
+    for i in range(n):
+        photo = tmp_path / f'photo_{i}.jpg'
+        photo.write_bytes(b'x' * (i + 1))
+        photos.append(str(photo))
+    return photos
+
+
+def test_round_trip(tmp_path):
+    photo, = make_photos(tmp_path, 1)
+    cache_file = str(tmp_path / 'cache' / 'boxes.npz')
+    cache = BoxCache(cache_file, 1)
+    assert cache.get(photo, 115, 3800) is None
+    cache.put(photo, 115, 3800, BOX)
+    cache.save()
+    cache = BoxCache(cache_file, 1)
+    assert cache.get(photo, 115, 3800) == BOX
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_settings_in_key(tmp_path):
+    photo, = make_photos(tmp_path, 1)
+    cache = BoxCache(str(tmp_path / 'boxes.npz'), 1)
+    cache.put(photo, 115, 3800, BOX, scale=4, n_boxes=3)
+    assert cache.get(photo, 115, 3800, scale=4, n_boxes=3) == BOX
+    assert cache.get(photo, 116, 3800, scale=4, n_boxes=3) is None
+    assert cache.get(photo, 115, 3700, scale=4, n_boxes=3) is None
+    assert cache.get(photo, 115, 3800, scale=1, n_boxes=3) is None
+    assert cache.get(photo, 115, 3800, scale=4, n_boxes=2) is None
+
+
+def test_changed_photo_misses(tmp_path):
+    photo, = make_photos(tmp_path, 1)
+    cache = BoxCache(str(tmp_path / 'boxes.npz'), 1)
+    cache.put(photo, 115, 3800, BOX)
+    stat = os.stat(photo)
+    os.utime(photo, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get(photo, 115, 3800) is None
+    # The new entry replaces the one for the old photo
+    cache.put(photo, 115, 3800, BOX[::-1])
+    assert len(cache) == 1
+    assert cache.get(photo, 115, 3800) == BOX[::-1]
+
+
+def test_other_versions_dropped(tmp_path):
+    photo, = make_photos(tmp_path, 1)
+    cache_file = str(tmp_path / 'boxes.npz')
+    cache = BoxCache(cache_file, 1)
+    cache.put(photo, 115, 3800, BOX)
+    cache.save()
+    assert len(BoxCache(cache_file, 2)) == 0
+    assert len(BoxCache(cache_file, 1)) == 1
+
+
+def test_file_without_n_boxes_ignored(tmp_path):
+    photo, = make_photos(tmp_path, 1)
+    cache_file = str(tmp_path / 'boxes.npz')
+    cache = BoxCache(cache_file, 1)
+    cache.put(photo, 115, 3800, BOX)
+    cache.save()
+    with np.load(cache_file) as columns:
+        old = {name: columns[name] for name in columns.files
+               if name != 'n_boxes'}
+    np.savez(cache_file, **old)
+    assert len(BoxCache(cache_file, 1)) == 0
+
+
+def test_least_recently_used_evicted(tmp_path):
+    photos = make_photos(tmp_path, 4)
+    cache_file = str(tmp_path / 'boxes.npz')
+    cache = BoxCache(cache_file, 1, max_entries=2)
+    for photo in photos:
+        cache.put(photo, 115, 3800, BOX)
+    # Last used in the order 1, 2, 3 then 0
+    for last_used, photo in enumerate(photos[1:] + photos[:1]):
+        cache._last_used[cache.key(photo, 115, 3800)] = last_used
+    cache.save()
+    assert cache.evictions == 2
+    cache = BoxCache(cache_file, 1, max_entries=2)
+    assert cache.get(photos[0], 115, 3800) == BOX
+    assert cache.get(photos[3], 115, 3800) == BOX
+    assert cache.get(photos[1], 115, 3800) is None
+    assert cache.get(photos[2], 115, 3800) is None
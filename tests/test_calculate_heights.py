@@ -0,0 +1,89 @@
+"""
+Tests of the cloud top heights table (automated/Scripts/calculate_heights.py)
+against the per row loop it replaced, including the csv columns.
+"""
+import numpy as np
+import pandas as pd
+from calculate_heights import (FOV, cloud_heights, find_height,
+                               focal_length_mm, pitch_correct,
+                               sensor_height_mm)
+
+# Columns of the heights csv written by the original script
+CSV_COLUMNS = ['Time', 'distance_to_cloud', 'CT1', 'CT2', 'CB1', 'CB2',
+               'CTP1', 'CTP2', 'CBP1', 'CTBP2', 'W1', 'W2', 'X1', 'X2',
+               'MAXCTH', 'CBP2']
+
+
+def row_loop(df_filtered, pitch, camera_height):
+    """
+    The heights table as the original script built it, one row at a time.
+    """
+    df2 = pd.DataFrame(index=range(len(df_filtered)), columns=CSV_COLUMNS[:-1])
+    for row in df_filtered.itertuples():
+        CT2 = row.CT1
+        CT1 = row.CT2
+        CB1 = row.CB1
+        CB2 = row.CB2
+        hb1 = find_height(4160-CT1, row.Distance,
+                          focal_length_mm, sensor_height_mm)
+        ht1 = find_height(4160-CB1, row.Distance,
+                          focal_length_mm, sensor_height_mm)
+        CTH1 = round(pitch_correct(pitch, FOV, ht1) + camera_height, 2)
+        CBH1 = round(pitch_correct(pitch, FOV, hb1) + camera_height, 2)
+        hb2 = find_height(4160-CT2, row.Distance,
+                          focal_length_mm, sensor_height_mm)
+        ht2 = find_height(4160-CB2, row.Distance,
+                          focal_length_mm, sensor_height_mm)
+        CTH2 = round(pitch_correct(pitch, FOV, ht2) + camera_height, 2)
+        CBH2 = round(pitch_correct(pitch, FOV, hb2) + camera_height, 2)
+        df2.at[row.Index, 'Time'] = row.Date_Time
+        df2.at[row.Index, 'distance_to_cloud'] = row.Distance
+        df2.at[row.Index, 'CT1'] = CTH2
+        df2.at[row.Index, 'CB1'] = CBH1
+        df2.at[row.Index, 'CTP1'] = CB2
+        df2.at[row.Index, 'CBP1'] = CT1
+        df2.at[row.Index, 'X1'] = row.CX1
+        df2.at[row.Index, 'W1'] = row.W1
+        df2.at[row.Index, 'CT2'] = CTH1
+        df2.at[row.Index, 'CB2'] = CBH2
+        df2.at[row.Index, 'CTP2'] = CB1
+        df2.at[row.Index, 'CBP2'] = CT2
+        df2.at[row.Index, 'X2'] = row.CX2
+        df2.at[row.Index, 'W2'] = row.W2
+        df2.at[row.Index, 'MAXCTH'] = np.nanmax([CTH1, CTH2])
+    return df2
+
+
+def make_pixels(seed=0, n=50):
+    """
+    Cloud pixels matched to distances between 10 and 30 km.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.integers(0, 3800, (n, 4)), axis=1)
+    return pd.DataFrame({
+        'Date_Time': pd.date_range('2022-07-27 12:00', periods=n,
+                                   freq='37s'),
+        'Distance': rng.uniform(10, 30, n).round(2),
+        'CT1': rows[:, 0], 'CT2': rows[:, 1],
+        'CB1': rows[:, 2], 'CB2': rows[:, 3],
+        'CX1': rng.integers(0, 6000, n), 'CX2': rng.integers(0, 6000, n),
+        'W1': rng.integers(1, 3000, n), 'W2': rng.integers(1, 3000, n)})
+
+
+def test_matches_row_loop_csv(tmp_path):
+    df_filtered = make_pixels()
+    new = cloud_heights(df_filtered, 14.5, 1.62)
+    old = row_loop(df_filtered, 14.5, 1.62)
+    assert list(new.columns) == list(old.columns) == CSV_COLUMNS
+    new.to_csv(tmp_path / 'new.csv')
+    old.to_csv(tmp_path / 'old.csv')
+    # The loop left CBP2 as floats (1234.0), the same rows either way
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'new.csv'),
+                                  pd.read_csv(tmp_path / 'old.csv'),
+                                  check_dtype=False)
+
+
+def test_no_rows():
+    df_filtered = make_pixels().iloc[:0]
+    assert list(cloud_heights(df_filtered, 14.5, 1.62).columns) == \
+        CSV_COLUMNS
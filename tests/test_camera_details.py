@@ -0,0 +1,83 @@
+"""
+Tests of the camera details registry (StandAloneTools/camera_details.py)
+against filtering camera_details.csv and taking the first row.
+"""
+import pandas as pd
+import pytest
+from camera_details import CameraRegistry
+
+CSV = """Date,camera,yaw,pitch,camlat,camlon,height
+18-07-2022,1,260,12,34.1225,-106.535183,1441.1
+18-07-2022,2,350,12,34.12203,-106.535225,1460
+27-07-2022,2,10,14,34.12203,-106.535225,1460
+27-07-2022,2,99,99,0,0,0
+30-07-2022,2,40,20,34.2,-106.6,1500
+"""
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / 'camera_details.csv'
+    path.write_text(CSV)
+    return str(path)
+
+
+def filtered_first(csv_file, camera, date_fnames):
+    """
+    The details the scripts used to get by filtering the csv file.
+    """
+    cam_df = pd.read_csv(csv_file)
+    filtered_df = cam_df[(cam_df['Date'] == date_fnames)
+                         & (cam_df['camera'] == camera)]
+    return (filtered_df.yaw.values[0], filtered_df.pitch.values[0],
+            filtered_df.camlat.values[0], filtered_df.camlon.values[0],
+            filtered_df.height.values[0])
+
+
+@pytest.mark.parametrize('camera, date_to_use, date_fnames', [
+    (1, '2022-07-18', '18-07-2022'),
+    (2, '2022-07-18', '18-07-2022'),
+    # Duplicated day and camera, the first row is used
+    (2, '2022-07-27', '27-07-2022'),
+    (2, '2022-07-30', '30-07-2022'),
+])
+def test_exact_matches_filtered_csv(csv_file, camera, date_to_use,
+                                    date_fnames):
+    details = CameraRegistry(csv_file).get(camera, date_to_use)
+    assert tuple(details) == filtered_first(csv_file, camera, date_fnames)
+
+
+def test_exact_missing_day(csv_file):
+    with pytest.raises(KeyError):
+        CameraRegistry(csv_file).get(2, '2022-07-28')
+
+
+def test_previous_and_nearest(csv_file):
+    registry = CameraRegistry(csv_file)
+    assert registry.get(2, '2022-07-29', 'previous').yaw == 10
+    assert registry.get(2, '2022-07-29', 'nearest').yaw == 40
+    assert registry.get(2, '2022-07-24', 'nearest').yaw == 10
+    # Ties go to the earlier row
+    assert registry.get(2, '2022-07-28 12:00', 'nearest').yaw == 10
+    assert registry.get(2, '2022-08-05', 'previous').yaw == 40
+    with pytest.raises(KeyError):
+        registry.get(2, '2022-07-01', 'previous')
+    with pytest.raises(KeyError):
+        registry.get(2, '2022-08-05', 'nearest', max_days=2)
+
+
+def test_interpolate(csv_file):
+    registry = CameraRegistry(csv_file)
+    details = registry.get(2, '2022-07-28', 'interpolate')
+    assert details.pitch == pytest.approx(14 + 6 / 3)
+    assert details.yaw == pytest.approx(20)
+    # Yaw goes the shortest way round through north
+    assert registry.get(2, '2022-07-20', 'interpolate').yaw == \
+        pytest.approx((350 + 20 * 2 / 9) % 360)
+    # Outside the dates in the file the nearest row is used
+    assert registry.get(2, '2022-08-05', 'interpolate').yaw == 40
+
+
+def test_bad_fallback(csv_file):
+    with pytest.raises(ValueError):
+        CameraRegistry(csv_file).get(2, '2022-07-27', 'closest')
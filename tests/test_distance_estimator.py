@@ -0,0 +1,51 @@
+"""
+Tests of the compute-only path of CloudOpticalDepthProcessor
+(StandAloneTools/Distance_Estimator.py), which must not import pyplot.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a new interpreter so no other test has imported pyplot already
+SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path[:0] = [{tools!r}]
+    import numpy as np
+    import xarray as xr
+    from Distance_Estimator import CloudOpticalDepthProcessor
+
+    class Processor(CloudOpticalDepthProcessor):
+        def load_camera_details(self):
+            return 0.0, 34.0, -107.2
+
+    processor = Processor('DCMEX-stereo-2-2022-07-27-120000.jpg')
+    lats = np.linspace(33.75, 34.25, 41)
+    lons = np.linspace(-107.5, -106.8, 57)
+    values = np.full((41, 57), np.nan)
+    data = xr.DataArray(values, dims=('lat', 'lon'),
+                        coords={{'lat': lats, 'lon': lons}})
+    print('status', processor.find_cloud(data)[3])
+    # Thin cloud only is not counted
+    data.values[:] = processor.optical_depth_threshold / 2
+    print('status', processor.find_cloud(data)[3])
+    # Thick cloud north of the camera, in the FOV
+    data.values[36, 20] = 40.0
+    distance, maxlat, maxlon, status = processor.find_cloud(data)
+    print('status', status, maxlat, maxlon, round(distance, 1))
+    print('pyplot', 'matplotlib.pyplot' in sys.modules)
+""")
+
+
+def test_find_cloud_without_pyplot():
+    tools = os.path.join(TESTS, '..', 'StandAloneTools')
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(tools=tools)],
+        capture_output=True, text=True, check=True)
+    lines = [line for line in result.stdout.splitlines()
+             if line.startswith(('status', 'pyplot'))]
+    # 0.2 degrees north and 0.05 west of the camera is about 22.7 km
+    assert lines == ['status no cloud in area', 'status no cloud in FOV',
+                     'status cloud 36 20 22.7', 'pyplot False']
@@ -0,0 +1,73 @@
+"""
+Tests of the cached flag 16 interpolation (StandAloneTools/flag16_interp.py)
+against scipy griddata as CloudOpticalDepthProcessor.interp_flag16 used it.
+"""
+import numpy as np
+from scipy.interpolate import griddata
+from flag16_interp import Flag16Interpolator
+
+
+def griddata_fill(values, lons, lats, mask):
+    """
+    Fill the flagged pixels as the original interp_flag16 did.
+    """
+    lon, lat = np.meshgrid(lons, lats)
+    points = np.array([lon[~mask], lat[~mask]]).T
+    points_interp = np.array([lon[mask], lat[mask]]).T
+    filled = np.array(values, dtype=float)
+    filled[mask] = griddata(points, values[~mask], points_interp,
+                            method='linear')
+    return filled
+
+
+def make_grid(seed=0, n_lat=20, n_lon=30):
+    """
+    Optical depths on an uneven lon/lat grid with some NaNs, and flag
+    patterns that include the grid edges (outside the hull of the rest).
+    """
+    rng = np.random.default_rng(seed)
+    lons = np.sort(rng.uniform(-107.5, -106.0, n_lon))
+    lats = np.sort(rng.uniform(33.5, 34.5, n_lat))
+    values = rng.uniform(0, 50, (n_lat, n_lon))
+    values[rng.random(values.shape) < 0.05] = np.nan
+    masks = [rng.random((n_lat, n_lon)) < fraction
+             for fraction in (0.05, 0.2, 0.4)]
+    masks[1][0, :] = True
+    masks[2][:, -1] = True
+    return values, lons, lats, masks
+
+
+def test_matches_griddata():
+    interp = Flag16Interpolator()
+    for seed in range(3):
+        values, lons, lats, masks = make_grid(seed)
+        for mask in masks:
+            np.testing.assert_allclose(
+                interp.fill(values, lons, lats, mask),
+                griddata_fill(values, lons, lats, mask),
+                rtol=1e-10, atol=1e-10, equal_nan=True)
+
+
+def test_weights_reused_per_pattern():
+    values, lons, lats, masks = make_grid()
+    interp = Flag16Interpolator(maxsize=2)
+    for mask in masks[:2] * 2:
+        interp.fill(values, lons, lats, mask)
+    assert (interp.hits, interp.misses) == (2, 2)
+    # The third pattern evicts the least recently used first one
+    interp.fill(values, lons, lats, masks[2])
+    interp.fill(values, lons, lats, masks[0])
+    assert (interp.hits, interp.misses) == (2, 4)
+    # New values with a cached pattern still give the griddata values
+    np.testing.assert_allclose(
+        interp.fill(values * 2, lons, lats, masks[0]),
+        griddata_fill(values * 2, lons, lats, masks[0]),
+        rtol=1e-10, atol=1e-10, equal_nan=True)
+
+
+def test_nothing_flagged():
+    values, lons, lats, _ = make_grid()
+    interp = Flag16Interpolator()
+    filled = interp.fill(values, lons, lats, np.zeros(values.shape, bool))
+    np.testing.assert_array_equal(filled, values)
+    assert interp.misses == 0
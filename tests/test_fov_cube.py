@@ -0,0 +1,82 @@
+"""
+Tests of the max optical depth in the FOV for every time step at once
+(StandAloneTools/fov_cube.py) against one time step at a time.
+"""
+import haversine as hs
+import numpy as np
+import pytest
+import xarray as xr
+from fov_cube import fov_max_cube
+from fov_masks import max_in_indices
+
+CAMLAT = 34.12
+CAMLON = -106.53
+
+
+def make_cube(seed=0, n_t=30, shape=(12, 15)):
+    """
+    Random optical depths with whole NaN and low valued time steps, and
+    repeated values so the max is tied.
+    """
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 12, (n_t,) + shape).astype(float)
+    values[rng.random(values.shape) < 0.3] = np.nan
+    # No cloud in the area
+    values[3] = np.nan
+    # Only thin cloud
+    values[5] = 1.0
+    return xr.DataArray(values, dims=('t', 'lat', 'lon'),
+                        coords={'lat': np.linspace(33.75, 34.25, shape[0]),
+                                'lon': np.linspace(-107.5, -106.8, shape[1])})
+
+
+def step_max(field, indices, threshold):
+    """
+    The max in the FOV of one time step, as find_cloud did it.
+    """
+    values = field.values
+    if np.all(np.isnan(values)):
+        return 'no cloud in area', None
+    if threshold is not None:
+        values = np.where(values >= threshold, values, np.nan)
+    try:
+        maxlat, maxlon = max_in_indices(values, indices)
+    except ValueError:
+        return 'no cloud in FOV', None
+    D = hs.haversine((field.lat.values[maxlat], field.lon.values[maxlon]),
+                     (CAMLAT, CAMLON))
+    return 'cloud', (maxlat, maxlon, values[maxlat, maxlon], D)
+
+
+@pytest.mark.parametrize('threshold', [None, 3.6])
+@pytest.mark.parametrize('chunked', [False, True])
+def test_matches_each_step(threshold, chunked):
+    cube = make_cube()
+    indices = np.sort(np.random.default_rng(1).choice(
+        cube[0].size, 40, replace=False))
+    data = cube.chunk({'t': 7}) if chunked else cube
+    found = fov_max_cube(data, indices, CAMLAT, CAMLON, threshold, t_chunk=7)
+    for i in range(cube.sizes['t']):
+        status, expected = step_max(cube[i], indices, threshold)
+        assert found.status[i] == status
+        if expected is None:
+            assert found.maxlat[i] == -1 and np.isnan(found.value[i])
+            continue
+        maxlat, maxlon, value, D = expected
+        assert (found.maxlat[i], found.maxlon[i]) == (maxlat, maxlon)
+        assert found.value[i] == value
+        assert found.distance[i] == pytest.approx(D)
+
+
+def test_threshold_drops_thin_cloud():
+    cube = make_cube()
+    indices = np.arange(cube[0].size)
+    assert fov_max_cube(cube, indices, CAMLAT, CAMLON, None).status[5] == \
+        'cloud'
+    assert fov_max_cube(cube, indices, CAMLAT, CAMLON).status[5] == \
+        'no cloud in FOV'
+
+
+def test_no_fov_cells():
+    found = fov_max_cube(make_cube(), np.array([], dtype=int), CAMLAT, CAMLON)
+    assert set(found.status) == {'no cloud in area', 'no cloud in FOV'}
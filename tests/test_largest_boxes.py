@@ -0,0 +1,77 @@
+"""
+Tests of the largest box selection in automated/Scripts/cloudtop_pixel_heights.py
+against the loops over the contours sorted by area it replaced.
+"""
+import cv2
+import numpy as np
+from cloudtop_pixel_heights import bounding_rects, largest_boxes
+
+
+def sorted_selection(contours):
+    """
+    The two boxes chosen by the original find_contours, largest first, or
+    None if there weren't two different box areas.
+    """
+    sorted_contours = sorted(contours, key=cv2.contourArea, reverse=True)
+    max_max = 0
+    first = None
+    for contour in sorted_contours:
+        (x, y, w, h) = cv2.boundingRect(contour)
+        if w * h >= max_max:
+            first = (x, y, w, h)
+            max_max = w * h
+    max_c = 0
+    second = None
+    for contour in sorted_contours:
+        (x, y, w, h) = cv2.boundingRect(contour)
+        if w * h >= max_c and w * h < max_max:
+            second = (x, y, w, h)
+            max_c = w * h
+    if second is None:
+        return None
+    return [first, second]
+
+
+def make_contours(seed, n=80, size=12):
+    """
+    Random small polygons, so many have the same box area, and copies of
+    some of them in a different point order (same box and contour area).
+    """
+    rng = np.random.default_rng(seed)
+    contours = []
+    for _ in range(n):
+        points = rng.integers(0, size, (rng.integers(3, 7), 1, 2))
+        contours.append(points.astype(np.int32))
+    for i in rng.choice(n, n // 4, replace=False):
+        contours.append(np.roll(contours[i], 1, axis=0))
+    return tuple(contours)
+
+
+def test_matches_sorted_selection():
+    for seed in range(50):
+        contours = make_contours(seed)
+        expected = sorted_selection(contours)
+        boxes = largest_boxes(contours, 2)
+        assert [tuple(int(v) for v in box) for box in boxes] == expected
+
+
+def test_tie_chooses_smallest_contour_then_last():
+    # Same 10x10 box, the triangle has the smallest contour area
+    square = np.array([[[0, 0]], [[9, 0]], [[9, 9]], [[0, 9]]], np.int32)
+    triangle = np.array([[[20, 0]], [[29, 0]], [[20, 9]]], np.int32)
+    small = np.array([[[40, 0]], [[41, 0]], [[41, 1]]], np.int32)
+    contours = (square, triangle, small, triangle + [20, 0])
+    boxes, index = largest_boxes(contours, 2, return_index=True)
+    assert index.tolist() == [3, 2]
+    assert [tuple(int(v) for v in box) for box in boxes] == \
+        sorted_selection(contours)
+
+
+def test_fewer_sizes_than_boxes():
+    square = np.array([[[0, 0]], [[9, 0]], [[9, 9]], [[0, 9]]], np.int32)
+    contours = (square, square + 20)
+    assert sorted_selection(contours) is None
+    assert largest_boxes(contours, 2).tolist() == [[20, 20, 10, 10]]
+    assert len(largest_boxes((), 2)) == 0
+    assert bounding_rects(contours).tolist() == [[0, 0, 10, 10],
+                                                 [20, 20, 10, 10]]
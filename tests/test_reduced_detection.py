@@ -0,0 +1,51 @@
+"""
+Tests of the cloud boxes found in reduced photos (DETECT_SCALE 4 or 8 in
+automated/Scripts/cloudtop_pixel_heights.py) against full size detection.
+"""
+import cv2
+import numpy as np
+import pytest
+from cloudtop_pixel_heights import FrameProcessor
+
+NOSKY = 1100
+
+
+def make_photo(path, seed=0):
+    """
+    JPEG of a grey-blue sky with two white clouds of lumpy outline at
+    positions that are not multiples of 8 pixels, and ground below NOSKY.
+    """
+    rng = np.random.default_rng(seed)
+    img = np.empty((1200, 1600, 3), dtype=np.uint8)
+    img[:] = (150, 110, 90)
+    for centre, axes in (((523, 413), (301, 157)), ((1187, 701), (173, 93))):
+        # Overlapping blobs round an ellipse
+        for _ in range(40):
+            offset = rng.uniform(-0.6, 0.6, 2) * axes
+            size = (rng.uniform(0.3, 0.5, 2) * axes).astype(int)
+            cv2.ellipse(img, (int(centre[0] + offset[0]),
+                              int(centre[1] + offset[1])),
+                        (int(size[0]), int(size[1])), 0, 0, 360,
+                        (245, 245, 245), -1)
+    img[NOSKY:] = (200, 200, 200)
+    img = cv2.GaussianBlur(img, (7, 7), 0)
+    cv2.imwrite(str(path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return str(path)
+
+
+@pytest.mark.parametrize('scale', [4, 8])
+def test_rows_match_full_size(tmp_path, scale):
+    for seed in range(3):
+        fname = make_photo(tmp_path / f'photo_{seed}.jpg', seed)
+        _, full = FrameProcessor(NOSKY=NOSKY, scale=1).find_boxes(fname)
+        img, reduced = FrameProcessor(NOSKY=NOSKY, scale=scale).find_boxes(
+            fname, full_image=False)
+        assert img is None
+        assert len(full) == len(reduced) == 2
+        for (x, y, w, h), (x_r, y_r, w_r, h_r) in zip(full, reduced):
+            # Top and bottom rows within 2 pixels of full size detection
+            assert abs(y_r - y) <= 2
+            assert abs((y_r + h_r) - (y + h)) <= 2
+            # Sides only as good as the reduced photo
+            assert abs(x_r - x) <= 2 * scale
+            assert abs((x_r + w_r) - (x + w)) <= 2 * scale
@@ -0,0 +1,91 @@
+"""
+Tests of the photo selection in automated/Scripts/cloudtop_pixel_heights.py
+against the loop over np.argmin of the time differences it replaced.
+"""
+import datetime
+import numpy as np
+import pandas as pd
+from cloudtop_pixel_heights import select_cloudy_images
+
+
+def argmin_selection(datetime_objects, cloud_distances):
+    """
+    The photos kept by the original script, one photo at a time.
+    """
+    times = cloud_distances.Date_Time.values
+    keep = []
+    for i, dt in enumerate(datetime_objects):
+        check = cloud_distances.Distance.iloc[
+            np.argmin(np.abs(np.datetime64(dt) - times))]
+        if check == 'none' or check == 'no cloud':
+            continue
+        check = float(check)
+        if check > 30 or check < 10:
+            continue
+        keep.append(i)
+    return keep
+
+
+def make_distances(seed=0, n=60):
+    """
+    Cloud distances every 5 minutes read as strings as from the csv, with
+    'none', 'no cloud' and the 10 and 30 km limits among them.
+    """
+    rng = np.random.default_rng(seed)
+    distances = rng.uniform(0, 40, n).round(1).astype(str).astype(object)
+    distances[rng.random(n) < 0.2] = 'none'
+    distances[rng.random(n) < 0.2] = 'no cloud'
+    distances[:4] = ['10.0', '30.0', '9.9', '30.1']
+    start = pd.Timestamp('2022-07-27 12:00:00')
+    return pd.DataFrame({
+        'Date_Time': start + pd.to_timedelta(np.arange(n) * 5, 'min'),
+        'Distance': distances})
+
+
+def make_photos(cloud_distances, seed=0, n=300):
+    """
+    Photo times at random seconds over the day's distances, before the first
+    and after the last, and exactly half way between two distances.
+    """
+    rng = np.random.default_rng(seed)
+    start = cloud_distances.Date_Time.iloc[0].to_pydatetime()
+    seconds = rng.integers(-600, 60 * 5 * len(cloud_distances) + 600, n)
+    photos = [start + datetime.timedelta(seconds=int(s)) for s in seconds]
+    # Ties between two distances
+    photos += [start + datetime.timedelta(seconds=150 + 300 * i)
+               for i in range(len(cloud_distances) - 1)]
+    return photos
+
+
+def test_matches_argmin_loop():
+    for seed in range(5):
+        cloud_distances = make_distances(seed)
+        photos = make_photos(cloud_distances, seed)
+        assert (select_cloudy_images(photos, cloud_distances)
+                == argmin_selection(photos, cloud_distances))
+
+
+def test_tie_uses_earlier_time():
+    cloud_distances = pd.DataFrame({
+        'Date_Time': pd.to_datetime(['2022-07-27 12:00', '2022-07-27 12:10']),
+        'Distance': ['20.0', 'no cloud']})
+    half_way = [datetime.datetime(2022, 7, 27, 12, 5)]
+    assert select_cloudy_images(half_way, cloud_distances) == [0]
+    cloud_distances['Distance'] = ['no cloud', '20.0']
+    assert select_cloudy_images(half_way, cloud_distances) == []
+
+
+def test_limits_and_no_cloud():
+    times = pd.date_range('2022-07-27 12:00', periods=6, freq='10min')
+    cloud_distances = pd.DataFrame({
+        'Date_Time': times,
+        'Distance': ['10', '30', '9.99', '30.01', 'none', 'no cloud']})
+    photos = list(times.to_pydatetime())
+    assert select_cloudy_images(photos, cloud_distances) == [0, 1]
+
+
+def test_nothing_to_match():
+    cloud_distances = make_distances()
+    assert select_cloudy_images([], cloud_distances) == []
+    assert select_cloudy_images(make_photos(cloud_distances),
+                                cloud_distances.iloc[:0]) == []
@@ -0,0 +1,135 @@
+"""
+Tests of the nearest time matching in automated/Scripts/time_matching.py
+against the loops over every pair of times it replaced.
+"""
+import numpy as np
+import pandas as pd
+from time_matching import (nearest_time_index, nearest_time_join,
+                           parse_pixel_times)
+
+
+def closest_loop(timestamp1, timestamps2):
+    """
+    Index of the closest of timestamps2 as the original scripts found it (the
+    first one of any equally close).
+    """
+    closest = None
+    closest_time_difference = float('inf')
+    for index2, timestamp2 in enumerate(timestamps2):
+        time_difference = abs((timestamp1 - timestamp2).total_seconds())
+        if time_difference < closest_time_difference:
+            closest_time_difference = time_difference
+            closest = index2
+    return closest
+
+
+def make_times(seed=0, n_photos=200, n_scans=40):
+    """
+    Photo times at random seconds and scan times every 5 minutes, with
+    photos before the first scan, after the last and half way between two.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2022-07-27 12:00:00')
+    scans = start + pd.to_timedelta(np.arange(n_scans) * 300, 's')
+    seconds = rng.integers(-600, 300 * n_scans + 600, n_photos)
+    seconds = np.concatenate([seconds, 150 + 300 * np.arange(n_scans - 1)])
+    rng.shuffle(seconds)
+    photos = start + pd.to_timedelta(seconds, 's')
+    return pd.Series(photos), pd.Series(scans)
+
+
+def test_join_matches_loop():
+    for seed in range(3):
+        photos, scans = make_times(seed)
+        right = pd.DataFrame({'Date_Time': scans,
+                              'Distance': np.arange(len(scans)) * 1.5})
+        # Scans in a shuffled order, the join sorts them
+        right = right.sample(frac=1, random_state=seed)
+        left = pd.DataFrame({'Date_Time': photos.to_numpy(),
+                             'Times': np.arange(len(photos))},
+                            index=np.arange(len(photos))[::-1])
+        joined = nearest_time_join(left, right, ['Distance'])
+        assert joined.index.tolist() == left.index.tolist()
+        assert joined.Times.tolist() == left.Times.tolist()
+        ordered = right.sort_values('Date_Time')
+        expected = [ordered.Distance.iloc[closest_loop(t, ordered.Date_Time)]
+                    for t in left.Date_Time]
+        assert joined.Distance.tolist() == expected
+
+
+def test_join_repeated_scan_times_use_first_row():
+    for seed in range(3):
+        photos, scans = make_times(seed)
+        # Every scan time twice with different distances, in file order
+        # (not sorted) as the loop went through them
+        right = pd.DataFrame({'Date_Time': pd.concat([scans, scans]),
+                              'Distance': np.arange(2 * len(scans)) * 1.5})
+        right = right.sample(frac=1, random_state=seed)
+        # Photos not half way between two scans, where the loop used the
+        # first in file order rather than the earlier scan
+        photos = photos[(photos - scans[0]).dt.total_seconds() % 300 != 150]
+        left = pd.DataFrame({'Date_Time': photos.to_numpy()})
+        joined = nearest_time_join(left, right, ['Distance'])
+        expected = [right.Distance.iloc[closest_loop(t, right.Date_Time)]
+                    for t in left.Date_Time]
+        assert joined.Distance.tolist() == expected
+
+
+def test_join_same_time_uses_first_row():
+    right = pd.DataFrame({
+        'Date_Time': pd.to_datetime(['2022-07-27 10:00'] * 2),
+        'Distance': [1.0, 2.0]})
+    left = pd.DataFrame({'Date_Time': pd.to_datetime(['2022-07-27 10:00'])})
+    assert nearest_time_join(left, right, ['Distance']).Distance.tolist() == \
+        [1.0]
+
+
+def test_join_tie_uses_earlier_scan():
+    right = pd.DataFrame({
+        'Date_Time': pd.to_datetime(['2022-07-27 12:10', '2022-07-27 12:00']),
+        'Distance': [2.0, 1.0]})
+    left = pd.DataFrame({'Date_Time': pd.to_datetime(['2022-07-27 12:05'])})
+    assert nearest_time_join(left, right, ['Distance']).Distance.tolist() == \
+        [1.0]
+
+
+def test_join_tolerance():
+    right = pd.DataFrame({'Date_Time': pd.to_datetime(['2022-07-27 12:00']),
+                          'Distance': [1.0]})
+    left = pd.DataFrame({'Date_Time': pd.to_datetime(['2022-07-27 12:04',
+                                                      '2022-07-27 12:06'])})
+    joined = nearest_time_join(left, right, ['Distance'], tolerance='5min')
+    assert joined.Distance.iloc[0] == 1.0
+    assert np.isnan(joined.Distance.iloc[1])
+
+
+def test_parse_pixel_times():
+    times = pd.Series([93005, '120000', '000001'])
+    assert parse_pixel_times('2022-07-27', times).tolist() == [
+        pd.Timestamp('2022-07-27 09:30:05'),
+        pd.Timestamp('2022-07-27 12:00:00'),
+        pd.Timestamp('2022-07-27 00:00:01')]
+
+
+def test_index_matches_loop():
+    for seed in range(3):
+        photos, scans = make_times(seed)
+        expected = [closest_loop(t, scans) for t in photos]
+        assert nearest_time_index(photos.to_numpy(),
+                                  scans.to_numpy()).tolist() == expected
+
+
+def test_index_tie_uses_earlier_target():
+    targets = np.array(['2022-07-27T12:00', '2022-07-27T12:10'],
+                       dtype='datetime64[s]')
+    times = np.array(['2022-07-27T12:05', '2022-07-27T12:05:01',
+                      '2022-07-27T11:00', '2022-07-27T13:00'],
+                     dtype='datetime64[s]')
+    assert nearest_time_index(times, targets).tolist() == [0, 1, 0, 1]
+
+
+def test_index_few_targets():
+    times = np.array(['2022-07-27T12:05', '2022-07-27T12:06'],
+                     dtype='datetime64[s]')
+    assert nearest_time_index(times, times[:1]).tolist() == [0, 0]
+    assert nearest_time_index(times, times[:0]).tolist() == [-1, -1]